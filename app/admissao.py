@@ -0,0 +1,180 @@
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from starlette.responses import JSONResponse
+from configuracao import configuracoes, logger
+
+# Controle de admissão: cada rota pertence a uma classe de custo com um número
+# máximo de requisições em execução e uma fila de espera limitada. Quem não cabe
+# na fila, ou espera mais que o prazo da classe, recebe 503 com Retry-After na
+# hora. Assim uma rajada de rotas analíticas não esgota o threadpool nem o pool
+# de conexões, e as rotas baratas continuam respondendo.
+
+
+class Sobrecarga(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+class ClasseCusto:
+    def __init__(self, nome: str, limite: int, fila: int, espera_maxima: float):
+        self.nome = nome
+        self.limite = limite
+        self.fila = fila
+        self.espera_maxima = espera_maxima
+        self.em_execucao = 0
+        self.admitidas = 0
+        self.rejeitadas = 0     # fila cheia
+        self.expiradas = 0      # esperaram mais que espera_maxima
+        self.tempo_medio = 0.0  # média móvel do tempo de atendimento, em segundos
+        self._espera = deque()
+
+    def retry_after(self) -> int:
+        """Segundos estimados até a fila atual ser atendida."""
+        estimativa = self.tempo_medio * (len(self._espera) + 1) / self.limite
+        return min(60, max(1, math.ceil(estimativa)))
+
+    async def entrar(self):
+        """
+        Ocupa uma vaga da classe, esperando na fila se preciso.
+
+        Raises:
+            Sobrecarga: fila cheia ou prazo de espera esgotado.
+        """
+        if self.em_execucao < self.limite and not self._espera:
+            self.em_execucao += 1
+            self.admitidas += 1
+            return
+        if len(self._espera) >= self.fila:
+            self.rejeitadas += 1
+            raise Sobrecarga(self.retry_after())
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._espera.append(futuro)
+        try:
+            await asyncio.wait({futuro}, timeout=self.espera_maxima)
+        except BaseException:
+            # Cliente desconectou enquanto esperava: devolve a vaga se já a recebeu
+            if futuro.done() and not futuro.cancelled():
+                self.sair(None)
+            else:
+                self._desistir(futuro)
+            raise
+        if not futuro.done():
+            self._desistir(futuro)
+            self.expiradas += 1
+            raise Sobrecarga(self.retry_after())
+        self.admitidas += 1
+
+    def _desistir(self, futuro):
+        futuro.cancel()
+        try:
+            self._espera.remove(futuro)
+        except ValueError:
+            pass
+
+    def sair(self, duracao):
+        """Libera a vaga, passando-a direto para o primeiro da fila."""
+        if duracao is not None:
+            self.tempo_medio += 0.1 * (duracao - self.tempo_medio)
+        while self._espera:
+            futuro = self._espera.popleft()
+            if not futuro.done():
+                futuro.set_result(None)     # a vaga muda de dono sem passar pelo contador
+                return
+        self.em_execucao -= 1
+
+    def metricas(self) -> dict:
+        return {
+            "limite": self.limite,
+            "fila_maxima": self.fila,
+            "espera_maxima_segundos": self.espera_maxima,
+            "em_execucao": self.em_execucao,
+            "na_fila": len(self._espera),
+            "admitidas": self.admitidas,
+            "rejeitadas": self.rejeitadas,
+            "expiradas": self.expiradas,
+            "tempo_medio_segundos": round(self.tempo_medio, 4),
+        }
+
+
+PESADAS = ClasseCusto(
+    "pesadas",
+    configuracoes.ADMISSAO_PESADAS_LIMITE,
+    configuracoes.ADMISSAO_PESADAS_FILA,
+    configuracoes.ADMISSAO_PESADAS_ESPERA_SEGUNDOS,
+)
+LEVES = ClasseCusto(
+    "leves",
+    configuracoes.ADMISSAO_LEVES_LIMITE,
+    configuracoes.ADMISSAO_LEVES_FILA,
+    configuracoes.ADMISSAO_LEVES_ESPERA_SEGUNDOS,
+)
+CLASSES = (PESADAS, LEVES)
+
+# Rotas que leem séries inteiras ou agregam o acervo de um rio
+ROTAS_PESADAS = re.compile(
+    r"^/(coletas(/rio/.*|/parametro/.*)?"
+    r"|rio/[^/]+/coletas/[^/]+/(grafico|resumo)"
+    r"|rios/[^/]+/painel"
+    r"|analise/.*"
+    r"|mapa/.*"
+    r"|snapshots/.*)$"
+)
+
+# Nunca esperam nem são recusadas. /coletas/stream fica aberta enquanto o cliente
+# estiver conectado e tem limite próprio (TRANSMISSAO_MAXIMO_INSCRITOS). POST /lote
+# não ocupa vaga: cada sub-requisição passa pela admissão como uma requisição comum.
+ROTAS_LIVRES = {
+    "/healthz", "/prontidao", "/metricas/admissao", "/metricas/coalescencia", "/metricas/agrupamento",
+    "/metricas/transmissao", "/metricas/barramento", "/coletas/stream",
+    "/lote",
+}
+
+
+def classificar(metodo: str, caminho: str):
+    """Classe de custo da rota, ou None para as rotas que não passam pelo controle."""
+    if caminho in ROTAS_LIVRES or metodo == "OPTIONS":
+        return None
+    if metodo in ("GET", "HEAD") and ROTAS_PESADAS.match(caminho):
+        return PESADAS
+    if metodo == "POST" and caminho.startswith("/analise/"):
+        return PESADAS      # recálculos de todo o acervo
+    return LEVES
+
+
+def metricas() -> dict:
+    return {classe.nome: classe.metricas() for classe in CLASSES}
+
+
+class ControleAdmissao:
+    """Middleware ASGI que aplica as classes de custo a cada requisição HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        classe = classificar(scope["method"], scope["path"])
+        if classe is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await classe.entrar()
+        except Sobrecarga as e:
+            logger.warning(f"Requisição recusada ({classe.nome}): {scope['method']} {scope['path']}")
+            resposta = JSONResponse(
+                status_code=503,
+                content={"detail": "Servidor ocupado, tente novamente em instantes."},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            return await resposta(scope, receive, send)
+
+        inicio = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            classe.sair(time.monotonic() - inicio)
@@ -0,0 +1,168 @@
+import queue
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+from database import SessionLocal
+from configuracao import configuracoes, logger
+import models
+import repositorio
+
+# Gravação agrupada (group commit) de POST /coletas. Cada requisição entrega sua
+# coleta a uma thread gravadora e espera; a gravadora junta as coletas que chegam
+# em até AGRUPAMENTO_ESPERA_MS (no máximo AGRUPAMENTO_MAXIMO), valida rios e
+# parametros do lote de uma vez e grava tudo numa única transação. Um commit (e um
+# fsync) atende o lote inteiro.
+#
+# Durabilidade: a requisição só recebe 201 depois do commit do seu lote. Com
+# AGRUPAMENTO_COMMIT_SINCRONO (padrão) o commit espera o WAL no disco, como no
+# caminho sem agrupamento; desligado, o Postgres confirma antes do fsync e uma
+# queda do servidor pode perder as coletas confirmadas nos últimos instantes.
+
+_FIM = object()
+
+
+class AgrupadorColetas:
+    def __init__(self, maximo: int, espera_ms: float, commit_sincrono: bool):
+        self.maximo = maximo
+        self.espera = espera_ms / 1000
+        self.commit_sincrono = commit_sincrono
+        self.lotes = 0
+        self.coletas = 0
+        self.maior_lote = 0
+        self._fila = queue.Queue()
+        self._thread = None
+        self._trava = Lock()
+
+    def enviar(self, coleta) -> Future:
+        """
+        Entrega uma coleta para o próximo lote. O Future resolve com o objeto
+        Coleta gravado (medições carregadas) ou com a exceção que impediu a gravação.
+        Um Future cancelado antes de a gravadora pegar o lote não é gravado.
+        """
+        with self._trava:
+            if self._thread is not None and not self._thread.is_alive():
+                logger.error("Thread gravadora de coletas parou; iniciando outra")
+                self._thread = None
+            if self._thread is None:
+                self._thread = Thread(target=self._executar, name="agrupador-coletas", daemon=True)
+                self._thread.start()
+        futuro = Future()
+        self._fila.put((coleta, futuro))
+        return futuro
+
+    def encerrar(self):
+        """Grava o que já está na fila e para a thread gravadora."""
+        with self._trava:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._fila.put(_FIM)
+            thread.join()
+
+    def metricas(self) -> dict:
+        return {
+            "lotes": self.lotes,
+            "coletas": self.coletas,
+            "media_por_lote": round(self.coletas / self.lotes, 2) if self.lotes else 0,
+            "maior_lote": self.maior_lote,
+            "na_fila": self._fila.qsize(),
+        }
+
+    def _executar(self):
+        while True:
+            item = self._fila.get()
+            if item is _FIM:
+                return
+            lote = [item]
+            prazo = time.monotonic() + self.espera
+            fim = False
+            while len(lote) < self.maximo:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if item is _FIM:
+                    fim = True
+                    break
+                lote.append(item)
+
+            try:
+                self._gravar(lote)
+            except Exception as e:
+                logger.error(f"Erro ao gravar lote de {len(lote)} coletas: {str(e)}")
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+            if fim:
+                return
+
+    def _gravar(self, lote):
+        # Quem desistiu de esperar (timeout na rota) cancelou o Future: fica de fora
+        lote = [(coleta, futuro) for coleta, futuro in lote if futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        self.lotes += 1
+        self.coletas += len(lote)
+        self.maior_lote = max(self.maior_lote, len(lote))
+
+        db = SessionLocal()
+        try:
+            # Referências conferidas para o lote inteiro; só as coletas inválidas são recusadas
+            rios, parametros = repositorio.referencias_invalidas(db, [coleta for coleta, _ in lote])
+            validas = []
+            for coleta, futuro in lote:
+                faltando = {cp.parametro_id for cp in coleta.coletas_parametros} & parametros
+                if coleta.rio_id in rios:
+                    futuro.set_exception(repositorio.ReferenciaInvalida(f"Rio não encontrado: [{coleta.rio_id}]"))
+                elif faltando:
+                    futuro.set_exception(
+                        repositorio.ReferenciaInvalida(f"Parametro não encontrado: {sorted(faltando)}")
+                    )
+                else:
+                    validas.append((coleta, futuro))
+            if not validas:
+                return
+
+            try:
+                self._ingerir(db, validas)
+            except Exception as e:
+                db.rollback()
+                if len(validas) == 1:
+                    validas[0][1].set_exception(e)
+                    return
+                # Uma coleta problemática não derruba as outras: grava uma a uma
+                logger.warning(f"Lote de {len(validas)} coletas falhou ({str(e)}); gravando individualmente")
+                for item in validas:
+                    try:
+                        self._ingerir(db, [item])
+                    except Exception as erro:
+                        db.rollback()
+                        item[1].set_exception(erro)
+        finally:
+            db.close()
+
+    def _ingerir(self, db, itens):
+        if not self.commit_sincrono:
+            db.execute(text("SET LOCAL synchronous_commit = off"))
+        resultado = repositorio.ingerir_coletas(db, [coleta for coleta, _ in itens])
+        db.commit()
+
+        gravadas = {
+            coleta.id: coleta
+            for coleta in db.query(models.Coleta)
+            .options(selectinload(models.Coleta.coletas_parametros))
+            .filter(models.Coleta.id.in_(set(resultado["ids"])))
+        }
+        for (_, futuro), coleta_id in zip(itens, resultado["ids"]):
+            futuro.set_result(gravadas[coleta_id])
+
+
+agrupador = AgrupadorColetas(
+    configuracoes.AGRUPAMENTO_MAXIMO,
+    configuracoes.AGRUPAMENTO_ESPERA_MS,
+    configuracoes.AGRUPAMENTO_COMMIT_SINCRONO,
+)
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+def pivotar(coleta_ids, parametro_ids, valores):
+    """
+    Monta a matriz coletas x parametros a partir das linhas de coletas_parametros.
+
+    Células sem medição ficam com NaN; medições repetidas do mesmo parametro na
+    mesma coleta são substituídas pela média.
+
+    Returns:
+        (matriz, ids das coletas, ids dos parametros)
+    """
+    coleta_ids = np.asarray(coleta_ids)
+    parametro_ids = np.asarray(parametro_ids)
+    valores = np.asarray(valores, dtype=float)
+
+    linhas_unicas, linhas = np.unique(coleta_ids, return_inverse=True)
+    colunas_unicas, colunas = np.unique(parametro_ids, return_inverse=True)
+    formato = (len(linhas_unicas), len(colunas_unicas))
+
+    soma = np.zeros(formato)
+    contagem = np.zeros(formato)
+    np.add.at(soma, (linhas, colunas), valores)
+    np.add.at(contagem, (linhas, colunas), 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matriz = soma / contagem
+    return matriz, linhas_unicas, colunas_unicas
+
+
+def _pearson_pareado(matriz):
+    """
+    Correlação de Pearson entre todas as colunas, usando para cada par apenas as
+    linhas em que ambas as colunas têm valor. Retorna (correlações, n por par).
+    """
+    presente = ~np.isnan(matriz)
+    peso = presente.astype(float)
+
+    # Centraliza cada coluna pela própria média para reduzir o erro de cancelamento
+    with np.errstate(invalid="ignore"):
+        centro = np.nanmean(np.where(presente, matriz, np.nan), axis=0)
+    x = np.where(presente, matriz - np.nan_to_num(centro), 0.0)
+
+    n = peso.T @ peso
+    soma_x = x.T @ peso          # soma de x_i nas linhas em que j também existe
+    soma_xx = (x * x).T @ peso
+    soma_xy = x.T @ x
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = soma_xy - soma_x * soma_x.T / n
+        var_i = soma_xx - soma_x * soma_x / n
+        correlacao = cov / np.sqrt(var_i * var_i.T)
+
+    correlacao[n < 2] = np.nan
+    return np.clip(correlacao, -1.0, 1.0), n.astype(int)
+
+
+def _postos(coluna):
+    """Postos médios (empates recebem a média dos postos), NaN preservado."""
+    postos = np.full(coluna.shape, np.nan)
+    validos = ~np.isnan(coluna)
+    valores = coluna[validos]
+    if valores.size == 0:
+        return postos
+
+    ordem = np.argsort(valores, kind="mergesort")
+    ordenados = valores[ordem]
+    inicio_grupo = np.r_[True, ordenados[1:] != ordenados[:-1]]
+    grupo = np.cumsum(inicio_grupo) - 1
+    posicoes = np.arange(1, valores.size + 1, dtype=float)
+    media_grupo = np.bincount(grupo, posicoes) / np.bincount(grupo)
+
+    resultado = np.empty(valores.size)
+    resultado[ordem] = media_grupo[grupo]
+    postos[validos] = resultado
+    return postos
+
+
+def correlacionar(matriz, metodo: str = "pearson"):
+    """
+    Calcula a matriz de correlação pareada entre os parametros (colunas).
+
+    Args:
+        matriz: coletas x parametros, com NaN onde não houve medição.
+        metodo: "pearson" ou "spearman".
+
+    Returns:
+        (correlações, número de coletas usadas em cada par)
+    """
+    if metodo == "pearson":
+        return _pearson_pareado(matriz)
+
+    if metodo != "spearman":
+        raise ValueError(f"Método de correlação desconhecido: {metodo}")
+
+    # Postos por coluna; exatos para os pares em que as duas colunas têm as mesmas coletas
+    postos = np.column_stack([_postos(matriz[:, j]) for j in range(matriz.shape[1])]) \
+        if matriz.shape[1] else matriz.copy()
+    correlacao, n = _pearson_pareado(postos)
+
+    # Pares com coletas faltando em uma das colunas precisam dos postos recalculados
+    # apenas sobre as coletas em comum
+    presente = ~np.isnan(matriz)
+    contagem = presente.sum(axis=0)
+    incompletos = (n < contagem[:, None]) | (n < contagem[None, :])
+    for i, j in zip(*np.nonzero(np.triu(incompletos & (n >= 2), k=1))):
+        comum = presente[:, i] & presente[:, j]
+        par = np.column_stack([_postos(matriz[comum, i]), _postos(matriz[comum, j])])
+        r = _pearson_pareado(par)[0][0, 1]
+        correlacao[i, j] = correlacao[j, i] = r
+
+    return correlacao, n
@@ -0,0 +1,231 @@
+import numpy as np
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from models import ColetaParametro as ModelColetaParametro
+from models import Coleta as ModelColeta
+from models import EstatisticaParametro
+from configuracao import configuracoes
+import eventos
+import ultimas
+import distribuicoes
+import compactas
+
+# Fatores que tornam MAD e desvio médio absoluto estimadores do desvio padrão (normal)
+FATOR_MAD = 1.4826
+FATOR_DESVIO_MEDIO = 1.2533
+
+
+def _sinalizar(valores, n, media, desvio, mediana, escala):
+    """
+    Marca como atípicos os valores cujo escore z clássico ou robusto (mediana/MAD)
+    passa dos limites configurados. Séries com histórico curto nunca são marcadas.
+    Todos os argumentos podem ser escalares ou vetores do mesmo tamanho.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        escore_z = np.abs(valores - media) / desvio
+        escore_robusto = np.abs(valores - mediana) / escala
+    escore_z = np.where(desvio > 0, escore_z, 0.0)
+    escore_robusto = np.where(escala > 0, escore_robusto, 0.0)
+    return (n >= configuracoes.HISTORICO_MINIMO_ATIPICOS) & (
+        (escore_z > configuracoes.LIMITE_ESCORE_Z)
+        | (escore_robusto > configuracoes.LIMITE_ESCORE_MAD)
+    )
+
+
+def _escala_robusta(desvios_absolutos, mad):
+    """MAD escalado; se for zero (muitos valores iguais), usa o desvio médio absoluto."""
+    return np.where(
+        mad > 0, FATOR_MAD * mad, FATOR_DESVIO_MEDIO * np.mean(desvios_absolutos, axis=-1)
+    )
+
+
+def _remover(estatistica, y: float) -> None:
+    """Welford inverso: tira das estatísticas um valor que foi substituído."""
+    if estatistica.n <= 1:
+        estatistica.n, estatistica.media, estatistica.m2 = 0, 0.0, 0.0
+    else:
+        n = estatistica.n - 1
+        media = (estatistica.n * estatistica.media - y) / n
+        estatistica.m2 = float(max(estatistica.m2 - (y - media) * (y - estatistica.media), 0.0))
+        estatistica.media = float(media)
+        estatistica.n = n
+    janela = list(estatistica.janela or [])
+    if y in janela:
+        # A ocorrência mais recente, que é a que sairia por último da janela
+        del janela[len(janela) - 1 - janela[::-1].index(y)]
+        estatistica.janela = janela
+
+
+def avaliar_medicoes(db: Session, rio_id: int, medicoes):
+    """
+    Compara cada medição nova com o histórico do seu parametro no rio, preenche
+    `atipico` e incorpora o valor às estatísticas da série.
+
+    O custo por medição é constante: média e variância são acumuladas (Welford) e
+    mediana/MAD vêm de uma janela de tamanho fixo com os últimos valores. Medições
+    que substituem um valor já gravado trazem-no em `anterior`, que sai das
+    estatísticas antes de o novo entrar.
+    Deve ser chamada dentro da transação que grava as medições.
+    """
+    chaves = sorted({(rio_id, m.parametro_id) for m in medicoes})
+    # Séries novas entram vazias antes da trava: duas primeiras ingestões simultâneas
+    # da mesma série não podem inserir a mesma linha (a segunda espera a primeira)
+    db.execute(
+        insert(EstatisticaParametro)
+        .values([
+            {"rio_id": r, "parametro_id": p, "n": 0, "media": 0.0, "m2": 0.0, "janela": []}
+            for r, p in chaves
+        ])
+        .on_conflict_do_nothing(index_elements=["rio_id", "parametro_id"])
+    )
+    estatisticas = {
+        (e.rio_id, e.parametro_id): e
+        for e in db.query(EstatisticaParametro)
+        .filter(tuple_(EstatisticaParametro.rio_id, EstatisticaParametro.parametro_id).in_(chaves))
+        .order_by(EstatisticaParametro.rio_id, EstatisticaParametro.parametro_id)
+        .with_for_update()
+        .populate_existing()
+    }
+
+    for medicao in medicoes:
+        estatistica = estatisticas[(rio_id, medicao.parametro_id)]
+
+        anterior = medicao.anterior
+        if anterior is not None:
+            _remover(estatistica, float(anterior))
+
+        x = float(medicao.valor)
+        janela = np.asarray(estatistica.janela or [], dtype=float)
+        if janela.size:
+            mediana = np.median(janela)
+            desvios = np.abs(janela - mediana)
+            escala = _escala_robusta(desvios, np.median(desvios))
+        else:
+            mediana, escala = x, 0.0
+        desvio = np.sqrt(estatistica.m2 / (estatistica.n - 1)) if estatistica.n > 1 else 0.0
+
+        medicao.atipico = bool(
+            _sinalizar(x, estatistica.n, estatistica.media, desvio, mediana, escala)
+        )
+
+        # Welford
+        n = estatistica.n + 1
+        delta = x - estatistica.media
+        media = estatistica.media + delta / n
+        estatistica.m2 = float(estatistica.m2 + delta * (x - media))
+        estatistica.media = float(media)
+        estatistica.n = n
+        estatistica.janela = (janela.tolist() + [x])[-configuracoes.JANELA_ATIPICOS:]
+
+    return [m for m in medicoes if m.atipico]
+
+
+def _medianas_por_grupo(grupos, valores, quantidade):
+    ordem = np.lexsort((valores, grupos))
+    ordenados = valores[ordem]
+    contagem = np.bincount(grupos, minlength=quantidade)
+    inicio = np.concatenate(([0], np.cumsum(contagem)[:-1]))
+    medianas = np.full(quantidade, np.nan)
+    com_valores = contagem > 0
+    baixo = inicio[com_valores] + (contagem[com_valores] - 1) // 2
+    alto = inicio[com_valores] + contagem[com_valores] // 2
+    medianas[com_valores] = (ordenados[baixo] + ordenados[alto]) / 2
+    return medianas
+
+
+def recalcular(db: Session) -> dict:
+    """
+    Reavalia todo o acervo em uma única passada vetorizada: recalcula as
+    estatísticas de todas as séries (rio, parametro), marca os valores atípicos
+    e reconstrói as janelas usadas na avaliação das novas coletas.
+
+    Diferente da avaliação na inserção, aqui cada valor é comparado com a série
+    completa, inclusive com as medições posteriores a ele.
+    """
+    linhas = db.query(
+        ModelColetaParametro.id,
+        ModelColeta.rio_id,
+        ModelColetaParametro.parametro_id,
+        ModelColetaParametro.valor,
+        ModelColetaParametro.atipico,
+    ).join(
+        ModelColeta, ModelColeta.id == ModelColetaParametro.coleta_id
+    ).filter(
+        ModelColeta.rio_id.isnot(None)
+    ).order_by(
+        ModelColeta.rio_id, ModelColetaParametro.parametro_id, ModelColeta.datas, ModelColetaParametro.id
+    ).all()
+
+    if not linhas:
+        return {"series": 0, "medicoes": 0, "atipicos": 0, "alterados": 0}
+
+    ids, rios, parametros, valores, anteriores = (np.array(coluna) for coluna in zip(*linhas))
+    valores = valores.astype(float)
+    chaves, grupos = np.unique(np.column_stack((rios, parametros)), axis=0, return_inverse=True)
+    grupos = grupos.ravel()
+    quantidade = len(chaves)
+
+    n = np.bincount(grupos, minlength=quantidade)
+    media = np.bincount(grupos, valores, quantidade) / n
+    m2 = np.bincount(grupos, (valores - media[grupos]) ** 2, quantidade)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        desvio = np.where(n > 1, np.sqrt(m2 / (n - 1)), 0.0)
+
+    mediana = _medianas_por_grupo(grupos, valores, quantidade)
+    desvios = np.abs(valores - mediana[grupos])
+    mad = _medianas_por_grupo(grupos, desvios, quantidade)
+    desvio_medio = np.bincount(grupos, desvios, quantidade) / n
+    escala = np.where(mad > 0, FATOR_MAD * mad, FATOR_DESVIO_MEDIO * desvio_medio)
+
+    atipicos = _sinalizar(
+        valores, n[grupos], media[grupos], desvio[grupos], mediana[grupos], escala[grupos]
+    )
+    alterados = atipicos != anteriores.astype(bool)
+
+    if alterados.any():
+        db.execute(
+            text(
+                "UPDATE coletas_parametros AS cp SET atipico = d.atipico "
+                "FROM unnest(CAST(:rios AS integer[]), CAST(:ids AS integer[]), CAST(:atipicos AS boolean[])) "
+                "AS d(rio_id, id, atipico) "
+                "WHERE cp.rio_id = d.rio_id AND cp.id = d.id"
+            ),
+            {
+                "rios": rios[alterados].tolist(),
+                "ids": ids[alterados].tolist(),
+                "atipicos": atipicos[alterados].tolist(),
+            },
+        )
+        ultimas.atualizar_atipicos(db)
+        distribuicoes.recalcular(db)
+        if configuracoes.ARMAZENAMENTO_COMPACTO:
+            compactas.recalcular(db, np.unique(rios[alterados]).tolist())
+        else:
+            compactas.marcar_incompleta(db)
+
+    # As linhas já vêm ordenadas por data dentro de cada série: a janela são as últimas
+    inicio = np.concatenate(([0], np.cumsum(n)[:-1]))
+    db.query(EstatisticaParametro).delete(synchronize_session=False)
+    db.bulk_insert_mappings(EstatisticaParametro, [
+        {
+            "rio_id": int(rio_id),
+            "parametro_id": int(parametro_id),
+            "n": int(n[g]),
+            "media": float(media[g]),
+            "m2": float(m2[g]),
+            "janela": valores[
+                max(inicio[g], inicio[g] + n[g] - configuracoes.JANELA_ATIPICOS):inicio[g] + n[g]
+            ].tolist(),
+        }
+        for g, (rio_id, parametro_id) in enumerate(chaves)
+    ])
+    for rio_id in np.unique(rios[alterados]).tolist():
+        eventos.registrar_alteracao(db, "coletas_parametros", rio_id)
+
+    return {
+        "series": quantidade,
+        "medicoes": int(len(valores)),
+        "atipicos": int(atipicos.sum()),
+        "alterados": int(alterados.sum()),
+    }
@@ -0,0 +1,126 @@
+import json
+import os
+import select
+import time
+import uuid
+from threading import Thread
+from sqlalchemy import text
+from database import engine
+from configuracao import configuracoes, logger
+from cache import TABELAS_DE_MEDICOES
+import eventos
+import versoes
+
+# Barramento de invalidação entre workers sobre LISTEN/NOTIFY do próprio Postgres.
+#
+# Todo commit com alterações emite, dentro da mesma transação, um NOTIFY no canal
+# CANAL com as alterações (tabela, rio_id). O Postgres só entrega a notificação
+# se a transação confirmar, e na ordem dos commits. Cada worker mantém uma conexão ouvindo o canal e republica as
+# alterações dos outros em eventos.publicar(..., remotas=True): caches por rio,
+# respostas coalescidas, versões (ETags) e a transmissão reagem como a um commit local.
+#
+# Notificações perdidas (conexão caída) não são reenviadas; ao reconectar, o
+# ouvinte descarta tudo o que os caches guardam e relê as versões.
+
+CANAL = "alteracoes"
+ORIGEM = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"   # para ignorar as próprias notificações
+LIMITE_CARGA = 7000     # o Postgres aceita até 8000 bytes por notificação
+
+NOTIFICAR_SQL = "SELECT pg_notify(:canal, :carga)"
+
+_thread = None
+_conexao = None
+contadores = {"publicadas": 0, "recebidas": 0, "reconexoes": 0}
+
+
+def _carga(alteracoes) -> str:
+    mensagem = {"origem": ORIGEM, "alteracoes": alteracoes}
+    carga = json.dumps(mensagem, separators=(",", ":"))
+    if len(carga) > LIMITE_CARGA:
+        # Rios demais para uma notificação: a tabela inteira é invalidada
+        mensagem["alteracoes"] = sorted({(tabela, None) for tabela, _ in alteracoes})
+        carga = json.dumps(mensagem, separators=(",", ":"))
+    return carga
+
+
+@eventos.inscrever_antes_commit
+def _notificar(db, alteracoes):
+    if not configuracoes.BARRAMENTO_ATIVO:
+        return
+    carga = _carga(alteracoes)
+    db.execute(text(NOTIFICAR_SQL), {"canal": CANAL, "carga": carga})
+    contadores["publicadas"] += 1
+
+
+def _receber(carga: str):
+    mensagem = json.loads(carga)
+    if mensagem["origem"] == ORIGEM:
+        return      # commit deste processo: os ouvintes já rodaram no after_commit
+    contadores["recebidas"] += 1
+    eventos.publicar([tuple(alteracao) for alteracao in mensagem["alteracoes"]], remotas=True)
+
+
+def _invalidar_tudo():
+    eventos.publicar(sorted((tabela, None) for tabela in TABELAS_DE_MEDICOES), remotas=True)
+    versoes.recarregar()
+
+
+def _conectar():
+    conexao = engine.raw_connection()
+    bruta = conexao.dbapi_connection
+    conexao.detach()    # fica fora do pool: é só do ouvinte
+    bruta.autocommit = True
+    bruta.cursor().execute(f"LISTEN {CANAL}")
+    return bruta
+
+
+def _ouvir(bruta):
+    while True:
+        if select.select([bruta], [], [], 30) == ([], [], []):
+            bruta.cursor().execute("SELECT 1")    # detecta conexão morta em silêncio
+        bruta.poll()
+        while bruta.notifies:
+            notificacao = bruta.notifies.pop(0)
+            try:
+                _receber(notificacao.payload)
+            except Exception as e:
+                logger.error(f"Notificação inválida no barramento: {str(e)}")
+
+
+def _executar():
+    global _conexao
+    while True:
+        try:
+            _ouvir(_conexao)
+        except Exception as e:
+            logger.warning(f"Conexão do barramento perdida: {str(e)}")
+        try:
+            _conexao.close()
+        except Exception:
+            pass
+        while True:
+            time.sleep(configuracoes.BARRAMENTO_RECONEXAO_SEGUNDOS)
+            try:
+                _conexao = _conectar()
+                contadores["reconexoes"] += 1
+                _invalidar_tudo()
+                break
+            except Exception as e:
+                logger.error(f"Erro ao reconectar o barramento: {str(e)}")
+
+
+def iniciar():
+    """
+    Abre a conexão de escuta e inicia a thread do ouvinte. Ao retornar, toda
+    alteração confirmada por outro worker a partir daqui será recebida.
+    """
+    global _thread, _conexao
+    if _thread is not None or not configuracoes.BARRAMENTO_ATIVO:
+        return
+    _conexao = _conectar()
+    _thread = Thread(target=_executar, name="barramento", daemon=True)
+    _thread.start()
+
+
+def metricas() -> dict:
+    return {"ativo": _thread is not None, "origem": ORIGEM, **contadores}
@@ -0,0 +1,66 @@
+from threading import Lock
+import eventos
+
+# Tabelas cujas alterações tornam obsoletos os resultados calculados por rio
+TABELAS_DE_MEDICOES = {"rios", "parametros", "coletas", "coletas_parametros"}
+
+_caches = []
+
+
+class CachePorRio:
+    """
+    Cache em memória de resultados derivados das coletas, agrupados por rio.
+
+    As entradas de um rio são descartadas assim que uma transação que altera
+    suas coletas é confirmada.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._dados = {}
+        self._geracoes = {}
+        self._trava = Lock()
+        _caches.append(self)
+
+    def obter(self, rio_id: int, chave=None):
+        with self._trava:
+            return self._dados.get(rio_id, {}).get(chave)
+
+    def geracao(self, rio_id: int) -> int:
+        """
+        Número que muda a cada invalidação do rio. Deve ser lido antes de calcular
+        um resultado e repassado a guardar(), para não guardar um valor já obsoleto.
+        """
+        with self._trava:
+            return self._geracoes.get(rio_id, 0) + self._geracoes.get(None, 0)
+
+    def guardar(self, rio_id: int, valor, chave=None, geracao: int = None):
+        with self._trava:
+            atual = self._geracoes.get(rio_id, 0) + self._geracoes.get(None, 0)
+            if geracao is None or geracao == atual:
+                self._dados.setdefault(rio_id, {})[chave] = valor
+        return valor
+
+    def invalidar(self, rio_id: int = None):
+        with self._trava:
+            self._geracoes[rio_id] = self._geracoes.get(rio_id, 0) + 1
+            if rio_id is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(rio_id, None)
+
+
+def invalidar_rio(rio_id: int = None):
+    """
+    Descarta as entradas de um rio (ou de todos, se rio_id for None) em todos os caches.
+    """
+    for cache in _caches:
+        cache.invalidar(rio_id)
+
+
+@eventos.inscrever
+def _invalidar_apos_commit(alteracoes):
+    for tabela, rio_id in alteracoes:
+        if tabela in TABELAS_DE_MEDICOES:
+            # Parametros e rios alteram nomes e listas de todos os resultados
+            invalidar_rio(rio_id if tabela in ("coletas", "coletas_parametros") else None)
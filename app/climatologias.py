@@ -0,0 +1,78 @@
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from configuracao import configuracoes
+from distribuicoes import Esboco
+
+# Climatologia de uma série (rio, parametro): a distribuição de cada mês do ano
+# (todos os janeiros, todos os fevereiros...) juntando todos os anos. Sai dos
+# esboços mensais de distribuicoes, que a ingestão já mantém mês a mês: mesclar
+# os esboços de todos os janeiros dá o de janeiro sem ler as medições. Uma coleta
+# nova refaz só o esboço do seu mês, e a climatologia acompanha.
+
+MESES_SQL = """
+SELECT extract(month FROM mes)::int AS mes_do_ano, n, soma, minimo, maximo, baldes, contagens
+FROM distribuicoes
+WHERE rio_id = :rio_id AND parametro_id = :parametro_id {filtro}
+"""
+
+QUANTIS = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Intervalo interquartil de uma normal em desvios padrão: o escore robusto fica
+# na mesma escala de um escore z
+IQR_NORMAL = 1.349
+
+
+def calcular(db: Session, rio_id: int, parametro_id: int, excluir_atipicos: bool = False) -> dict:
+    """{mês do ano (1 a 12): Esboco} da série, só com os meses que têm medições."""
+    linhas = db.execute(
+        text(MESES_SQL.format(filtro="AND NOT atipico" if excluir_atipicos else "")),
+        {"rio_id": rio_id, "parametro_id": parametro_id},
+    ).all()
+    por_mes = {}
+    for linha in linhas:
+        por_mes.setdefault(linha.mes_do_ano, []).append(linha)
+    return {mes: Esboco(grupo) for mes, grupo in sorted(por_mes.items())}
+
+
+def resumir(mes: int, esboco: Esboco) -> dict:
+    return {
+        "mes": mes,
+        "n": esboco.n,
+        "media": esboco.soma / esboco.n,
+        "minimo": esboco.minimo,
+        "maximo": esboco.maximo,
+        "quantis": {str(q): v for q, v in esboco.quantis(QUANTIS).items()},
+    }
+
+
+def desvios(climatologia: dict, meses, valores) -> list:
+    """
+    Desvio de cada valor em relação ao mês do ano em que foi medido:
+    anomalia (valor - mediana do mês), escore robusto ((valor - mediana) / (IQR / 1,349))
+    e percentil do valor entre as medições do mês. None quando o mês tem menos de
+    HISTORICO_MINIMO_ATIPICOS medições.
+    """
+    meses = np.asarray(meses, dtype=int)
+    valores = np.asarray(valores, dtype=float)
+    anomalias = np.full(len(valores), np.nan)
+    escores = np.full(len(valores), np.nan)
+    percentis = np.full(len(valores), np.nan)
+    for mes in np.unique(meses):
+        esboco = climatologia.get(int(mes))
+        if esboco is None or esboco.n < configuracoes.HISTORICO_MINIMO_ATIPICOS:
+            continue
+        selecao = meses == mes
+        q1, mediana, q3 = (esboco.quantis((0.25, 0.5, 0.75))[q] for q in (0.25, 0.5, 0.75))
+        anomalias[selecao] = valores[selecao] - mediana
+        if q3 > q1:
+            escores[selecao] = anomalias[selecao] / ((q3 - q1) / IQR_NORMAL)
+        percentis[selecao] = esboco.fracao_ate(valores[selecao]) * 100
+
+    def _ou_none(x):
+        return None if np.isnan(x) else float(x)
+
+    return [
+        {"anomalia": _ou_none(a), "escore": _ou_none(e), "percentil": _ou_none(p)}
+        for a, e, p in zip(anomalias, escores, percentis)
+    ]
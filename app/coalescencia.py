@@ -0,0 +1,140 @@
+import asyncio
+import re
+import time
+from threading import Lock
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
+from configuracao import configuracoes
+from cache import TABELAS_DE_MEDICOES
+import eventos
+import replica
+
+# Requisições GET idênticas que chegam enquanto a primeira ainda está sendo
+# atendida não executam a rota de novo: esperam a primeira terminar e recebem os
+# mesmos bytes. Opcionalmente, a resposta fica guardada por COALESCENCIA_TTL_SEGUNDOS
+# (até a próxima alteração nas medições) para quem chegar logo depois.
+
+# Rotas idempotentes e caras o bastante para valer a pena
+ROTAS = re.compile(
+    r"^/(coletas(/rio/.*|/parametro/.*)?"
+    r"|rio/[^/]+/coletas/[^/]+/(grafico|resumo)"
+    r"|rios/[^/]+/(painel|atual)"
+    r"|analise/(correlacao|iqa|tendencias)"
+    r"|mapa/clusters)$"
+)
+
+_em_andamento = {}      # chave -> Future com a resposta do líder
+_guardadas = {}         # chave -> (expira_em, resposta)
+_trava = Lock()         # _guardadas também é limpo pelos ouvintes de eventos, em outras threads
+_geracao = 0
+
+contadores = {"executadas": 0, "coalescidas": 0, "do_cache": 0}
+
+
+def _chave(scope) -> tuple:
+    cabecalhos = Headers(scope=scope)
+    posicao = (
+        cabecalhos.get(replica.CABECALHO_POSICAO)
+        or cookie_parser(cabecalhos.get("cookie", "")).get(replica.COOKIE_POSICAO)
+    )
+    # Tudo o que muda a resposta: URL, validadores condicionais e a posição de escrita do cliente
+    return (
+        scope["path"],
+        scope["query_string"],
+        cabecalhos.get("if-none-match"),
+        cabecalhos.get("if-modified-since"),
+        posicao,
+    )
+
+
+def _guardada(chave):
+    with _trava:
+        item = _guardadas.get(chave)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del _guardadas[chave]
+            return None
+        return item[1]
+
+
+def _guardar(chave, resposta, geracao):
+    with _trava:
+        if geracao != _geracao:
+            return
+        if len(_guardadas) >= 1024:
+            agora = time.monotonic()
+            for antiga in [c for c, (expira, _) in _guardadas.items() if expira < agora]:
+                del _guardadas[antiga]
+            if len(_guardadas) >= 1024:
+                _guardadas.clear()
+        _guardadas[chave] = (time.monotonic() + configuracoes.COALESCENCIA_TTL_SEGUNDOS, resposta)
+
+
+@eventos.inscrever
+def _descartar_guardadas(alteracoes):
+    global _geracao
+    if any(tabela in TABELAS_DE_MEDICOES for tabela, _ in alteracoes):
+        with _trava:
+            _geracao += 1
+            _guardadas.clear()
+
+
+async def _responder(resposta, send):
+    status, cabecalhos, corpo = resposta
+    await send({"type": "http.response.start", "status": status, "headers": cabecalhos})
+    await send({"type": "http.response.body", "body": corpo})
+
+
+class Coalescencia:
+    """Middleware ASGI que compartilha uma execução entre GETs idênticos simultâneos."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not ROTAS.match(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        chave = _chave(scope)
+        resposta = _guardada(chave)
+        if resposta is not None:
+            contadores["do_cache"] += 1
+            return await _responder(resposta, send)
+
+        lider = _em_andamento.get(chave)
+        if lider is not None:
+            resposta = await asyncio.shield(lider)
+            if resposta is not None:
+                contadores["coalescidas"] += 1
+                return await _responder(resposta, send)
+            # O líder falhou ou não pôde ser compartilhado: executa por conta própria
+            return await self.app(scope, receive, send)
+
+        futuro = asyncio.get_running_loop().create_future()
+        _em_andamento[chave] = futuro
+        with _trava:
+            geracao = _geracao
+        contadores["executadas"] += 1
+
+        inicio = {}
+        partes = []
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                inicio.update(mensagem)
+            elif mensagem["type"] == "http.response.body":
+                partes.append(mensagem.get("body", b""))
+            await send(mensagem)
+
+        resposta = None
+        try:
+            await self.app(scope, receive, enviar)
+            if inicio and inicio["status"] < 500:
+                resposta = (inicio["status"], list(inicio.get("headers", [])), b"".join(partes))
+        finally:
+            del _em_andamento[chave]
+            futuro.set_result(resposta)
+
+        if resposta is not None and resposta[0] == 200 and configuracoes.COALESCENCIA_TTL_SEGUNDOS > 0:
+            _guardar(chave, resposta, geracao)
@@ -0,0 +1,348 @@
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import engine
+from configuracao import configuracoes, logger
+
+# Tabela coletas_compactas: as medições de cada coleta numa linha só. Os valores vão
+# num bloco binário na ordem dos parametros da coleta, e essa ordem (os ids dos
+# parametros, crescentes) fica uma vez só em ordens_parametros: coletas com o mesmo
+# conjunto de parametros apontam para a mesma ordem. Atípicos, quando há, são uma
+# máscara de bits na mesma ordem.
+#
+# O primeiro byte do bloco diz o formato dos valores: tipo << 4 | escala. Os tipos
+# inteiros guardam valor * 10**escala; cada coleta usa o formato mais estreito que
+# devolve exatamente os mesmos floats (medições de laboratório têm poucas casas
+# decimais e quase sempre cabem em smallint ou integer). float64 é o último recurso.
+#
+# coletas_parametros continua sendo a origem (sincronização, gatilhos, análises): a
+# ingestão refaz a linha compacta das coletas que gravou, e as leituras de coletas
+# inteiras usam esta tabela com ARMAZENAMENTO_COMPACTO ligado.
+#
+# estado_compactas diz se a tabela reflete todas as medições: gerenciar.py compactar
+# a marca completa, e toda gravação em coletas_parametros feita sem compactar (a
+# opção desligada neste worker) desmarca, na mesma transação. Sem a marca, as
+# leituras voltam a usar coletas_parametros até a próxima compactação.
+
+INT16, INT32, FLOAT32, FLOAT64 = 0, 1, 2, 3
+TIPOS = {INT16: np.dtype("<i2"), INT32: np.dtype("<i4"), FLOAT32: np.dtype("<f4"), FLOAT64: np.dtype("<f8")}
+LIMITES = {INT16: 2 ** 15 - 1, INT32: 2 ** 31 - 1}
+ESCALA_MAXIMA = 6
+
+TAMANHO_LOTE = 5000     # coletas por leitura e por gravação
+
+# Ordens já conhecidas neste processo. Uma ordem gravada nunca muda nem é apagada.
+_ordens = {}        # tupla de parametro_ids -> ordem_id
+_parametros = {}    # ordem_id -> tupla de parametro_ids
+
+
+def codificar(valores) -> list:
+    """Um bloco (bytes) por linha da matriz (coletas x parametros)."""
+    valores = np.atleast_2d(np.asarray(valores, dtype=float))
+    cabecalhos = np.full(len(valores), FLOAT64 << 4, dtype=np.uint8)
+    pendentes = np.arange(len(valores))
+    with np.errstate(over="ignore", invalid="ignore"):
+        for escala in range(ESCALA_MAXIMA + 1):
+            if not len(pendentes):
+                break
+            fator = 10.0 ** escala
+            inteiros = np.round(valores[pendentes] * fator)
+            exatos = (inteiros / fator == valores[pendentes]).all(axis=1)
+            maximo = np.abs(inteiros).max(axis=1)
+            for tipo in (INT32, INT16):     # o mais estreito sobrescreve
+                cabecalhos[pendentes[exatos & (maximo <= LIMITES[tipo])]] = tipo << 4 | escala
+            pendentes = pendentes[~exatos]
+        restantes = np.flatnonzero(cabecalhos == FLOAT64 << 4)
+        exatos = (valores[restantes].astype(np.float32).astype(float) == valores[restantes]).all(axis=1)
+        cabecalhos[restantes[exatos]] = FLOAT32 << 4
+
+    blocos = [None] * len(valores)
+    for cabecalho in np.unique(cabecalhos):
+        linhas = np.flatnonzero(cabecalhos == cabecalho)
+        tipo, escala = cabecalho >> 4, cabecalho & 0xF
+        dados = valores[linhas]
+        if tipo in LIMITES:
+            dados = np.round(dados * 10.0 ** escala)
+        prefixo = bytes([cabecalho])
+        for linha, bloco in zip(linhas, dados.astype(TIPOS[tipo])):
+            blocos[linha] = prefixo + bloco.tobytes()
+    return blocos
+
+
+def decodificar(blocos, n: int, coluna: int = None) -> np.ndarray:
+    """
+    Matriz (blocos x n) de floats a partir de blocos com n valores cada; com `coluna`,
+    só os valores dessa posição (vetor), sem converter os demais.
+    """
+    blocos = [bytes(bloco) for bloco in blocos]    # o psycopg2 entrega bytea como memoryview
+    resultado = np.empty((len(blocos), n) if coluna is None else len(blocos))
+    cabecalhos = np.fromiter((bloco[0] for bloco in blocos), np.uint8, len(blocos))
+    for cabecalho in np.unique(cabecalhos):
+        linhas = np.flatnonzero(cabecalhos == cabecalho)
+        tipo, escala = cabecalho >> 4, cabecalho & 0xF
+        bytes_ = np.frombuffer(b"".join(blocos[i] for i in linhas), np.uint8).reshape(len(linhas), -1)
+        largura = TIPOS[tipo].itemsize
+        trecho = bytes_[:, 1:] if coluna is None else bytes_[:, 1 + coluna * largura:1 + (coluna + 1) * largura]
+        dados = np.ascontiguousarray(trecho).view(TIPOS[tipo]).astype(float)
+        if coluna is not None:
+            dados = dados[:, 0]
+        resultado[linhas] = dados / 10.0 ** escala if tipo in LIMITES else dados
+    return resultado
+
+
+def _mascaras(atipicos: np.ndarray) -> list:
+    bits = np.packbits(atipicos, axis=1)
+    return [linha.tobytes() if algum else None for linha, algum in zip(bits, atipicos.any(axis=1))]
+
+
+def _atipicos(mascaras, n: int) -> np.ndarray:
+    resultado = np.zeros((len(mascaras), n), dtype=bool)
+    for i, mascara in enumerate(mascaras):
+        if mascara is not None:
+            resultado[i] = np.unpackbits(np.frombuffer(mascara, np.uint8), count=n).astype(bool)
+    return resultado
+
+
+def _carregar_ordens(conexao) -> None:
+    for ordem_id, parametros in conexao.execute(text("SELECT id, parametros FROM ordens_parametros")):
+        _ordens[tuple(parametros)] = ordem_id
+        _parametros[ordem_id] = tuple(parametros)
+
+
+def _ordem_ids(conjuntos) -> dict:
+    """
+    Id de cada conjunto de parametros, criando as ordens que faltam. A criação é
+    confirmada na hora, fora da transação de quem chamou: um rollback depois não
+    pode deixar neste processo um id que não existe no banco.
+    """
+    faltam = set(conjuntos) - _ordens.keys()
+    if faltam:
+        with engine.begin() as conexao:
+            for parametros in sorted(faltam):
+                conexao.execute(
+                    text("INSERT INTO ordens_parametros (parametros) VALUES (:parametros) "
+                         "ON CONFLICT (parametros) DO NOTHING"),
+                    {"parametros": list(parametros)},
+                )
+            _carregar_ordens(conexao)
+    return {parametros: _ordens[parametros] for parametros in conjuntos}
+
+
+def parametros_da_ordem(db: Session, ordem_id: int) -> tuple:
+    if ordem_id not in _parametros:
+        _carregar_ordens(db)
+    return _parametros[ordem_id]
+
+
+MEDICOES_SQL = """
+SELECT coleta_id, rio_id, datas, parametro_id, valor, atipico
+FROM coletas_parametros
+WHERE rio_id = ANY(:rios) AND coleta_id = ANY(:coletas)
+ORDER BY coleta_id, parametro_id
+"""
+
+GRAVAR_SQL = """
+INSERT INTO coletas_compactas (rio_id, coleta_id, datas, ordem_id, valores, atipicos)
+SELECT * FROM unnest(
+    CAST(:rios AS integer[]), CAST(:coletas AS integer[]), CAST(:datas AS date[]),
+    CAST(:ordens AS integer[]), CAST(:valores AS bytea[]), CAST(:atipicos AS bytea[])
+)
+ON CONFLICT (rio_id, coleta_id) DO UPDATE SET
+    datas = EXCLUDED.datas, ordem_id = EXCLUDED.ordem_id,
+    valores = EXCLUDED.valores, atipicos = EXCLUDED.atipicos
+"""
+
+
+def _gravar(db: Session, coleta_ids, rio_ids) -> None:
+    linhas = db.execute(text(MEDICOES_SQL), {"rios": list(rio_ids), "coletas": list(coleta_ids)}).all()
+    sem_medicoes = set(coleta_ids) - {linha.coleta_id for linha in linhas}
+    if sem_medicoes:
+        db.execute(
+            text("DELETE FROM coletas_compactas WHERE rio_id = ANY(:rios) AND coleta_id = ANY(:coletas)"),
+            {"rios": list(rio_ids), "coletas": list(sem_medicoes)},
+        )
+    if not linhas:
+        return
+
+    coletas, rios, datas, parametros, valores, atipicos = zip(*linhas)
+    coletas, parametros = np.array(coletas), np.array(parametros)
+    valores, atipicos = np.array(valores, dtype=float), np.array(atipicos, dtype=bool)
+    inicios = np.flatnonzero(np.r_[True, coletas[1:] != coletas[:-1]])
+    fins = np.r_[inicios[1:], len(coletas)]
+    conjuntos = [tuple(parametros[i:f].tolist()) for i, f in zip(inicios, fins)]
+    ordens = _ordem_ids(set(conjuntos))
+    ordem_da_coleta = np.array([ordens[c] for c in conjuntos])
+
+    colunas = {"rios": [], "coletas": [], "datas": [], "ordens": [], "valores": [], "atipicos": []}
+    for ordem_id in np.unique(ordem_da_coleta).tolist():
+        selecao = inicios[ordem_da_coleta == ordem_id]
+        posicoes = selecao[:, None] + np.arange(len(_parametros[ordem_id]))
+        colunas["rios"] += [rios[i] for i in selecao]
+        colunas["coletas"] += coletas[selecao].tolist()
+        colunas["datas"] += [datas[i] for i in selecao]
+        colunas["ordens"] += [ordem_id] * len(selecao)
+        colunas["valores"] += codificar(valores[posicoes])
+        colunas["atipicos"] += _mascaras(atipicos[posicoes])
+    db.execute(text(GRAVAR_SQL), colunas)
+
+
+def atualizar(db: Session, medicoes) -> None:
+    """
+    Refaz a linha compacta das coletas das medições recém-gravadas (objetos com
+    coleta_id e rio_id), com todas as medições que a coleta tem agora.
+    """
+    por_coleta = {m.coleta_id: m.rio_id for m in medicoes}
+    coleta_ids = list(por_coleta)
+    for inicio in range(0, len(coleta_ids), TAMANHO_LOTE):
+        parte = coleta_ids[inicio:inicio + TAMANHO_LOTE]
+        _gravar(db, parte, {por_coleta[c] for c in parte})
+
+
+MARCAR_INCOMPLETA_SQL = "UPDATE estado_compactas SET completa = false WHERE completa"
+
+# Trava a linha do estado antes de ler as medições: uma gravação sem compactar que
+# ainda não confirmou termina antes (e entra na releitura) ou desmarca depois
+TRAVAR_ESTADO_SQL = """
+INSERT INTO estado_compactas (id, completa) VALUES (1, false)
+ON CONFLICT (id) DO UPDATE SET completa = false
+"""
+
+MARCAR_COMPLETA_SQL = "UPDATE estado_compactas SET completa = true, compactada_em = now() WHERE id = 1"
+
+
+def marcar_incompleta(db: Session) -> None:
+    """
+    Para gravações em coletas_parametros que não refazem as linhas compactas. Só a
+    primeira depois de uma compactação chega a alterar (e travar) a linha do estado.
+    """
+    db.execute(text(MARCAR_INCOMPLETA_SQL))
+
+
+_avisado = False
+
+
+def em_uso(db: Session) -> bool:
+    """Se as leituras devem usar coletas_compactas: opção ligada e tabela completa."""
+    global _avisado
+    if not configuracoes.ARMAZENAMENTO_COMPACTO:
+        return False
+    if db.execute(text("SELECT completa FROM estado_compactas WHERE id = 1")).scalar():
+        return True
+    if not _avisado:
+        logger.warning("coletas_compactas incompleta: leituras em coletas_parametros até rodar gerenciar.py compactar")
+        _avisado = True
+    return False
+
+
+def recalcular(db: Session, rio_ids=None) -> None:
+    """
+    Refaz as linhas compactas dos rios indicados (ou de todos) a partir de
+    coletas_parametros. Sem rio_ids, a tabela inteira é refeita e marcada completa.
+    """
+    completa = rio_ids is None
+    if completa:
+        db.execute(text(TRAVAR_ESTADO_SQL))
+        rio_ids = [r for (r,) in db.execute(text("SELECT id FROM rios"))]
+    for rio_id in sorted(rio_ids):
+        db.execute(text("DELETE FROM coletas_compactas WHERE rio_id = :rio_id"), {"rio_id": rio_id})
+        coleta_ids = [c for (c,) in db.execute(
+            text("SELECT DISTINCT coleta_id FROM coletas_parametros WHERE rio_id = :rio_id ORDER BY 1"),
+            {"rio_id": rio_id},
+        )]
+        for inicio in range(0, len(coleta_ids), TAMANHO_LOTE):
+            _gravar(db, coleta_ids[inicio:inicio + TAMANHO_LOTE], [rio_id])
+    if completa:
+        db.execute(text(MARCAR_COMPLETA_SQL))
+
+
+# ------------------ Leitura ------------------
+
+COLETAS_SQL = """
+SELECT c.id, c.codigo, c.locali, c.rio_id, c.datas, c.latitude, c.longitude, c.replica,
+       k.ordem_id, k.valores
+FROM coletas c
+LEFT JOIN coletas_compactas k ON k.rio_id = c.rio_id AND k.coleta_id = c.id
+{filtro}
+ORDER BY c.id
+"""
+
+SERIE_SQL = """
+SELECT k.ordem_id, k.valores, k.atipicos, c.datas, c.locali, c.latitude, c.longitude
+FROM coletas_compactas k
+JOIN coletas c ON c.id = k.coleta_id
+WHERE k.rio_id = :rio_id AND k.ordem_id = ANY(:ordens)
+"""
+
+
+def _por_ordem(linhas) -> dict:
+    """{ordem_id: índices das linhas} das linhas que têm medições."""
+    grupos = {}
+    for i, linha in enumerate(linhas):
+        if linha.ordem_id is not None:
+            grupos.setdefault(linha.ordem_id, []).append(i)
+    return grupos
+
+
+def coletas(db: Session, rio_id: int = None) -> list:
+    """Coletas com suas medições, no formato de schemas.Coleta (GET /coletas)."""
+    filtro = "WHERE c.rio_id = :rio_id" if rio_id is not None else ""
+    linhas = db.execute(text(COLETAS_SQL.format(filtro=filtro)), {"rio_id": rio_id}).all()
+    medicoes = [[] for _ in linhas]
+    for ordem_id, indices in _por_ordem(linhas).items():
+        parametros = parametros_da_ordem(db, ordem_id)
+        valores = decodificar([linhas[i].valores for i in indices], len(parametros))
+        for i, linha in zip(indices, valores.tolist()):
+            medicoes[i] = [{"parametro_id": p, "valor": v} for p, v in zip(parametros, linha)]
+    return [
+        {
+            "codigo": linha.codigo, "locali": linha.locali, "rio_id": linha.rio_id, "datas": linha.datas,
+            "latitude": linha.latitude, "longitude": linha.longitude, "replica": linha.replica,
+            "coletas_parametros": medicoes[i],
+        }
+        for i, linha in enumerate(linhas)
+    ]
+
+
+def parametros_do_rio(db: Session, rio_id: int) -> set:
+    """Ids dos parametros medidos em alguma coleta do rio."""
+    ordens = db.execute(
+        text("SELECT DISTINCT ordem_id FROM coletas_compactas WHERE rio_id = :rio_id"), {"rio_id": rio_id}
+    ).scalars()
+    return {p for ordem_id in ordens for p in parametros_da_ordem(db, ordem_id)}
+
+
+def serie(db: Session, rio_id: int, parametro_id: int, excluir_atipicos: bool = False) -> list:
+    """
+    Valores de um parametro nas coletas de um rio, no formato de GET
+    /coletas/rio/{codigo}/parametro/{nome}. Só as coletas cuja ordem tem o parametro são lidas.
+    """
+    ordens = []
+    for ordem_id, parametros in db.execute(
+        text("SELECT id, parametros FROM ordens_parametros WHERE :parametro_id = ANY(parametros)"),
+        {"parametro_id": parametro_id},
+    ):
+        _parametros[ordem_id] = tuple(parametros)
+        ordens.append(ordem_id)
+    if not ordens:
+        return []
+    linhas = db.execute(text(SERIE_SQL), {"rio_id": rio_id, "ordens": ordens}).all()
+    valores = []
+    for ordem_id, indices in _por_ordem(linhas).items():
+        parametros = parametros_da_ordem(db, ordem_id)
+        posicao = parametros.index(parametro_id)
+        coluna = decodificar([linhas[i].valores for i in indices], len(parametros), posicao)
+        atipicos = np.zeros(len(indices), dtype=bool)
+        if excluir_atipicos:
+            atipicos = _atipicos([linhas[i].atipicos for i in indices], len(parametros))[:, posicao]
+        for i, valor, atipico in zip(indices, coluna.tolist(), atipicos):
+            if atipico:
+                continue
+            linha = linhas[i]
+            valores.append({
+                "data": linha.datas.isoformat(),
+                "local": linha.locali,
+                "valor": valor,
+                "latitude": linha.latitude,
+                "longitude": linha.longitude,
+            })
+    return valores
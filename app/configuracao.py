@@ -1,3 +1,5 @@
+from functools import lru_cache
+from typing import Optional
 from pydantic import Field #BaseSettings, 
 from pydantic_settings import BaseSettings
 import logging
@@ -46,7 +48,81 @@ class Configuracoes(BaseSettings):
     )
     CHAVE_API: str = Field(..., env="CHAVE_API")
 
+    # Detecção de valores atípicos nas coletas
+    LIMITE_ESCORE_Z: float = Field(3.0, env="LIMITE_ESCORE_Z")
+    LIMITE_ESCORE_MAD: float = Field(3.5, env="LIMITE_ESCORE_MAD")
+    HISTORICO_MINIMO_ATIPICOS: int = Field(8, env="HISTORICO_MINIMO_ATIPICOS")
+    JANELA_ATIPICOS: int = Field(64, env="JANELA_ATIPICOS")
+
+    # Por quanto tempo a cópia local das versões das tabelas (ETags) vale sem reler o banco
+    VALIDADE_VERSOES_SEGUNDOS: float = Field(1.0, env="VALIDADE_VERSOES_SEGUNDOS")
+
+    # Pasta dos arquivos SQLite baixados pelo app para uso offline
+    DIRETORIO_SNAPSHOTS: str = Field("snapshots", env="DIRETORIO_SNAPSHOTS")
+
+    # Hash de senhas (bcrypt) em processos separados da API
+    ROUNDS_SENHAS: int = Field(12, env="ROUNDS_SENHAS")        # custo; hashes antigos são refeitos no login
+    PROCESSOS_SENHAS: int = Field(2, env="PROCESSOS_SENHAS")
+    FILA_SENHAS: int = Field(16, env="FILA_SENHAS")            # pedidos à espera antes de responder 503
+
+    # Réplica de leitura (streaming) do Postgres; vazio = tudo no primário
+    CONEXAO_REPLICA: Optional[str] = Field(None, env="CONEXAO_REPLICA")
+    ATRASO_MAXIMO_REPLICA_SEGUNDOS: float = Field(5.0, env="ATRASO_MAXIMO_REPLICA_SEGUNDOS")
+    VALIDADE_ESTADO_REPLICA_SEGUNDOS: float = Field(1.0, env="VALIDADE_ESTADO_REPLICA_SEGUNDOS")
+
+    # Controle de admissão (admissao.py): execuções simultâneas, fila e espera máxima por classe.
+    # As rotas pesadas gastam CPU em Python; mais de duas por worker só dividem o mesmo núcleo.
+    ADMISSAO_PESADAS_LIMITE: int = Field(2, env="ADMISSAO_PESADAS_LIMITE")
+    ADMISSAO_PESADAS_FILA: int = Field(16, env="ADMISSAO_PESADAS_FILA")
+    ADMISSAO_PESADAS_ESPERA_SEGUNDOS: float = Field(2.0, env="ADMISSAO_PESADAS_ESPERA_SEGUNDOS")
+    ADMISSAO_LEVES_LIMITE: int = Field(24, env="ADMISSAO_LEVES_LIMITE")
+    ADMISSAO_LEVES_FILA: int = Field(128, env="ADMISSAO_LEVES_FILA")
+    ADMISSAO_LEVES_ESPERA_SEGUNDOS: float = Field(5.0, env="ADMISSAO_LEVES_ESPERA_SEGUNDOS")
+
+    # Por quanto tempo a resposta de uma rota coalescida (coalescencia.py) é reaproveitada
+    # depois de pronta. 0 só compartilha entre requisições simultâneas.
+    COALESCENCIA_TTL_SEGUNDOS: float = Field(0.0, env="COALESCENCIA_TTL_SEGUNDOS")
+
+    # Gravação agrupada de POST /coletas (agrupamento.py). Desligada por padrão.
+    # AGRUPAMENTO_COMMIT_SINCRONO=false responde antes do WAL chegar ao disco: uma queda
+    # do Postgres pode perder as últimas coletas já confirmadas ao cliente (sem corromper nada).
+    AGRUPAR_COLETAS: bool = Field(False, env="AGRUPAR_COLETAS")
+    AGRUPAMENTO_MAXIMO: int = Field(64, env="AGRUPAMENTO_MAXIMO")
+    AGRUPAMENTO_ESPERA_MS: float = Field(5.0, env="AGRUPAMENTO_ESPERA_MS")
+    AGRUPAMENTO_COMMIT_SINCRONO: bool = Field(True, env="AGRUPAMENTO_COMMIT_SINCRONO")
+    # Quanto POST /coletas espera o lote confirmar antes de responder 503
+    AGRUPAMENTO_TIMEOUT_SEGUNDOS: float = Field(30.0, env="AGRUPAMENTO_TIMEOUT_SEGUNDOS")
+
+    # GET /coletas/stream (transmissao.py): clientes conectados, lotes de eventos que cada
+    # um pode ter pendentes antes de ser relido do banco, e intervalo de conferência do
+    # banco para pegar gravações de outros workers.
+    TRANSMISSAO_MAXIMO_INSCRITOS: int = Field(5000, env="TRANSMISSAO_MAXIMO_INSCRITOS")
+    TRANSMISSAO_FILA: int = Field(64, env="TRANSMISSAO_FILA")
+    TRANSMISSAO_INTERVALO_SEGUNDOS: float = Field(2.0, env="TRANSMISSAO_INTERVALO_SEGUNDOS")
+
+    # Barramento de invalidação entre workers (barramento.py, LISTEN/NOTIFY). Cada worker
+    # mantém uma conexão a mais com o banco, só para escutar.
+    BARRAMENTO_ATIVO: bool = Field(True, env="BARRAMENTO_ATIVO")
+    BARRAMENTO_RECONEXAO_SEGUNDOS: float = Field(2.0, env="BARRAMENTO_RECONEXAO_SEGUNDOS")
+
+    # POST /lote: sub-requisições por lote e quantas rodam ao mesmo tempo (cada uma usa
+    # uma conexão do pool enquanto roda)
+    LOTE_MAXIMO: int = Field(50, env="LOTE_MAXIMO")
+    LOTE_CONCORRENCIA: int = Field(6, env="LOTE_CONCORRENCIA")
+
+    # Leituras de coletas inteiras (GET /coletas e /coletas/rio/...) a partir de
+    # coletas_compactas, mantida pela ingestão enquanto ligado (compactas.py). Antes de
+    # ligar num banco com dados: python gerenciar.py compactar
+    ARMAZENAMENTO_COMPACTO: bool = Field(False, env="ARMAZENAMENTO_COMPACTO")
+
+    # Conexões do pool abertas no aquecimento (inicializacao.py), antes da primeira requisição
+    AQUECIMENTO_CONEXOES: int = Field(2, env="AQUECIMENTO_CONEXOES")
+
 
 configuracoes = Configuracoes()
 
-API_KEY_HASH = gerar_api_key_hash(configuracoes.CHAVE_API)
+
+@lru_cache(maxsize=None)
+def api_key_hash() -> str:
+    """Hash da CHAVE_API. Gerado no primeiro uso: o bcrypt leva centenas de ms."""
+    return gerar_api_key_hash(configuracoes.CHAVE_API)
@@ -0,0 +1,84 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import CURSOR_ALTERACOES_SQL, Rio
+
+# Resultados derivados das coletas (tendências, mapa...) são guardados por rio junto
+# com o cursor de alterações em que foram calculados, numa tabela pequena (rio_id,
+# cursor). Um rio fica pendente quando alguma coleta ou medição dele recebe número
+# de alteração maior que o seu cursor. O recálculo roda em segundo plano, agendado
+# pela ingestão; as rotas de leitura só comparam cursores (atrasado).
+
+# Coletas e coletas_parametros trazem seq_alteracao indexado, então só as linhas
+# novas são lidas.
+ALTERACOES_POR_RIO_SQL = """
+SELECT rio_id, max(seq) FROM (
+    SELECT rio_id, seq_alteracao AS seq FROM coletas WHERE seq_alteracao > :desde
+    UNION ALL
+    SELECT rio_id, seq_alteracao FROM coletas_parametros WHERE seq_alteracao > :desde
+) alteracoes
+GROUP BY rio_id
+"""
+
+
+def cursor_atual(db: Session) -> int:
+    """
+    Horizonte das alterações: tudo até ele já foi confirmado. Deve ser lido antes
+    dos dados de origem, numa instrução própria: o que for confirmado depois tem
+    número maior e deixa o rio pendente de novo.
+    """
+    return db.execute(text(CURSOR_ALTERACOES_SQL)).scalar()
+
+
+def rios_alterados(db: Session, cursores: dict) -> set:
+    """
+    Dentre os rios de `cursores` ({rio_id: cursor}), retorna os que tiveram coletas
+    ou medições alteradas depois do próprio cursor.
+    """
+    if not cursores:
+        return set()
+    desde = min(cursores.values())
+    resultado = {
+        rio_id
+        for rio_id, seq in db.execute(text(ALTERACOES_POR_RIO_SQL), {"desde": desde})
+        if rio_id in cursores and seq > cursores[rio_id]
+    }
+    # Exclusões não guardam o rio: qualquer coleta ou medição excluída vale para todos
+    excluido = db.execute(text(
+        "SELECT max(seq) FROM exclusoes WHERE seq > :desde "
+        "AND tabela IN ('coletas', 'coletas_parametros')"
+    ), {"desde": desde}).scalar()
+    if excluido is not None:
+        resultado.update(r for r, cursor in cursores.items() if excluido > cursor)
+    return resultado
+
+
+def pendentes(db: Session, modelo) -> list:
+    """
+    Rios sem linha na tabela de cursores `modelo` ou com coletas alteradas depois
+    do próprio cursor.
+    """
+    cursores = dict(db.query(modelo.rio_id, modelo.cursor).all())
+    sem_calculo = {r for r, in db.query(Rio.id)} - set(cursores)
+    return sorted(sem_calculo | rios_alterados(db, cursores))
+
+
+def atrasado(db: Session, modelo) -> bool:
+    """
+    Se algum rio pode estar desatualizado em `modelo`. Só compara o menor cursor
+    (-1 para rio nunca calculado) com o atual; não lê coletas nem grava.
+    """
+    minimo = db.execute(text(
+        f"SELECT min(coalesce(d.cursor, -1)) FROM rios r LEFT JOIN {modelo.__tablename__} d ON d.rio_id = r.id"
+    )).scalar()
+    return minimo is not None and minimo < cursor_atual(db)
+
+
+def avancar(db: Session, modelo, cursor: int, recalculados) -> None:
+    """
+    Leva ao cursor os rios não recalculados: pendentes() lido depois dele não os
+    mostrou, então não tiveram alterações até lá.
+    """
+    db.execute(
+        text(f"UPDATE {modelo.__tablename__} SET cursor = :cursor WHERE cursor < :cursor AND rio_id <> ALL(:rios)"),
+        {"cursor": cursor, "rios": list(recalculados)},
+    )
@@ -0,0 +1,190 @@
+import math
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Tabela distribuicoes: para cada (rio, parametro, mês, atípico), um esboço de quantis
+# em baldes logarítmicos. Cada valor v cai no balde ceil(log_gama |v|), com gama =
+# (1 + PRECISAO) / (1 - PRECISAO); representar o balde pelo seu ponto médio dá erro
+# relativo de no máximo PRECISAO em qualquer quantil. Esboços se mesclam somando as
+# contagens de baldes iguais, então meses e rios são combinados na consulta sem
+# voltar às medições, e o tamanho de cada um depende da faixa de valores da série,
+# não do número de medições.
+
+PRECISAO = 0.01
+GAMA = (1 + PRECISAO) / (1 - PRECISAO)
+LN_GAMA = math.log(GAMA)
+
+# Chave do balde: 0 para |v| < MINIMO; sinal(v) * (expoente + DESLOCAMENTO) nos demais,
+# o que mantém a ordem das chaves igual à ordem dos valores.
+MINIMO = 1e-9
+DESLOCAMENTO = 4000
+
+# Ao mesclar, acima disso os baldes de menor módulo são somados ao balde zero
+MAXIMO_BALDES = 2048
+
+_BALDE = (
+    f"CASE WHEN abs(cp.valor) < {MINIMO!r} THEN 0 "
+    f"ELSE sign(cp.valor)::int * (ceil(ln(abs(cp.valor)) / {LN_GAMA!r})::int + {DESLOCAMENTO}) END"
+)
+
+_INSERIR = f"""
+INSERT INTO distribuicoes (rio_id, parametro_id, mes, atipico, n, soma, minimo, maximo, baldes, contagens)
+SELECT rio_id, parametro_id, mes, atipico, sum(n)::int, sum(soma), min(minimo), max(maximo),
+       array_agg(balde ORDER BY balde), array_agg(n ORDER BY balde)
+FROM (
+    SELECT cp.rio_id, cp.parametro_id, date_trunc('month', cp.datas)::date AS mes,
+           coalesce(cp.atipico, false) AS atipico, {_BALDE} AS balde,
+           count(*)::int AS n, sum(cp.valor) AS soma, min(cp.valor) AS minimo, max(cp.valor) AS maximo
+    FROM coletas_parametros cp
+    {{juncao}}
+    WHERE cp.datas IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+) por_balde
+GROUP BY rio_id, parametro_id, mes, atipico
+"""
+
+# Células (rio, parametro, mês) tocadas pelas medições recém-gravadas
+_CELULAS = """
+SELECT DISTINCT c.rio_id, n.parametro_id, date_trunc('month', c.datas)::date AS mes
+FROM unnest(CAST(:coletas AS integer[]), CAST(:parametros AS integer[])) AS n(coleta_id, parametro_id)
+JOIN coletas c ON c.id = n.coleta_id
+WHERE c.rio_id IS NOT NULL AND c.datas IS NOT NULL
+"""
+
+APAGAR_CELULAS_SQL = f"""
+DELETE FROM distribuicoes d
+USING ({_CELULAS}) x
+WHERE d.rio_id = x.rio_id AND d.parametro_id = x.parametro_id AND d.mes = x.mes
+"""
+
+ATUALIZAR_SQL = _INSERIR.format(
+    juncao=f"JOIN ({_CELULAS}) x ON x.rio_id = cp.rio_id AND x.parametro_id = cp.parametro_id "
+           "AND cp.datas >= x.mes AND cp.datas < x.mes + interval '1 month'",
+)
+
+CONSULTAR_SQL = """
+SELECT n, soma, minimo, maximo, baldes, contagens
+FROM distribuicoes
+WHERE parametro_id = :parametro_id {filtro}
+"""
+
+
+def atualizar(db: Session, medicoes) -> None:
+    """
+    Refaz, a partir das medições gravadas, os esboços dos meses tocados pelas
+    medições recém-gravadas (objetos com coleta_id e parametro_id). Um mês de uma
+    série tem poucas medições, e refazê-lo trata igual inserções e alterações de valor.
+    """
+    medicoes = list(medicoes)
+    if not medicoes:
+        return
+    argumentos = {
+        "coletas": [m.coleta_id for m in medicoes],
+        "parametros": [m.parametro_id for m in medicoes],
+    }
+    db.execute(text(APAGAR_CELULAS_SQL), argumentos)
+    db.execute(text(ATUALIZAR_SQL), argumentos)
+
+
+def recalcular(db: Session) -> None:
+    """Refaz todos os esboços (por exemplo, depois de remarcar os atípicos)."""
+    db.execute(text("DELETE FROM distribuicoes"))
+    db.execute(text(_INSERIR.format(juncao="")))
+
+
+def _balde(valores: np.ndarray) -> np.ndarray:
+    """Chave do balde de cada valor, a mesma de _BALDE."""
+    valores = np.asarray(valores, dtype=float)
+    modulo = np.maximum(np.abs(valores), MINIMO)
+    chaves = np.sign(valores) * (np.ceil(np.log(modulo) / LN_GAMA) + DESLOCAMENTO)
+    return np.where(np.abs(valores) < MINIMO, 0, chaves).astype(np.int64)
+
+
+def _valor_do_balde(baldes: np.ndarray) -> np.ndarray:
+    expoente = np.abs(baldes) - DESLOCAMENTO
+    valores = np.sign(baldes) * 2 * GAMA ** expoente.astype(float) / (GAMA + 1)
+    return np.where(baldes == 0, 0.0, valores)
+
+
+class Esboco:
+    """Esboço mesclado: contagens por balde (em ordem de valor), n, soma, mínimo e máximo."""
+
+    def __init__(self, linhas):
+        self.n = sum(linha.n for linha in linhas)
+        self.soma = sum(linha.soma for linha in linhas)
+        self.minimo = min((linha.minimo for linha in linhas), default=None)
+        self.maximo = max((linha.maximo for linha in linhas), default=None)
+
+        baldes = np.concatenate([np.asarray(l.baldes, dtype=np.int64) for l in linhas]) if linhas else np.array([], np.int64)
+        contagens = np.concatenate([np.asarray(l.contagens, dtype=np.int64) for l in linhas]) if linhas else np.array([], np.int64)
+        self.baldes, grupos = np.unique(baldes, return_inverse=True)
+        self.contagens = np.bincount(grupos, contagens, len(self.baldes)).astype(np.int64)
+        self._colapsar()
+
+    def _colapsar(self):
+        excesso = len(self.baldes) - MAXIMO_BALDES
+        if excesso <= 0:
+            return
+        # Os baldes de menor módulo viram o balde zero; a ordem dos valores se mantém
+        ordem = np.argsort(np.where(self.baldes == 0, -1, np.abs(self.baldes)), kind="stable")
+        juntar = ordem[:excesso + 1]
+        zero = self.contagens[juntar].sum()
+        manter = np.setdiff1d(np.arange(len(self.baldes)), juntar)
+        self.baldes = np.append(self.baldes[manter], 0)
+        self.contagens = np.append(self.contagens[manter], zero)
+        ordem = np.argsort(self.baldes)
+        self.baldes, self.contagens = self.baldes[ordem], self.contagens[ordem]
+
+    def quantis(self, qs) -> dict:
+        if not self.n:
+            return {}
+        acumulado = np.cumsum(self.contagens)
+        valores = np.clip(_valor_do_balde(self.baldes), self.minimo, self.maximo)
+        resultado = {}
+        for q in qs:
+            if q <= 0:
+                resultado[q] = self.minimo
+            elif q >= 1:
+                resultado[q] = self.maximo
+            else:
+                posicao = int(np.searchsorted(acumulado, q * (self.n - 1), side="right"))
+                resultado[q] = float(valores[min(posicao, len(valores) - 1)])
+        return resultado
+
+    def fracao_ate(self, valores) -> np.ndarray:
+        """Fração das medições com valor até cada um dos valores (posto percentil)."""
+        if not self.n:
+            return np.full(len(valores), np.nan)
+        acumulado = np.concatenate([[0], np.cumsum(self.contagens)])
+        posicoes = np.searchsorted(self.baldes, _balde(valores), side="right")
+        return acumulado[posicoes] / self.n
+
+    def histograma(self, faixas: int) -> dict:
+        """Contagens em `faixas` intervalos iguais entre o mínimo e o máximo."""
+        if not self.n:
+            return {"limites": [], "contagens": []}
+        valores = np.clip(_valor_do_balde(self.baldes), self.minimo, self.maximo)
+        contagens, limites = np.histogram(valores, bins=faixas, range=(self.minimo, self.maximo), weights=self.contagens)
+        return {"limites": limites.tolist(), "contagens": contagens.astype(int).tolist()}
+
+
+def consultar(db: Session, parametro_id: int, rio_ids=None, inicio=None, fim=None, excluir_atipicos=False) -> Esboco:
+    """
+    Mescla os esboços do parametro nos rios e meses indicados. inicio e fim são
+    arredondados para o mês: meses parcialmente cobertos entram inteiros.
+    """
+    filtros = []
+    argumentos = {"parametro_id": parametro_id}
+    if rio_ids is not None:
+        filtros.append("AND rio_id = ANY(:rios)")
+        argumentos["rios"] = list(rio_ids)
+    if inicio is not None:
+        filtros.append("AND mes >= date_trunc('month', CAST(:inicio AS date))")
+        argumentos["inicio"] = inicio
+    if fim is not None:
+        filtros.append("AND mes <= CAST(:fim AS date)")
+        argumentos["fim"] = fim
+    if excluir_atipicos:
+        filtros.append("AND NOT atipico")
+    return Esboco(db.execute(text(CONSULTAR_SQL.format(filtro=" ".join(filtros))), argumentos).all())
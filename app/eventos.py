@@ -0,0 +1,109 @@
+from threading import Lock
+from sqlalchemy import event, inspect
+from database import SessionLocal
+from configuracao import logger
+
+# Cada alteração é uma tupla (tabela, rio_id). rio_id None significa "todos os rios".
+# Com o barramento (barramento.py), as alterações confirmadas por outros workers
+# também são publicadas aqui, marcadas como remotas.
+_ouvintes = []
+_ouvintes_locais = set()
+_ouvintes_antes_commit = []
+_trava = Lock()
+
+
+def inscrever(funcao):
+    """
+    Registra uma função chamada com a lista de alterações após cada commit.
+    """
+    with _trava:
+        _ouvintes.append(funcao)
+    return funcao
+
+
+def inscrever_local(funcao):
+    """
+    Como inscrever, mas só para os commits deste processo. Para trabalho que basta
+    ser feito uma vez, pelo worker que gravou (recálculos em segundo plano).
+    """
+    inscrever(funcao)
+    with _trava:
+        _ouvintes_locais.add(funcao)
+    return funcao
+
+
+def inscrever_antes_commit(funcao):
+    """
+    Registra uma função chamada com (sessão, alterações) dentro da transação, logo
+    antes do commit. Serve para gravar dados que devem confirmar junto com a alteração.
+    """
+    with _trava:
+        _ouvintes_antes_commit.append(funcao)
+    return funcao
+
+
+def registrar_alteracao(db, tabela: str, rio_id: int = None):
+    """
+    Marca uma alteração na sessão para ser publicada quando a transação confirmar.
+
+    Necessário apenas para escritas feitas fora do ORM (insert/update em lote);
+    objetos do ORM são registrados automaticamente no flush.
+    """
+    db.info.setdefault("alteracoes", set()).add((tabela, rio_id))
+
+
+def publicar(alteracoes, remotas: bool = False):
+    """
+    Entrega as alterações a todos os ouvintes inscritos. As remotas (de outro
+    processo) não vão para os ouvintes de inscrever_local.
+    """
+    with _trava:
+        ouvintes = [o for o in _ouvintes if not (remotas and o in _ouvintes_locais)]
+    for ouvinte in ouvintes:
+        try:
+            ouvinte(alteracoes)
+        except Exception as e:
+            logger.error(f"Erro ao processar alterações em {ouvinte.__name__}: {str(e)}")
+
+
+def _rio_do_objeto(objeto):
+    estado = inspect(objeto)
+    if "rio_id" in estado.attrs:
+        return estado.attrs.rio_id.loaded_value
+    return None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _coletar_alteracoes(db, contexto_flush):
+    for objeto in list(db.new) + list(db.dirty) + list(db.deleted):
+        tabela = getattr(objeto, "__tablename__", None)
+        if tabela is None:
+            continue
+        rio_id = _rio_do_objeto(objeto)
+        if not isinstance(rio_id, int):
+            rio_id = None
+        registrar_alteracao(db, tabela, rio_id)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _antes_do_commit(db):
+    db.flush()  # garante que as alterações pendentes já foram registradas
+    alteracoes = db.info.get("alteracoes")
+    if not alteracoes:
+        return
+    with _trava:
+        ouvintes = list(_ouvintes_antes_commit)
+    for ouvinte in ouvintes:
+        ouvinte(db, sorted(alteracoes, key=lambda a: (a[0], a[1] or 0)))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publicar_alteracoes(db):
+    alteracoes = db.info.pop("alteracoes", None)
+    if alteracoes:
+        publicar(sorted(alteracoes, key=lambda a: (a[0], a[1] or 0)))
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_alteracoes(db):
+    db.info.pop("alteracoes", None)
@@ -0,0 +1,55 @@
+"""
+Tarefas de administração fora da API.
+
+Uso (de dentro da pasta app):
+    python gerenciar.py criar-tabelas   # cria as tabelas, partições e gatilhos que faltam
+    python gerenciar.py aquecer         # roda o aquecimento da API e mostra cada fase
+    python gerenciar.py compactar       # refaz coletas_compactas (antes de ligar ARMAZENAMENTO_COMPACTO)
+
+Bancos criados com init.sql e as migrações já têm tudo; criar-tabelas serve para
+bancos novos de desenvolvimento e não altera tabelas existentes.
+"""
+import argparse
+import sys
+import time
+from database import engine, Base
+from configuracao import logger
+import models  # noqa: F401 - registra as tabelas
+
+
+def criar_tabelas():
+    inicio = time.perf_counter()
+    Base.metadata.create_all(bind=engine)
+    logger.info(f"Tabelas do banco de dados criadas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+
+def aquecer():
+    import inicializacao
+    inicializacao.aquecer()
+    for fase, ms in inicializacao.fases.items():
+        print(f"{fase:<14}{ms:>10.1f} ms")
+    return 0 if inicializacao.pronto else 1
+
+
+def compactar():
+    from sqlalchemy.orm import Session
+    import compactas
+    inicio = time.perf_counter()
+    with Session(engine) as db:
+        compactas.recalcular(db)
+        db.commit()
+    logger.info(f"coletas_compactas refeita em {time.perf_counter() - inicio:.1f} s")
+
+
+COMANDOS = {"criar-tabelas": criar_tabelas, "aquecer": aquecer, "compactar": compactar}
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("comando", choices=COMANDOS)
+    argumentos = parser.parse_args()
+    return COMANDOS[argumentos.comando]() or 0
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,89 @@
+import time
+
+INICIO = time.perf_counter()   # importado primeiro por main.py: marca o início da importação
+
+import asyncio
+from contextlib import contextmanager
+from sqlalchemy import text
+from database import engine, engine_replica
+from configuracao import configuracoes, logger, api_key_hash
+import versoes
+import replica
+import barramento
+
+# Importar a API não toca no banco nem gera hashes: o que é caro fica para o
+# aquecimento, que roda depois que o servidor já aceita conexões. GET /prontidao
+# responde 503 até o aquecimento terminar, para o balanceador só mandar tráfego
+# a workers prontos. O esquema do banco é criado fora da API (gerenciar.py).
+
+fases = {}        # fase -> duração em ms, na ordem em que rodaram
+pronto = False
+erro = None
+
+
+@contextmanager
+def fase(nome: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fases[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(f"Inicialização: {nome} em {fases[nome]} ms")
+
+
+def importacao_concluida():
+    """Registra o tempo desde o início da importação da API."""
+    fases["importacao"] = round((time.perf_counter() - INICIO) * 1000, 1)
+    logger.info(f"Inicialização: importacao em {fases['importacao']} ms")
+
+
+def _abrir_conexoes(motor, quantidade: int):
+    conexoes = [motor.connect() for _ in range(quantidade)]
+    for conexao in conexoes:
+        conexao.execute(text("SELECT 1"))
+        conexao.close()   # volta ao pool já aberta
+
+
+def aquecer():
+    """
+    Prepara o que as primeiras requisições usariam: hash da chave da API, conexões
+    do pool, ouvinte do barramento e versões das tabelas (ETags). Chamado uma vez,
+    fora do loop de eventos.
+    """
+    global pronto, erro
+    inicio = time.perf_counter()
+    try:
+        with fase("chave_api"):
+            api_key_hash()
+        with fase("conexoes"):
+            _abrir_conexoes(engine, configuracoes.AQUECIMENTO_CONEXOES)
+        if configuracoes.BARRAMENTO_ATIVO:
+            # Antes das versões: o que outro worker confirmar depois da leitura chega pelo barramento
+            with fase("barramento"):
+                barramento.iniciar()
+        with fase("versoes"):
+            versoes.recarregar()
+        if engine_replica is not None:
+            with fase("replica"):
+                _abrir_conexoes(engine_replica, configuracoes.AQUECIMENTO_CONEXOES)
+                replica.estado_replica(atualizar=True)
+    except Exception as e:
+        erro = str(e)
+        logger.error(f"Erro no aquecimento da aplicação: {erro}")
+        return
+    fases["aquecimento"] = round((time.perf_counter() - inicio) * 1000, 1)
+    pronto = True
+    erro = None
+    logger.info(f"Aplicação pronta; aquecimento em {fases['aquecimento']} ms")
+
+
+async def aquecer_ate_conseguir(intervalo: float = 5.0):
+    """Roda o aquecimento numa thread; se o banco não responder, tenta de novo."""
+    while not pronto:
+        await asyncio.to_thread(aquecer)
+        if not pronto:
+            await asyncio.sleep(intervalo)
+
+
+def estado() -> dict:
+    return {"pronto": pronto, "erro": erro, "fases": fases}
@@ -0,0 +1,217 @@
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from models import ColetaParametro as ModelColetaParametro
+from models import Coleta as ModelColeta
+from models import Parametro as ModelParametro
+from models import IndiceQualidade
+import analise
+import eventos
+
+# Componentes do IQA (CETESB/NSF). Cada componente tem seu peso, os parametros que
+# podem fornecê-lo (o primeiro medido na coleta é usado), a conversão para a unidade
+# da curva e a curva de qualidade q(x) aproximada por pontos.
+# DBO não é medida nas coletas; o peso dos componentes ausentes é redistribuído.
+COMPONENTES = {
+    "oxigenio_dissolvido": {
+        "peso": 0.17,
+        "parametros": {"O.D. (%)": 1.0},
+        "x": [0, 10, 20, 30, 40, 50, 60, 70, 80, 85, 90, 95, 100, 105, 110, 120, 130, 140],
+        "q": [2, 5, 9, 14, 21, 30, 41, 53, 67, 76, 85, 92, 96, 95, 92, 85, 79, 75],
+        "acima": (140, 47),
+    },
+    "coliformes": {
+        "peso": 0.15,
+        "parametros": {"E. Coli (NMP/100ml)": 1.0},
+        "log10": True,
+        "x": [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5],
+        "q": [100, 87, 71, 55, 42, 31, 22, 14, 8, 5, 3],
+    },
+    "ph": {
+        "peso": 0.12,
+        "parametros": {"pH": 1.0},
+        "x": [2, 3, 4, 5, 6, 6.5, 7, 7.5, 8, 8.5, 9, 10, 11, 12],
+        "q": [2, 4, 8, 20, 52, 75, 90, 93, 82, 64, 47, 20, 8, 3],
+    },
+    "temperatura": {
+        # Sem a temperatura de equilíbrio, a CETESB considera afastamento nulo (q = 94)
+        "peso": 0.10,
+        "parametros": {"Temp (ºC)": 1.0},
+        "constante": 94,
+    },
+    "nitrogenio_total": {
+        "peso": 0.10,
+        "parametros": {"TN (mg/L)": 1.0, "TDN (µM)": 14.007 / 1000},
+        "x": [0, 1, 2, 5, 10, 20, 30, 60, 90, 100],
+        "q": [100, 88, 78, 58, 40, 20, 12, 5, 2, 1],
+    },
+    "fosforo_total": {
+        # Curva em mg/L de PO4; os parametros são medidos em µM
+        "peso": 0.10,
+        "parametros": {"Total phosphorus (μM)": 94.97 / 1000, "PO4 (μM)": 94.97 / 1000},
+        "x": [0, 0.5, 1, 2, 3, 4, 5, 6, 8, 10],
+        "q": [100, 80, 66, 48, 36, 28, 23, 18, 12, 8],
+        "acima": (10, 5),
+    },
+    "turbidez": {
+        "peso": 0.08,
+        "parametros": {"Turbidez": 1.0},
+        "x": [0, 5, 10, 20, 30, 40, 50, 60, 80, 100],
+        "q": [100, 85, 76, 62, 52, 45, 39, 34, 26, 17],
+        "acima": (100, 5),
+    },
+    "solidos_totais": {
+        # Material particulado em suspensão usado como aproximação dos sólidos totais
+        "peso": 0.08,
+        "parametros": {"SPM (mg/L)": 1.0},
+        "x": [0, 50, 100, 150, 200, 300, 400, 500],
+        "q": [79, 86, 86, 80, 72, 57, 42, 20],
+    },
+}
+
+# Fração mínima do peso total que precisa estar medida para a coleta receber um IQA
+COBERTURA_MINIMA = 0.5
+
+TAMANHO_LOTE = 1000
+
+CATEGORIAS = [(79, "Ótima"), (51, "Boa"), (36, "Regular"), (19, "Ruim"), (0, "Péssima")]
+
+
+def _qualidade(componente: dict, valores):
+    if "constante" in componente:
+        return np.where(np.isnan(valores), np.nan, float(componente["constante"]))
+    x = valores
+    if componente.get("log10"):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = np.log10(np.maximum(valores, 1.0))
+    q = np.interp(x, componente["x"], componente["q"])
+    if "acima" in componente:
+        limite, q_acima = componente["acima"]
+        q = np.where(x > limite, q_acima, q)
+    return np.where(np.isnan(valores), np.nan, q)
+
+
+def categoria(iqa):
+    if iqa is None:
+        return None
+    return next(nome for limite, nome in CATEGORIAS if iqa > limite or limite == 0)
+
+
+def calcular(colunas: dict):
+    """
+    Calcula o IQA de várias coletas de uma vez.
+
+    Args:
+        colunas: nome do componente -> vetor de valores (NaN se não medido), todos
+            com uma posição por coleta.
+
+    Returns:
+        (iqa, cobertura, qualidades por componente). O IQA é o produtório
+        ponderado das qualidades, com os pesos renormalizados sobre os componentes
+        medidos; é NaN onde a cobertura fica abaixo de COBERTURA_MINIMA.
+    """
+    qualidades = {nome: _qualidade(COMPONENTES[nome], valores) for nome, valores in colunas.items()}
+    q = np.column_stack(list(qualidades.values()))
+    pesos = np.array([COMPONENTES[nome]["peso"] for nome in qualidades])
+
+    medido = ~np.isnan(q)
+    cobertura = medido @ pesos / sum(c["peso"] for c in COMPONENTES.values())
+    soma_pesos = medido @ pesos
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_q = np.where(medido, np.log(np.maximum(q, 1e-9)), 0.0)
+        iqa = np.exp(log_q @ pesos / soma_pesos)
+    iqa = np.where(cobertura >= COBERTURA_MINIMA, iqa, np.nan)
+    return iqa, cobertura, qualidades
+
+
+def recalcular(db: Session, coleta_ids=None) -> int:
+    """
+    Recalcula e grava o IQA das coletas indicadas (ou de todas, se None) em lote.
+
+    Deve ser chamada na mesma transação que altera os valores das coletas,
+    para que o índice gravado nunca fique defasado. Retorna quantas coletas
+    receberam um IQA.
+    """
+    fatores = {}   # parametro_id -> (componente, fator de conversão, prioridade)
+    nomes = {
+        nome: (componente, fator, prioridade)
+        for componente, definicao in COMPONENTES.items()
+        for prioridade, (nome, fator) in enumerate(definicao["parametros"].items())
+    }
+    for parametro_id, nome in db.query(ModelParametro.id, ModelParametro.nome).filter(
+        ModelParametro.nome.in_(nomes)
+    ):
+        fatores[parametro_id] = nomes[nome]
+
+    coletas = db.query(ModelColeta.id, ModelColeta.rio_id, ModelColeta.datas)
+    if coleta_ids is not None:
+        coleta_ids = list(coleta_ids)
+        if not coleta_ids:
+            return 0
+        coletas = coletas.filter(ModelColeta.id.in_(coleta_ids))
+        db.query(IndiceQualidade).filter(IndiceQualidade.coleta_id.in_(coleta_ids)).delete(
+            synchronize_session=False
+        )
+    else:
+        db.query(IndiceQualidade).delete(synchronize_session=False)
+        eventos.registrar_alteracao(db, "indices_qualidade")
+    coletas = {c.id: c for c in coletas}
+    for rio_id in {c.rio_id for c in coletas.values()}:
+        eventos.registrar_alteracao(db, "indices_qualidade", rio_id)
+
+    linhas = db.query(
+        ModelColetaParametro.coleta_id, ModelColetaParametro.parametro_id, ModelColetaParametro.valor
+    ).filter(ModelColetaParametro.parametro_id.in_(list(fatores)))
+    if coleta_ids is not None:
+        linhas = linhas.filter(ModelColetaParametro.coleta_id.in_(coleta_ids))
+    linhas = linhas.all()
+    if not linhas:
+        return 0
+
+    matriz, ids_coletas, ids_parametros = analise.pivotar(*zip(*linhas))
+
+    colunas = {}
+    prioridade_usada = {}
+    for j, parametro_id in enumerate(ids_parametros.tolist()):
+        componente, fator, prioridade = fatores[parametro_id]
+        valores = matriz[:, j] * fator
+        if componente not in colunas:
+            colunas[componente] = valores
+            prioridade_usada[componente] = np.where(np.isnan(valores), np.inf, prioridade)
+            continue
+        # Fica com o parametro de maior prioridade medido em cada coleta
+        melhor = ~np.isnan(valores) & (prioridade < prioridade_usada[componente])
+        colunas[componente] = np.where(melhor, valores, colunas[componente])
+        prioridade_usada[componente] = np.where(melhor, prioridade, prioridade_usada[componente])
+
+    iqa, cobertura, qualidades = calcular(colunas)
+
+    registros = []
+    for i, coleta_id in enumerate(ids_coletas.tolist()):
+        coleta = coletas.get(coleta_id)
+        if coleta is None:
+            continue
+        valor = None if np.isnan(iqa[i]) else round(float(iqa[i]), 2)
+        registros.append({
+            "coleta_id": coleta_id,
+            "rio_id": coleta.rio_id,
+            "datas": coleta.datas,
+            "iqa": valor,
+            "categoria": categoria(valor),
+            "cobertura": round(float(cobertura[i]), 4),
+            "componentes": {
+                nome: round(float(q[i]), 2) for nome, q in qualidades.items() if not np.isnan(q[i])
+            },
+        })
+
+    for inicio in range(0, len(registros), TAMANHO_LOTE):
+        comando = insert(IndiceQualidade).values(registros[inicio:inicio + TAMANHO_LOTE])
+        db.execute(comando.on_conflict_do_update(
+            index_elements=[IndiceQualidade.coleta_id],
+            set_={
+                coluna: comando.excluded[coluna]
+                for coluna in ("rio_id", "datas", "iqa", "categoria", "cobertura", "componentes")
+            } | {"calculado_em": func.now()},
+        ))
+    return sum(1 for r in registros if r["iqa"] is not None)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from urllib.parse import unquote, urlsplit
+from configuracao import configuracoes
+
+# POST /lote: várias leituras GET numa requisição só. Cada sub-requisição passa
+# pela aplicação inteira dentro do processo (admissão, coalescência, ETags,
+# réplica), como se tivesse vindo do cliente, mas sem uma ida e volta na rede.
+# Sub-requisições idênticas no mesmo lote rodam uma vez só.
+
+# Cabeçalhos da requisição do lote repassados a cada sub-requisição (autenticação,
+# posição de escrita para ler o que escreveu)
+REPASSADOS = {b"x-api-key", b"authorization", b"cookie", b"x-posicao-escrita", b"accept-language"}
+
+# Cabeçalhos que cada sub-requisição pode trazer por conta própria
+CONDICIONAIS = {"if-none-match", "if-modified-since"}
+
+# Cabeçalhos da resposta de cada sub-requisição devolvidos no lote
+DEVOLVIDOS = {b"etag", b"last-modified", b"cache-control", b"retry-after"}
+
+# Rotas que não fazem sentido dentro de um lote
+EXCLUIDAS = ("/lote", "/coletas/stream", "/snapshots")
+
+
+def validar(caminho: str):
+    """Mensagem de erro se o caminho não pode ser pedido num lote, senão None."""
+    if not caminho.startswith("/"):
+        return "o caminho deve começar com /"
+    rota = unquote(urlsplit(caminho).path)    # o mesmo caminho que vai para a aplicação
+    if any(rota == excluida or rota.startswith(excluida + "/") for excluida in EXCLUIDAS):
+        return f"{rota} não pode ser pedida num lote"
+    return None
+
+
+def _chave(item) -> tuple:
+    return item.caminho, tuple(sorted((nome.lower(), valor) for nome, valor in item.cabecalhos.items()))
+
+
+async def _executar_uma(app, escopo_lote: dict, caminho: str, cabecalhos: tuple) -> dict:
+    partes = urlsplit(caminho)
+    escopo = {
+        "type": "http",
+        "asgi": escopo_lote.get("asgi", {"version": "3.0"}),
+        "http_version": escopo_lote.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": escopo_lote.get("scheme", "http"),
+        "path": unquote(partes.path),
+        "raw_path": partes.path.encode(),
+        "query_string": partes.query.encode(),
+        "root_path": escopo_lote.get("root_path", ""),
+        "headers": [(nome, valor) for nome, valor in escopo_lote["headers"] if nome in REPASSADOS]
+                   + [(nome.encode(), valor.encode()) for nome, valor in cabecalhos if nome in CONDICIONAIS],
+        "client": escopo_lote.get("client"),
+        "server": escopo_lote.get("server"),
+    }
+    pedido_entregue = False
+
+    async def receber():
+        nonlocal pedido_entregue
+        if not pedido_entregue:
+            pedido_entregue = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()    # a sub-requisição nunca "desconecta"
+
+    inicio = {}
+    partes_corpo = []
+
+    async def enviar(mensagem):
+        if mensagem["type"] == "http.response.start":
+            inicio.update(mensagem)
+        elif mensagem["type"] == "http.response.body":
+            partes_corpo.append(mensagem.get("body", b""))
+
+    await app(escopo, receber, enviar)
+    resposta_cabecalhos = dict(inicio.get("headers", []))
+    return {
+        "status": inicio.get("status", 500),
+        "cabecalhos": {
+            nome.decode(): valor.decode() for nome, valor in resposta_cabecalhos.items() if nome in DEVOLVIDOS
+        },
+        "json": resposta_cabecalhos.get(b"content-type", b"").startswith(b"application/json"),
+        "corpo": b"".join(partes_corpo),
+    }
+
+
+def _serializar(identificador, resultado: dict) -> bytes:
+    # O corpo JSON da rota entra como está, sem ser decodificado e codificado de novo
+    if resultado["status"] == 304 or not resultado["corpo"]:
+        corpo = b"null"
+    elif resultado["json"]:
+        corpo = resultado["corpo"]
+    else:
+        corpo = json.dumps(resultado["corpo"].decode("utf-8", "replace")).encode()
+    cabeca = json.dumps({"id": identificador, "status": resultado["status"], "cabecalhos": resultado["cabecalhos"]})
+    return cabeca[:-1].encode() + b', "corpo": ' + corpo + b"}"
+
+
+async def executar(app, escopo_lote: dict, itens) -> bytes:
+    """
+    Executa as sub-requisições (no máximo LOTE_CONCORRENCIA ao mesmo tempo) e devolve
+    o corpo JSON da resposta do lote: {"respostas": [...]} na ordem dos itens.
+    """
+    limite = asyncio.Semaphore(configuracoes.LOTE_CONCORRENCIA)
+    distintas = {}
+    for item in itens:
+        distintas.setdefault(_chave(item), None)
+
+    async def executar_limitada(chave):
+        async with limite:
+            try:
+                distintas[chave] = await _executar_uma(app, escopo_lote, chave[0], chave[1])
+            except Exception as e:
+                distintas[chave] = {
+                    "status": 500, "cabecalhos": {}, "json": True,
+                    "corpo": json.dumps({"detail": f"Erro ao executar a sub-requisição: {str(e)}"}).encode(),
+                }
+
+    await asyncio.gather(*(executar_limitada(chave) for chave in distintas))
+    respostas = [
+        _serializar(item.id if item.id is not None else str(posicao), distintas[_chave(item)])
+        for posicao, item in enumerate(itens)
+    ]
+    return b'{"respostas": [' + b", ".join(respostas) + b"]}"
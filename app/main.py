@@ -1,21 +1,33 @@
+import inicializacao  # primeiro: marca o início da importação
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import (
     CORSMiddleware,
 )  # Middleware CORS para controle de acesso
-from database import engine, Base
+from database import engine_replica
 from routers.parametros import parametros_router
 from routers.rios import rios_router
 from routers.coletas import coletas_router
+from routers.analise import analise_router
+from routers.sincronizacao import sincronizacao_router
+from routers.snapshots import snapshots_router
+from routers.mapa import mapa_router
+from routers.lote import lote_router
 from routers import rotas_autenticacao, rotas_usuarios
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from configuracao import limiter, logger
+from versoes import NaoModificado
+import senhas
+import replica
+import admissao
+import coalescencia
+import agrupamento
+import barramento
+from transmissao import transmissao
 
 
-
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="API Estudo Rios", 
     description="""
@@ -39,6 +51,10 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
         content={"message": "Muitas requisições, tente novamente mais tarde."},
     )
 
+@app.exception_handler(NaoModificado)
+async def nao_modificado_handler(request: Request, exc: NaoModificado):
+    return Response(status_code=304, headers=exc.headers)
+
 origins = [
     "http://web:80",  # Para acesso dentro do Docker
     "http://localhost:3000",  # Para acesso do navegador no host
@@ -48,14 +64,57 @@ origins = [
 def healthz():
     return {"mensagem": "Aplicação está em saudável."}
 
+@app.get("/prontidao")
+def prontidao():
+    """503 até o aquecimento terminar; traz a duração de cada fase da inicialização."""
+    estado = inicializacao.estado()
+    return JSONResponse(status_code=200 if estado["pronto"] else 503, content=estado)
+
+@app.get("/metricas/admissao")
+def metricas_admissao():
+    """Ocupação e fila de cada classe de custo do controle de admissão."""
+    return admissao.metricas()
+
+@app.get("/metricas/coalescencia")
+def metricas_coalescencia():
+    """Quantas requisições executaram a rota e quantas reaproveitaram a resposta de outra."""
+    return coalescencia.contadores
+
+@app.get("/metricas/agrupamento")
+def metricas_agrupamento():
+    """Lotes gravados pela gravação agrupada de coletas e tamanho médio."""
+    return agrupamento.agrupador.metricas()
+
+@app.get("/metricas/barramento")
+def metricas_barramento():
+    """Notificações de alteração publicadas por este worker e recebidas dos outros."""
+    return barramento.metricas()
 
-# Evento de startup para log
+@app.get("/metricas/transmissao")
+def metricas_transmissao():
+    """Clientes conectados ao GET /coletas/stream e publicações feitas."""
+    return transmissao.metricas()
+
+
+# Evento de startup para log. As tabelas são criadas fora da API: python gerenciar.py criar-tabelas
 @app.on_event("startup")
 async def startup():
-    Base.metadata.create_all(bind=engine)
-    logger.info("Tabelas do banco de dados criadas com sucesso.")
     logger.info(f"CORS configurado para permitir origens: {origins}")
     logger.info("Inicialização da aplicação FastAPI...")
+    # Não bloqueia o startup: /healthz já responde, /prontidao só depois do aquecimento
+    app.state.aquecimento = asyncio.create_task(inicializacao.aquecer_ate_conseguir())
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.aquecimento.cancel()
+    senhas.encerrar()
+    agrupamento.agrupador.encerrar()
+
+# Limita as requisições simultâneas por classe de custo; o excesso recebe 503
+app.add_middleware(admissao.ControleAdmissao)
+
+# GETs idênticos simultâneos esperam a primeira execução em vez de ocupar vagas da admissão
+app.add_middleware(coalescencia.Coalescencia)
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,13 +123,25 @@ app.add_middleware(
     allow_credentials=True,  # Permite o envio de cookies com as requisições
     allow_methods=["*"],  # Permite todos os métodos HTTP (GET, POST, etc.)
     allow_headers=["*"],  # Permite todos os cabeçalhos HTTP
+    expose_headers=[replica.CABECALHO_POSICAO],
 )
 
+# Com réplica de leitura, quem acabou de escrever continua lendo do primário até ela alcançar
+if engine_replica is not None:
+    app.middleware("http")(replica.fixar_leituras_apos_escrita)
+
 app.include_router(rotas_usuarios.router)
 app.include_router(rotas_autenticacao.router)
 app.include_router(parametros_router, tags=["parametros"])
 app.include_router(rios_router, tags=["rios"])
 app.include_router(coletas_router, tags=["coletas"])
+app.include_router(analise_router, tags=["analise"])
+app.include_router(sincronizacao_router, tags=["sincronizacao"])
+app.include_router(snapshots_router, tags=["sincronizacao"])
+app.include_router(mapa_router, tags=["mapa"])
+app.include_router(lote_router, tags=["lote"])
+
+inicializacao.importacao_concluida()
 
 # ######## AQUI COMEÇOU O TESTE #######
 
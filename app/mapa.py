@@ -0,0 +1,129 @@
+import math
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import MapaRio, MapaCluster, MapaClusterParametro
+from tarefas import TarefaUnica
+import derivados
+import eventos
+from configuracao import logger
+
+# Grade dos clusters: cada tile de 256 px (Web Mercator) é dividido em
+# CELULAS_POR_TILE x CELULAS_POR_TILE células, ou seja, células de 64 px.
+CELULAS_POR_TILE = 4
+ZOOM_MAXIMO = 16    # acima disso a grade é a mesma do zoom máximo
+LATITUDE_MAXIMA = 85.05112878
+
+# Posição (0..1) de cada coleta na projeção e célula em cada zoom
+_CELULAS_SQL = f"""
+SELECT c.id, c.rio_id, c.latitude, c.longitude, z.zoom,
+       least(floor(p.mx * d.n), d.n - 1)::int AS x,
+       least(floor(p.my * d.n), d.n - 1)::int AS y
+FROM coletas c
+CROSS JOIN LATERAL (
+    SELECT (c.longitude + 180) / 360 AS mx,
+           (1 - ln(tan(radians(c.latitude)) + 1 / cos(radians(c.latitude))) / pi()) / 2 AS my
+) p
+CROSS JOIN generate_series(0, {ZOOM_MAXIMO}) AS z(zoom)
+CROSS JOIN LATERAL (SELECT {CELULAS_POR_TILE} * 2 ^ z.zoom AS n) d
+WHERE c.rio_id = ANY(:rios)
+  AND c.latitude BETWEEN -{LATITUDE_MAXIMA} AND {LATITUDE_MAXIMA}
+  AND c.longitude BETWEEN -180 AND 180
+"""
+
+CLUSTERS_SQL = f"""
+INSERT INTO mapa_clusters (zoom, x, y, rio_id, n, soma_latitude, soma_longitude)
+SELECT zoom, x, y, rio_id, count(*), sum(latitude), sum(longitude)
+FROM ({_CELULAS_SQL}) celulas
+GROUP BY zoom, x, y, rio_id
+"""
+
+CLUSTERS_PARAMETROS_SQL = f"""
+INSERT INTO mapa_clusters_parametros (parametro_id, zoom, x, y, rio_id, n, soma)
+SELECT cp.parametro_id, zoom, x, y, celulas.rio_id, count(*), sum(cp.valor)
+FROM ({_CELULAS_SQL}) celulas
+JOIN coletas_parametros cp ON cp.rio_id = celulas.rio_id AND cp.coleta_id = celulas.id
+GROUP BY cp.parametro_id, zoom, x, y, celulas.rio_id
+"""
+
+# Soma as linhas de cada rio na mesma célula; a condição em x cobre caixas que
+# atravessam o antimeridiano (x_min > x_max)
+CONSULTA_SQL = """
+SELECT c.x, c.y, sum(c.n) AS n,
+       sum(c.soma_latitude) / sum(c.n) AS latitude,
+       sum(c.soma_longitude) / sum(c.n) AS longitude,
+       p.n AS medicoes, p.soma / p.n AS media
+FROM mapa_clusters c
+LEFT JOIN (
+    SELECT x, y, sum(n) AS n, sum(soma) AS soma
+    FROM mapa_clusters_parametros
+    WHERE parametro_id = :parametro_id AND zoom = :zoom
+      AND (:rio_id IS NULL OR rio_id = :rio_id)
+      AND y BETWEEN :y_min AND :y_max
+      AND (CASE WHEN :x_min <= :x_max THEN x BETWEEN :x_min AND :x_max
+                ELSE x >= :x_min OR x <= :x_max END)
+    GROUP BY x, y
+) p ON p.x = c.x AND p.y = c.y
+WHERE c.zoom = :zoom
+  AND (:rio_id IS NULL OR c.rio_id = :rio_id)
+  AND c.y BETWEEN :y_min AND :y_max
+  AND (CASE WHEN :x_min <= :x_max THEN c.x BETWEEN :x_min AND :x_max
+            ELSE c.x >= :x_min OR c.x <= :x_max END)
+GROUP BY c.x, c.y, p.n, p.soma
+"""
+
+
+def celula(latitude: float, longitude: float, zoom: int):
+    """Célula (x, y) da grade do zoom que contém o ponto."""
+    n = CELULAS_POR_TILE * 2 ** zoom
+    latitude = max(-LATITUDE_MAXIMA, min(LATITUDE_MAXIMA, latitude))
+    mx = (longitude + 180) / 360
+    my = (1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2
+    return min(int(mx * n), n - 1), min(int(my * n), n - 1)
+
+
+def recalcular(db: Session, rio_ids) -> None:
+    """
+    Refaz, em SQL, a pirâmide de clusters (todos os zooms) dos rios indicados.
+    """
+    rio_ids = sorted(rio_ids)
+    if not rio_ids:
+        return
+    # Serializa recálculos simultâneos do mesmo rio (threads de fundo de workers diferentes)
+    for rio_id in rio_ids:
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('mapa_clusters'), :rio_id)"), {"rio_id": rio_id})
+    cursor = derivados.cursor_atual(db)
+    for modelo in (MapaCluster, MapaClusterParametro, MapaRio):
+        db.query(modelo).filter(modelo.rio_id.in_(rio_ids)).delete(synchronize_session=False)
+    db.execute(text(CLUSTERS_SQL), {"rios": rio_ids})
+    db.execute(text(CLUSTERS_PARAMETROS_SQL), {"rios": rio_ids})
+    db.add_all([MapaRio(rio_id=rio_id, cursor=cursor) for rio_id in rio_ids])
+    db.flush()
+
+
+def atualizar():
+    """
+    Refaz os clusters dos rios pendentes e avança o cursor dos demais, que não
+    tiveram alterações nas coletas até ele.
+    """
+    db = SessionLocal()
+    try:
+        cursor = derivados.cursor_atual(db)
+        desatualizados = derivados.pendentes(db, MapaRio)
+        recalcular(db, desatualizados)
+        derivados.avancar(db, MapaRio, cursor, desatualizados)
+        db.commit()
+        if desatualizados:
+            logger.info(f"Clusters do mapa recalculados para os rios {desatualizados}")
+    finally:
+        db.close()
+
+
+tarefa_atualizacao = TarefaUnica("mapa", atualizar)
+
+
+@eventos.inscrever_local
+def _agendar_atualizacao(alteracoes):
+    """Depois de uma ingestão, refaz em segundo plano os clusters dos rios afetados."""
+    if any(tabela in ("coletas", "coletas_parametros") for tabela, _ in alteracoes):
+        tarefa_atualizacao.agendar()
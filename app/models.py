@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, Table, Date
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, Table, Date, Boolean, ARRAY, false
+from sqlalchemy import DateTime, Index, JSON, BigInteger, DDL, Sequence, event, func
+from sqlalchemy import SmallInteger, UniqueConstraint, PrimaryKeyConstraint, LargeBinary, text
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -25,8 +27,25 @@ class Coleta(Base):
     datas = Column(Date, index=True)
     latitude = Column(Float)    # NOVO
     longitude = Column(Float) 
+    replica = Column(SmallInteger, nullable=False, default=1, server_default=text("1"))  # nº da réplica no mesmo ponto e data
+    seq_alteracao = Column(BigInteger, index=True)  # preenchido pelo gatilho de sincronização
     rio = relationship("Rio", back_populates="coletas")
-    coletas_parametros = relationship("ColetaParametro", back_populates="coletas")
+    # A junção inclui o rio para que a carga das medições leia só a partição dele
+    coletas_parametros = relationship(
+        "ColetaParametro", back_populates="coletas",
+        primaryjoin="and_(Coleta.id == ColetaParametro.coleta_id, Coleta.rio_id == ColetaParametro.rio_id)",
+        foreign_keys="[ColetaParametro.coleta_id, ColetaParametro.rio_id]",
+    )
+
+    # Identidade natural: reenviar a mesma coleta atualiza a existente em vez de duplicar
+    __table_args__ = (
+        UniqueConstraint(
+            "codigo", "rio_id", "datas", "locali", "replica",
+            name="uq_coletas_identidade", postgresql_nulls_not_distinct=True,
+        ),
+        # Consultas por rio (análises, mapa, sync por rio) filtram por rio_id e ordenam por data
+        Index("ix_coletas_rio_id_datas", "rio_id", "datas"),
+    )
 
 class Parametro(Base):
     __tablename__ = "parametros"
@@ -35,6 +54,7 @@ class Parametro(Base):
     nome = Column(String, nullable=False)
     #valor = Column(Float, nullable=False)
     categoria = Column(String, nullable=False)
+    seq_alteracao = Column(BigInteger, index=True)
 
    # coletas = relationship("Coleta", back_populates="parametro")
     coletas_parametros = relationship("ColetaParametro", back_populates="parametro")
@@ -42,14 +62,208 @@ class Parametro(Base):
 class ColetaParametro(Base):
     __tablename__ = "coletas_parametros"        #coletasparametros
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Particionada por HASH(rio_id) em PARTICOES_MEDICOES partições: as consultas de um
+    # rio leem uma partição só, e vacuum e manutenção de índices são feitos por partição.
+    # A chave de partição faz parte da chave primária e das restrições de unicidade.
+    # rio_id e datas não mudam depois de gravados: fazem parte da identidade da coleta.
+    id = Column(Integer, autoincrement=True, index=True)
+    rio_id = Column(Integer, ForeignKey("rios.id"), nullable=False)     # copiado da coleta
     parametro_id = Column(Integer, ForeignKey("parametros.id"))
     coleta_id = Column(Integer, ForeignKey("coletas.id"))
+    datas = Column(Date)                                                # copiado da coleta
     valor = Column(Float, nullable=False)
+    atipico = Column(Boolean, nullable=False, default=False, server_default=false())  # valor fora do histórico do rio
+    seq_alteracao = Column(BigInteger, index=True)
 
-    coletas = relationship("Coleta", back_populates="coletas_parametros")
+    coletas = relationship(
+        "Coleta", back_populates="coletas_parametros",
+        primaryjoin="and_(Coleta.id == ColetaParametro.coleta_id, Coleta.rio_id == ColetaParametro.rio_id)",
+        foreign_keys="[ColetaParametro.coleta_id, ColetaParametro.rio_id]",
+    )
     parametro = relationship("Parametro", back_populates="coletas_parametros")
 
+    __table_args__ = (
+        # Mesma ordem da migração 011: rio primeiro
+        PrimaryKeyConstraint("rio_id", "id", name="coletas_parametros_pkey"),
+        UniqueConstraint("rio_id", "coleta_id", "parametro_id", name="uq_coletas_parametros_coleta_parametro"),
+        # Índices de cobertura: as leituras por rio e por parâmetro saem só do índice,
+        # sem varrer a tabela nem buscar cada linha no heap
+        Index(
+            "ix_coletas_parametros_coleta_valores", "coleta_id",
+            postgresql_include=["parametro_id", "valor", "atipico"],
+        ),
+        Index(
+            "ix_coletas_parametros_parametro_coleta", "parametro_id", "coleta_id",
+            postgresql_include=["valor", "atipico"],
+        ),
+        # Série de um parametro em um rio, já em ordem de data, sem passar por coletas
+        Index(
+            "ix_coletas_parametros_rio_parametro_datas", "rio_id", "parametro_id", "datas",
+            postgresql_include=["valor", "atipico"],
+        ),
+        {"postgresql_partition_by": "HASH (rio_id)"},
+    )
+
+
+PARTICOES_MEDICOES = 16
+
+event.listen(ColetaParametro.__table__, "after_create", DDL("\n".join(
+    f"CREATE TABLE IF NOT EXISTS coletas_parametros_p{resto} PARTITION OF coletas_parametros "
+    f"FOR VALUES WITH (MODULUS {PARTICOES_MEDICOES}, REMAINDER {resto});"
+    for resto in range(PARTICOES_MEDICOES)
+)))
+
+
+class EstatisticaParametro(Base):
+    __tablename__ = "estatisticas_parametros"   # estatísticas robustas de cada série (rio, parametro)
+
+    rio_id = Column(Integer, ForeignKey("rios.id"), primary_key=True)
+    parametro_id = Column(Integer, ForeignKey("parametros.id"), primary_key=True)
+    n = Column(Integer, nullable=False, default=0)
+    media = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)      # soma dos quadrados dos desvios (Welford)
+    janela = Column(ARRAY(Float), nullable=False, default=list)  # últimos valores, para mediana e MAD
+
+
+class IndiceQualidade(Base):
+    __tablename__ = "indices_qualidade"          # IQA pré-calculado de cada coleta
+
+    coleta_id = Column(Integer, ForeignKey("coletas.id", ondelete="CASCADE"), primary_key=True)
+    rio_id = Column(Integer, ForeignKey("rios.id"))
+    datas = Column(Date)
+    iqa = Column(Float)                           # nulo quando faltam parametros para o índice
+    categoria = Column(String)
+    cobertura = Column(Float, nullable=False)     # fração do peso total do IQA que foi medida
+    componentes = Column(JSON)                    # qualidade (q) de cada componente usado
+    calculado_em = Column(DateTime, nullable=False, server_default=func.now())
+    seq_alteracao = Column(BigInteger, index=True)  # só para a versão da tabela (ETags)
+
+    __table_args__ = (Index("ix_indices_qualidade_rio_datas", "rio_id", "datas"),)
+
+
+class Tendencia(Base):
+    __tablename__ = "tendencias"                 # Mann-Kendall e Sen de cada série (rio, parametro)
+
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True)
+    parametro_id = Column(Integer, ForeignKey("parametros.id", ondelete="CASCADE"), primary_key=True)
+    dessazonalizado = Column(Boolean, primary_key=True)   # calculado sobre as anomalias mensais
+    n = Column(Integer, nullable=False)          # datas distintas da série
+    inicio = Column(Date)
+    fim = Column(Date)
+    s = Column(Float)                            # estatística S de Mann-Kendall
+    variancia = Column(Float)                    # variância de S corrigida para empates
+    z = Column(Float)
+    p_valor = Column(Float)
+    tau = Column(Float)                          # tau de Kendall
+    inclinacao = Column(Float)                   # estimador de Sen, em unidades por ano
+    intercepto = Column(Float)                   # valor da reta de Sen na data inicial
+    cursor = Column(BigInteger, nullable=False)  # última alteração (seq_alteracao) considerada
+    calculado_em = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class TendenciaRio(Base):
+    __tablename__ = "tendencias_rios"            # cursor em que as tendências do rio foram calculadas
+
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True)
+    cursor = Column(BigInteger, nullable=False)
+    calculado_em = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class UltimaMedicao(Base):
+    __tablename__ = "ultimas_medicoes"           # medição mais recente de cada (rio, parametro, local)
+
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True)
+    parametro_id = Column(Integer, ForeignKey("parametros.id", ondelete="CASCADE"), primary_key=True)
+    locali = Column(String, primary_key=True, server_default=text("''"))    # '' para coletas sem local
+    coleta_id = Column(Integer, ForeignKey("coletas.id", ondelete="CASCADE"), nullable=False)
+    datas = Column(Date)
+    valor = Column(Float, nullable=False)
+    atipico = Column(Boolean, nullable=False, default=False, server_default=false())
+    atualizado_em = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class Distribuicao(Base):
+    __tablename__ = "distribuicoes"              # esboço de quantis de cada (rio, parametro, mês), ver distribuicoes.py
+
+    parametro_id = Column(Integer, ForeignKey("parametros.id", ondelete="CASCADE"), primary_key=True)
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True)
+    mes = Column(Date, primary_key=True)                 # primeiro dia do mês
+    atipico = Column(Boolean, primary_key=True)          # valores atípicos ficam num esboço à parte
+    n = Column(Integer, nullable=False)
+    soma = Column(Float, nullable=False)
+    minimo = Column(Float, nullable=False)
+    maximo = Column(Float, nullable=False)
+    baldes = Column(ARRAY(Integer), nullable=False)      # chaves dos baldes logarítmicos, em ordem
+    contagens = Column(ARRAY(Integer), nullable=False)   # medições em cada balde
+
+
+class OrdemParametros(Base):
+    __tablename__ = "ordens_parametros"          # conjuntos de parametros das coletas compactas, ver compactas.py
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    parametros = Column(ARRAY(Integer), nullable=False, unique=True)    # ids em ordem crescente
+
+
+class ColetaCompacta(Base):
+    __tablename__ = "coletas_compactas"          # medições de cada coleta numa linha só, ver compactas.py
+
+    # Particionada como coletas_parametros: a coleta compacta fica na partição do mesmo resto
+    rio_id = Column(Integer, ForeignKey("rios.id"), primary_key=True)
+    coleta_id = Column(Integer, ForeignKey("coletas.id", ondelete="CASCADE"), primary_key=True)
+    datas = Column(Date)                                                # copiado da coleta
+    ordem_id = Column(Integer, ForeignKey("ordens_parametros.id"), nullable=False)
+    valores = Column(LargeBinary, nullable=False)    # formato (1 byte) + um valor por parametro da ordem
+    atipicos = Column(LargeBinary)                   # máscara de bits na ordem; nula sem atípicos
+
+    __table_args__ = ({"postgresql_partition_by": "HASH (rio_id)"},)
+
+
+class EstadoCompactas(Base):
+    __tablename__ = "estado_compactas"           # linha única (id 1): se coletas_compactas está completa
+
+    id = Column(Integer, primary_key=True)
+    completa = Column(Boolean, nullable=False, default=False)   # falsa após gravações sem compactar
+    compactada_em = Column(DateTime(timezone=True))               # último gerenciar.py compactar
+
+
+event.listen(ColetaCompacta.__table__, "after_create", DDL("\n".join(
+    f"CREATE TABLE IF NOT EXISTS coletas_compactas_p{resto} PARTITION OF coletas_compactas "
+    f"FOR VALUES WITH (MODULUS {PARTICOES_MEDICOES}, REMAINDER {resto});"
+    for resto in range(PARTICOES_MEDICOES)
+)))
+
+
+class MapaRio(Base):
+    __tablename__ = "mapa_rios"                  # cursor em que os clusters do rio foram calculados
+
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True)
+    cursor = Column(BigInteger, nullable=False)
+    calculado_em = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class MapaCluster(Base):
+    __tablename__ = "mapa_clusters"              # coletas agregadas por célula da grade de cada zoom
+
+    zoom = Column(SmallInteger, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True, index=True)
+    n = Column(Integer, nullable=False)
+    soma_latitude = Column(Float, nullable=False)    # para o centróide
+    soma_longitude = Column(Float, nullable=False)
+
+
+class MapaClusterParametro(Base):
+    __tablename__ = "mapa_clusters_parametros"   # medições agregadas por célula, para a média
+
+    parametro_id = Column(Integer, ForeignKey("parametros.id", ondelete="CASCADE"), primary_key=True)
+    zoom = Column(SmallInteger, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    rio_id = Column(Integer, ForeignKey("rios.id", ondelete="CASCADE"), primary_key=True, index=True)
+    n = Column(Integer, nullable=False)
+    soma = Column(Float, nullable=False)
+
 
 class Rio(Base):
     __tablename__ = "rios"
@@ -58,5 +272,118 @@ class Rio(Base):
     nome = Column(String, nullable=False)
     codigo = Column(String, nullable=False, unique=True) 
     descricao = Column(Text)  
+    seq_alteracao = Column(BigInteger, index=True)
+
+    coletas = relationship("Coleta", back_populates="rio")
+
+
+# ------------------ Sincronização com o app ------------------
+
+# Toda inserção ou atualização nestas tabelas recebe um número da sequência
+# seq_alteracoes, e toda exclusão deixa um registro em "exclusoes". O cliente
+# guarda o maior número que já recebeu e pede só o que veio depois (GET /sync).
+TABELAS_SINCRONIZADAS = ("rios", "parametros", "coletas", "coletas_parametros")
+
+# Tabelas cuja versão (ETags, ver versoes.py) sai da mesma sequência. indices_qualidade
+# é numerada, mas não vai para o app nem deixa lápides.
+TABELAS_VERSIONADAS = TABELAS_SINCRONIZADAS + ("indices_qualidade",)
+
+seq_alteracoes = Sequence("seq_alteracoes", metadata=Base.metadata)
+
+# Horizonte das alterações: todo número até ele já foi confirmado, e todo número
+# ainda não confirmado (ou futuro) é maior. Resultados derivados guardam esse valor
+# para saber, depois, se alguma linha de origem mudou desde que foram calculados, e
+# leitores incrementais (GET /sync, transmissão, snapshots) não passam dele. Deve
+# ser lido antes dos dados, numa instrução própria (ver horizonte_alteracoes).
+CURSOR_ALTERACOES_SQL = "SELECT horizonte_alteracoes()"
+
+
+class Exclusao(Base):
+    __tablename__ = "exclusoes"                  # lápides das linhas excluídas
+
+    seq = Column(BigInteger, primary_key=True)
+    tabela = Column(String, nullable=False)
+    registro_id = Column(Integer, nullable=False)
+    excluido_em = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (Index("ix_exclusoes_tabela_seq", "tabela", "seq"),)
+
+
+# Os números saem da sequência sem trava exclusiva, então transações simultâneas
+# gravam em paralelo e podem confirmar fora da ordem dos números. Para um cliente
+# nunca pular uma linha que ainda não estava visível quando ele leu, cada transação
+# registra, antes do primeiro número, uma trava consultiva compartilhada cuja chave
+# é MARCA_ALTERACOES + o último valor da sequência (todo número dela será maior).
+# horizonte_alteracoes lê a sequência e depois as travas registradas: o horizonte é
+# o menor desses valores, e tudo até ele já estava confirmado quando foi lido.
+MARCA_ALTERACOES = 2 ** 62      # separa estas chaves das de hashtext() usadas em outras travas
+
+FUNCOES_SINCRONIZACAO = f"""
+CREATE OR REPLACE FUNCTION registrar_transacao_alteracao() RETURNS void AS $$
+BEGIN
+    IF current_setting('alteracoes.registrada', true) IS DISTINCT FROM 'sim' THEN
+        PERFORM pg_advisory_xact_lock_shared({MARCA_ALTERACOES} + (
+            SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM seq_alteracoes
+        ));
+        PERFORM set_config('alteracoes.registrada', 'sim', true);
+    END IF;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_alteracao() RETURNS trigger AS $$
+BEGIN
+    PERFORM registrar_transacao_alteracao();
+    NEW.seq_alteracao := nextval('seq_alteracoes');
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+-- Em tabelas particionadas o gatilho roda na partição: o nome lógico vem no argumento
+CREATE OR REPLACE FUNCTION registrar_exclusao() RETURNS trigger AS $$
+BEGIN
+    PERFORM registrar_transacao_alteracao();
+    INSERT INTO exclusoes (seq, tabela, registro_id)
+    VALUES (nextval('seq_alteracoes'), coalesce(TG_ARGV[0], TG_TABLE_NAME), OLD.id);
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+-- A sequência é lida antes das travas: um número que ela já tinha dado pertence a
+-- uma transação confirmada ou a uma que já registrou a trava
+CREATE OR REPLACE FUNCTION horizonte_alteracoes() RETURNS bigint AS $$
+DECLARE
+    ultimo bigint;
+    aberta bigint;
+BEGIN
+    SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END INTO ultimo FROM seq_alteracoes;
+    SELECT min(((classid::bigint << 32) | objid::bigint) - {MARCA_ALTERACOES}) INTO aberta
+    FROM pg_locks
+    WHERE locktype = 'advisory' AND objsubid = 1 AND classid::bigint >= {MARCA_ALTERACOES >> 32}
+      AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+    RETURN least(ultimo, aberta);
+END $$ LANGUAGE plpgsql VOLATILE;
+"""
+
+GATILHOS_SINCRONIZACAO = "\n".join(
+    f"""
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'tg_{tabela}_alteracao' AND tgrelid = '{tabela}'::regclass
+    ) THEN
+        CREATE TRIGGER tg_{tabela}_alteracao BEFORE INSERT OR UPDATE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+        CREATE TRIGGER tg_{tabela}_exclusao AFTER DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION registrar_exclusao('{tabela}');
+    END IF;
+END $$;"""
+    for tabela in TABELAS_SINCRONIZADAS
+) + """
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'tg_indices_qualidade_alteracao' AND tgrelid = 'indices_qualidade'::regclass
+    ) THEN
+        CREATE TRIGGER tg_indices_qualidade_alteracao BEFORE INSERT OR UPDATE ON indices_qualidade
+            FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+    END IF;
+END $$;"""
 
-    coletas = relationship("Coleta", back_populates="rio")
\ No newline at end of file
+event.listen(Base.metadata, "after_create", DDL(FUNCOES_SINCRONIZACAO + GATILHOS_SINCRONIZACAO))
\ No newline at end of file
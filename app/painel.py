@@ -0,0 +1,105 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import Rio
+
+# Tudo o que a tela de um rio mostra, em três consultas agrupadas por parâmetro
+# (em vez de /resumo e /grafico chamados um parâmetro de cada vez).
+
+COLETAS_SQL = """
+SELECT count(*), min(datas), max(datas) FROM coletas WHERE rio_id = :rio_id
+"""
+
+RESUMOS_SQL = """
+SELECT cp.parametro_id, p.nome, p.categoria,
+       count(*) AS n, avg(cp.valor) AS media, min(cp.valor) AS minimo, max(cp.valor) AS maximo,
+       stddev_samp(cp.valor) AS desvio_padrao,
+       count(*) FILTER (WHERE cp.atipico) AS atipicos,
+       min(c.datas) AS primeira_data, max(c.datas) AS ultima_data,
+       (array_agg(cp.valor ORDER BY c.datas DESC NULLS LAST, c.id DESC))[1] AS ultimo_valor,
+       (array_agg(c.datas ORDER BY c.datas DESC NULLS LAST, c.id DESC))[1] AS ultimo_data,
+       (array_agg(c.codigo ORDER BY c.datas DESC NULLS LAST, c.id DESC))[1] AS ultimo_coleta
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id
+JOIN parametros p ON p.id = cp.parametro_id
+WHERE cp.rio_id = :rio_id {filtro}
+GROUP BY cp.parametro_id, p.nome, p.categoria
+ORDER BY p.nome
+"""
+
+# Média por data e, quando a série tem mais datas que :pontos, agrupamento em
+# :pontos faixas de tempo iguais; mínimo e máximo de cada faixa preservam os picos.
+SERIES_SQL = """
+WITH por_data AS (
+    SELECT cp.parametro_id, cp.datas, avg(cp.valor) AS valor
+    FROM coletas_parametros cp
+    WHERE cp.rio_id = :rio_id AND cp.datas IS NOT NULL {filtro}
+    GROUP BY cp.parametro_id, cp.datas
+),
+numerada AS (
+    SELECT parametro_id, datas, valor,
+           row_number() OVER (PARTITION BY parametro_id ORDER BY datas) - 1 AS ordem,
+           count(*) OVER (PARTITION BY parametro_id) AS total,
+           min(datas) OVER (PARTITION BY parametro_id) AS inicio,
+           max(datas) OVER (PARTITION BY parametro_id) AS fim
+    FROM por_data
+)
+SELECT parametro_id, min(datas) AS data, avg(valor) AS media,
+       min(valor) AS minimo, max(valor) AS maximo, count(*) AS n
+FROM numerada
+GROUP BY parametro_id, CASE
+    WHEN total <= :pontos THEN ordem
+    ELSE least(floor((datas - inicio)::float / (fim - inicio + 1) * :pontos), :pontos - 1)
+END
+ORDER BY parametro_id, data
+"""
+
+
+def _data(valor):
+    return valor.isoformat() if valor is not None else None
+
+
+def montar(db: Session, rio: Rio, pontos: int, excluir_atipicos: bool = False) -> dict:
+    """
+    Monta o painel de um rio: dados do rio, parâmetros coletados com último valor,
+    resumo estatístico e série reduzida a no máximo `pontos` pontos.
+    """
+    filtro = "AND NOT cp.atipico" if excluir_atipicos else ""
+    argumentos = {"rio_id": rio.id, "pontos": pontos}
+
+    total, primeira, ultima = db.execute(text(COLETAS_SQL), argumentos).one()
+    resumos = db.execute(text(RESUMOS_SQL.format(filtro=filtro)), argumentos).all()
+
+    series = {}
+    for parametro_id, data, media, minimo, maximo, n in db.execute(
+        text(SERIES_SQL.format(filtro=filtro)), argumentos
+    ):
+        series.setdefault(parametro_id, []).append({
+            "data": _data(data), "media": media, "minimo": minimo, "maximo": maximo, "n": n,
+        })
+
+    return {
+        "rio": {"id": rio.id, "nome": rio.nome, "codigo": rio.codigo, "descricao": rio.descricao},
+        "coletas": total,
+        "primeira_data": _data(primeira),
+        "ultima_data": _data(ultima),
+        "parametros": [
+            {
+                "id": r.parametro_id,
+                "nome": r.nome,
+                "categoria": r.categoria,
+                "ultimo": {"valor": r.ultimo_valor, "data": _data(r.ultimo_data), "coleta": r.ultimo_coleta},
+                "resumo": {
+                    "n": r.n,
+                    "media": r.media,
+                    "minimo": r.minimo,
+                    "maximo": r.maximo,
+                    "desvio_padrao": r.desvio_padrao,
+                    "atipicos": r.atipicos,
+                    "primeira_data": _data(r.primeira_data),
+                    "ultima_data": _data(r.ultima_data),
+                },
+                "serie": series.get(r.parametro_id, []),
+            }
+            for r in resumos
+        ],
+    }
@@ -0,0 +1,152 @@
+import time
+from contextvars import ContextVar
+from threading import Lock
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import SessionLocal, SessionReplica, engine, engine_replica
+from configuracao import configuracoes, logger
+import eventos
+import versoes
+
+# Roteamento das leituras entre o primário e a réplica de streaming.
+#
+# Uma sessão de leitura vai para a réplica só quando ela já reproduziu tudo o que
+# quem pergunta precisa ver:
+#   - o atraso da réplica está dentro de ATRASO_MAXIMO_REPLICA_SEGUNDOS;
+#   - a posição do WAL da última escrita do cliente (cookie/cabeçalho devolvido
+#     depois de cada escrita) já foi reproduzida: o cliente lê o que escreveu;
+#   - a posição das versões das tabelas também: um ETag nunca descreve dados
+#     mais novos que o corpo servido junto com ele.
+# Em qualquer outro caso, ou se a réplica não responde, a leitura vai ao primário.
+
+COOKIE_POSICAO = "posicao_escrita"
+CABECALHO_POSICAO = "X-Posicao-Escrita"
+VALIDADE_POSICAO_SEGUNDOS = 300
+
+ESTADO_REPLICA_SQL = """
+SELECT (pg_last_wal_replay_lsn() - '0/0')::bigint,
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+       END
+"""
+
+_estado = None      # (consultado_em, posição reproduzida, atraso em segundos)
+_trava = Lock()
+
+# Escritas confirmadas durante a requisição atual (preenchido pelo ouvinte de eventos)
+_escritas = ContextVar("escritas_da_requisicao", default=None)
+
+
+def estado_replica(atualizar: bool = False):
+    """
+    Retorna (posição reproduzida, atraso em segundos) da réplica, ou (None, None)
+    se ela não está configurada ou não respondeu. Sem `atualizar`, consulta a
+    réplica no máximo uma vez a cada VALIDADE_ESTADO_REPLICA_SEGUNDOS.
+    """
+    global _estado
+    if engine_replica is None:
+        return None, None
+    with _trava:
+        if (
+            not atualizar and _estado is not None
+            and time.monotonic() - _estado[0] < configuracoes.VALIDADE_ESTADO_REPLICA_SEGUNDOS
+        ):
+            return _estado[1:]
+        posicao = atraso = None
+        try:
+            with engine_replica.connect() as conexao:
+                posicao, atraso = conexao.execute(text(ESTADO_REPLICA_SQL)).one()
+            if posicao is None:
+                logger.warning("CONEXAO_REPLICA não aponta para uma réplica em recuperação")
+        except Exception as e:
+            logger.warning(f"Réplica indisponível, leituras no primário: {str(e)}")
+        _estado = (time.monotonic(), posicao, float(atraso) if atraso is not None else None)
+        return _estado[1:]
+
+
+def _posicao_do_cliente(request: Request) -> int:
+    valor = request.headers.get(CABECALHO_POSICAO) or request.cookies.get(COOKIE_POSICAO)
+    try:
+        return int(valor) if valor else 0
+    except ValueError:
+        return 0
+
+
+def usar_replica(request: Request, posicao_minima: int = 0) -> bool:
+    posicao, atraso = estado_replica()
+    if posicao is None or atraso is None or atraso > configuracoes.ATRASO_MAXIMO_REPLICA_SEGUNDOS:
+        return False
+    posicao_versoes = versoes.posicao()
+    if posicao_versoes is None:
+        return False
+    exigida = max(posicao_versoes, _posicao_do_cliente(request), posicao_minima)
+    if exigida > posicao:
+        # A posição guardada pode ter até um segundo; a réplica costuma já estar adiante
+        posicao, _ = estado_replica(atualizar=True)
+    return posicao is not None and exigida <= posicao
+
+
+def sessao_leitura(request: Request, posicao_minima: int = 0) -> Session:
+    """
+    posicao_minima: posição do WAL do primário que a réplica precisa ter reproduzido,
+    além das de usar_replica (por exemplo, a lida junto com um horizonte de alterações).
+    """
+    return SessionReplica() if usar_replica(request, posicao_minima) else SessionLocal()
+
+
+def get_db_leitura(request: Request):
+    """
+    Sessão para rotas que só leem: usa a réplica quando ela está em dia com o que
+    o cliente precisa ver e o primário caso contrário.
+    """
+    db = sessao_leitura(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ------------------ Leia o que escreveu ------------------
+
+@eventos.inscrever
+def _marcar_escrita(alteracoes):
+    escritas = _escritas.get()
+    if escritas is not None:
+        escritas.append(alteracoes)
+
+
+def marcar_escrita():
+    """
+    Para escritas confirmadas em outra thread em nome da requisição atual (gravação
+    agrupada): os ouvintes de eventos rodam lá, fora do contexto da requisição.
+    """
+    _marcar_escrita([("coletas", None)])
+
+
+def _posicao_primario() -> int:
+    with engine.connect() as conexao:
+        return conexao.execute(text(versoes.POSICAO_WAL_SQL)).scalar()
+
+
+async def fixar_leituras_apos_escrita(request: Request, call_next):
+    """
+    Middleware: depois de uma requisição que confirmou escritas, devolve ao cliente
+    a posição do WAL do primário. Enquanto a réplica não a reproduzir, as leituras
+    desse cliente vão ao primário.
+    """
+    escritas = []
+    token = _escritas.set(escritas)
+    try:
+        resposta = await call_next(request)
+    finally:
+        _escritas.reset(token)
+
+    if escritas and engine_replica is not None:
+        posicao = str(await run_in_threadpool(_posicao_primario))
+        resposta.headers[CABECALHO_POSICAO] = posicao
+        resposta.set_cookie(
+            COOKIE_POSICAO, posicao, max_age=VALIDADE_POSICAO_SEGUNDOS, httponly=True, samesite="lax"
+        )
+    return resposta
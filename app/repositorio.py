@@ -1,13 +1,41 @@
+from types import SimpleNamespace
+from fastapi import HTTPException
+from sqlalchemy import literal_column, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-import models, seguranca
+from starlette.concurrency import run_in_threadpool
+import models
+import senhas
+import atipicos
+import iqa
+import ultimas
+import distribuicoes
+import compactas
+import eventos
+from configuracao import configuracoes
 from typing import List
 from pydantic import BaseModel, EmailStr
 
+# ------------------ Consultas comuns às rotas ------------------
+
+
+def obter_rio(db: Session, rio: str) -> models.Rio:
+    """
+    Busca o rio pelo código ou, se não houver, pelo nome exato.
+
+    Raises:
+        HTTPException: 404 - Rio não encontrado.
+    """
+    db_rio = db.query(models.Rio).filter(or_(models.Rio.codigo == rio, models.Rio.nome == rio)).first()
+    if db_rio is None:
+        raise HTTPException(status_code=404, detail="Rio não encontrado")
+    return db_rio
+
+
 # ------------------ CRUD Usuário ------------------
 
 
-def criar_usuario(db: Session, usuario: BaseModel):
-    senha_hash = seguranca.gerar_senha_hash(usuario.senha)
+def _gravar_usuario(db: Session, usuario: BaseModel, senha_hash: str):
     novo_usuario = models.Usuario(
         nome=usuario.nome, email=usuario.email, senha_hash=senha_hash
     )
@@ -17,6 +45,12 @@ def criar_usuario(db: Session, usuario: BaseModel):
     return novo_usuario
 
 
+async def criar_usuario(db: Session, usuario: BaseModel):
+    # O hash roda no pool de senhas; só a gravação usa o threadpool
+    senha_hash = await senhas.gerar_hash(usuario.senha)
+    return await run_in_threadpool(_gravar_usuario, db, usuario, senha_hash)
+
+
 def obter_usuario_por_id(db: Session, usuario_id: int):
     return db.query(models.Usuario).filter(models.Usuario.id == usuario_id).first()
 
@@ -45,17 +79,223 @@ def deletar_usuario(db: Session, usuario_id: int):
     return True
 
 
-def autenticar_usuario(db: Session, email: str, senha: str):
-    usuario = db.query(models.Usuario).filter(models.Usuario.email == email).first()
-    if usuario and seguranca.verificar_senha(senha, usuario.senha_hash):
-        return usuario
-    return None
+def _buscar_usuario_para_login(db: Session, email: str):
+    usuario = obter_usuario_por_email(db, email)
+    # Devolve a conexão ao pool antes do bcrypt; o objeto continua com os dados lidos
+    db.close()
+    return usuario
+
+
+def _atualizar_senha_hash(db: Session, usuario_id: int, senha_hash: str):
+    db.query(models.Usuario).filter(models.Usuario.id == usuario_id).update(
+        {models.Usuario.senha_hash: senha_hash}
+    )
+    db.commit()
+
+
+async def autenticar_usuario(db: Session, email: str, senha: str):
+    usuario = await run_in_threadpool(_buscar_usuario_para_login, db, email)
+    if not usuario:
+        return None
+    confere, novo_hash = await senhas.verificar(senha, usuario.senha_hash)
+    if not confere:
+        return None
+    if novo_hash:
+        # Hash gerado com outro custo: troca pelo atual aproveitando a senha em claro
+        await run_in_threadpool(_atualizar_senha_hash, db, usuario.id, novo_hash)
+    return usuario
 
 
 def obter_usuarios(db: Session) -> List[models.Usuario]:
     return db.query(models.Usuario).all()
 
 
+# ------------------ Coletas ------------------
+
+
+class ReferenciaInvalida(ValueError):
+    """Coleta aponta para um rio ou parametro inexistente."""
+
+
+TAMANHO_LOTE = 1000
+
+# Nas linhas devolvidas por um upsert, xmax = 0 indica inserção (e não atualização)
+_INSERIDA = literal_column("xmax = 0").label("inserida")
+
+
+def referencias_invalidas(db: Session, coletas) -> tuple:
+    """Ids de rios e de parametros citados pelas coletas que não existem, em duas consultas."""
+    rio_ids = {c.rio_id for c in coletas}
+    encontrados = {r for (r,) in db.query(models.Rio.id).filter(models.Rio.id.in_(rio_ids))}
+    rios = rio_ids - encontrados
+
+    parametro_ids = {cp.parametro_id for c in coletas for cp in c.coletas_parametros}
+    encontrados = {
+        p for (p,) in db.query(models.Parametro.id).filter(models.Parametro.id.in_(parametro_ids))
+    }
+    return rios, parametro_ids - encontrados
+
+
+def _validar_referencias(db: Session, coletas):
+    rios, parametros = referencias_invalidas(db, coletas)
+    if rios:
+        raise ReferenciaInvalida(f"Rio não encontrado: {sorted(rios)}")
+    if parametros:
+        raise ReferenciaInvalida(f"Parametro não encontrado: {sorted(parametros)}")
+
+
+def _identidade(coleta) -> tuple:
+    return (coleta.codigo, coleta.rio_id, coleta.datas, coleta.locali, coleta.replica)
+
+
+def ingerir_coletas(db: Session, coletas: List[BaseModel]) -> dict:
+    """
+    Grava um lote de coletas e medições de forma idempotente.
+
+    Coletas são identificadas por (codigo, rio_id, datas, locali, replica) e medições
+    por (coleta, parametro). Tudo é gravado com INSERT ... ON CONFLICT em lotes; linhas
+    que já existem com os mesmos valores não são reescritas, então reenviar uma
+    campanha não duplica nada e quase não gera escrita. Só as medições novas ou
+    alteradas passam pela detecção de atípicos e pelo recálculo do IQA.
+
+    Returns:
+        Contagens de coletas e medições inseridas, atualizadas e inalteradas, e o
+        id de cada coleta na ordem recebida.
+
+    Raises:
+        ReferenciaInvalida: rio ou parametro inexistente.
+    """
+    _validar_referencias(db, coletas)
+
+    # Identidades repetidas no próprio lote: a última ocorrência de cada valor vence
+    lote = {}
+    for coleta in coletas:
+        anterior = lote.get(_identidade(coleta))
+        medicoes = anterior[1] if anterior else {}
+        medicoes.update({cp.parametro_id: cp.valor for cp in coleta.coletas_parametros})
+        lote[_identidade(coleta)] = (coleta, medicoes)
+
+    # 1. Coletas: atualiza só coordenadas que mudaram
+    ids = {}
+    rio_da_coleta = {}
+    coletas_alteradas = set()
+    inseridas = 0
+    chaves = list(lote)
+    for inicio in range(0, len(chaves), TAMANHO_LOTE):
+        parte = chaves[inicio:inicio + TAMANHO_LOTE]
+        comando = insert(models.Coleta).values([
+            lote[chave][0].dict(exclude={"coletas_parametros"}) for chave in parte
+        ])
+        comando = comando.on_conflict_do_update(
+            constraint="uq_coletas_identidade",
+            set_={"latitude": comando.excluded.latitude, "longitude": comando.excluded.longitude},
+            where=or_(
+                models.Coleta.latitude.is_distinct_from(comando.excluded.latitude),
+                models.Coleta.longitude.is_distinct_from(comando.excluded.longitude),
+            ),
+        ).returning(models.Coleta.id, _INSERIDA)
+        for coleta_id, inserida in db.execute(comando):
+            coletas_alteradas.add(coleta_id)
+            inseridas += inserida
+
+        identidade = tuple_(
+            models.Coleta.codigo, models.Coleta.rio_id, models.Coleta.datas,
+            models.Coleta.locali, models.Coleta.replica,
+        )
+        for coleta_id, rio_id, *chave in db.query(
+            models.Coleta.id, models.Coleta.rio_id, models.Coleta.codigo, models.Coleta.rio_id,
+            models.Coleta.datas, models.Coleta.locali, models.Coleta.replica,
+        ).filter(identidade.in_(parte)):
+            ids[tuple(chave)] = coleta_id
+            rio_da_coleta[coleta_id] = rio_id
+
+    # 2. Medições: compara com o que já está gravado para achar o que é novo ou mudou
+    gravadas = {}
+    coleta_ids = list(rio_da_coleta)
+    rio_ids = set(rio_da_coleta.values())   # limita a leitura às partições dos rios do lote
+    for inicio in range(0, len(coleta_ids), TAMANHO_LOTE):
+        for coleta_id, parametro_id, valor in db.query(
+            models.ColetaParametro.coleta_id, models.ColetaParametro.parametro_id,
+            models.ColetaParametro.valor,
+        ).filter(
+            models.ColetaParametro.rio_id.in_(rio_ids),
+            models.ColetaParametro.coleta_id.in_(coleta_ids[inicio:inicio + TAMANHO_LOTE]),
+        ):
+            gravadas[(coleta_id, parametro_id)] = valor
+
+    novas = []
+    total_medicoes = 0
+    for chave, (coleta, medicoes) in lote.items():
+        coleta_id = ids[chave]
+        total_medicoes += len(medicoes)
+        for parametro_id, valor in medicoes.items():
+            if gravadas.get((coleta_id, parametro_id), None) != valor:
+                novas.append(SimpleNamespace(
+                    coleta_id=coleta_id, parametro_id=parametro_id, valor=valor,
+                    rio_id=rio_da_coleta[coleta_id], datas=coleta.datas,
+                    atipico=False, existia=(coleta_id, parametro_id) in gravadas,
+                    anterior=gravadas.get((coleta_id, parametro_id)),
+                ))
+
+    por_rio = {}
+    for medicao in novas:
+        por_rio.setdefault(rio_da_coleta[medicao.coleta_id], []).append(medicao)
+    for rio_id, medicoes in por_rio.items():
+        atipicos.avaliar_medicoes(db, rio_id, medicoes)
+
+    for inicio in range(0, len(novas), TAMANHO_LOTE):
+        comando = insert(models.ColetaParametro).values([
+            {
+                "coleta_id": m.coleta_id, "parametro_id": m.parametro_id, "valor": m.valor,
+                "atipico": m.atipico, "rio_id": m.rio_id, "datas": m.datas,
+            }
+            for m in novas[inicio:inicio + TAMANHO_LOTE]
+        ])
+        db.execute(comando.on_conflict_do_update(
+            constraint="uq_coletas_parametros_coleta_parametro",
+            set_={"valor": comando.excluded.valor, "atipico": comando.excluded.atipico},
+            where=models.ColetaParametro.valor.is_distinct_from(comando.excluded.valor),
+        ))
+    ultimas.atualizar(db, novas)
+    distribuicoes.atualizar(db, novas)
+    if configuracoes.ARMAZENAMENTO_COMPACTO:
+        compactas.atualizar(db, novas)
+    else:
+        compactas.marcar_incompleta(db)
+
+    coletas_alteradas.update(m.coleta_id for m in novas)
+    for coleta_id in coletas_alteradas:
+        eventos.registrar_alteracao(db, "coletas", rio_da_coleta[coleta_id])
+    for rio_id in por_rio:
+        eventos.registrar_alteracao(db, "coletas_parametros", rio_id)
+    iqa.recalcular(db, coletas_alteradas)
+
+    medicoes_inseridas = sum(1 for m in novas if not m.existia)
+    return {
+        "coletas": {
+            "inseridas": inseridas,
+            "atualizadas": len(coletas_alteradas) - inseridas,
+            "inalteradas": len(lote) - len(coletas_alteradas),
+        },
+        "medicoes": {
+            "inseridas": medicoes_inseridas,
+            "atualizadas": len(novas) - medicoes_inseridas,
+            "inalteradas": total_medicoes - len(novas),
+        },
+        "atipicos": sum(1 for m in novas if m.atipico),
+        "ids": [ids[_identidade(c)] for c in coletas],
+    }
+
+
+def criar_coleta(db: Session, coleta: BaseModel):
+    """
+    Grava uma coleta; se ela já existir (mesma identidade), atualiza as medições.
+    """
+    resultado = ingerir_coletas(db, [coleta])
+    db.commit()
+    return db.query(models.Coleta).filter(models.Coleta.id == resultado["ids"][0]).one()
+
+
 # # ------------------ CRUD Produto ------------------
 
 
@@ -0,0 +1,383 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date
+import numpy as np
+from models import Rio as ModelRio
+from models import Parametro as ModelParametro
+from models import ColetaParametro as ModelColetaParametro
+from models import Coleta as ModelColeta
+from models import IndiceQualidade
+from models import Tendencia, TendenciaRio
+from database import get_db
+from replica import get_db_leitura
+from versoes import Condicional
+from cache import CachePorRio
+from configuracao import logger
+from repositorio import obter_rio
+from seguranca import exigir_chave_api
+import analise
+import atipicos
+import iqa
+import tendencias
+import derivados
+import distribuicoes
+import climatologias
+
+analise_router = APIRouter(prefix="/analise")
+
+cache_correlacoes = CachePorRio("correlacoes")
+cache_climatologias = CachePorRio("climatologias")
+
+
+def _matriz_para_lista(matriz):
+    return [[None if np.isnan(v) else round(float(v), 6) for v in linha] for linha in matriz]
+
+
+@analise_router.get("/correlacao", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_correlacao(
+    rio: str,
+    metodo: str = Query("pearson", pattern="^(pearson|spearman)$"),
+    minimo: int = Query(3, ge=2, description="Mínimo de coletas em comum para correlacionar um par"),
+    excluir_atipicos: bool = False,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna a matriz de correlação entre os parametros coletados em um rio.
+
+    Cada par de parametros usa apenas as coletas em que ambos foram medidos.
+    O resultado fica em cache até que novas coletas do rio sejam registradas.
+
+    Args:
+        rio: Código ou nome do rio.
+        metodo: "pearson" ou "spearman".
+        minimo: Pares com menos coletas em comum que isso retornam null.
+        excluir_atipicos: Ignora os valores marcados como atípicos.
+
+    Raises:
+        HTTPException: 404 - Rio não encontrado ou sem coletas.
+    """
+    db_rio = obter_rio(db, rio)
+
+    resultado = cache_correlacoes.obter(db_rio.id, (metodo, minimo, excluir_atipicos))
+    if resultado is not None:
+        return resultado
+    geracao = cache_correlacoes.geracao(db_rio.id)
+
+    linhas = db.query(
+        ModelColetaParametro.coleta_id,
+        ModelColetaParametro.parametro_id,
+        ModelColetaParametro.valor
+    ).filter(
+        ModelColetaParametro.rio_id == db_rio.id
+    )
+    if excluir_atipicos:
+        linhas = linhas.filter(ModelColetaParametro.atipico.is_(False))
+    linhas = linhas.all()
+
+    if not linhas:
+        raise HTTPException(status_code=404, detail=f"Nenhuma coleta encontrada no rio '{db_rio.nome}'.")
+
+    coleta_ids, parametro_ids, valores = zip(*linhas)
+    matriz, coletas, parametros = analise.pivotar(coleta_ids, parametro_ids, valores)
+    correlacao, n = analise.correlacionar(matriz, metodo)
+    correlacao[n < minimo] = np.nan
+
+    nomes = dict(
+        db.query(ModelParametro.id, ModelParametro.nome)
+        .filter(ModelParametro.id.in_(parametros.tolist()))
+        .all()
+    )
+
+    resultado = {
+        "rio": db_rio.nome,
+        "metodo": metodo,
+        "coletas": len(coletas),
+        "parametros": [nomes.get(int(p)) for p in parametros],
+        "correlacao": _matriz_para_lista(correlacao),
+        "n": n.tolist(),
+    }
+    return cache_correlacoes.guardar(db_rio.id, resultado, (metodo, minimo, excluir_atipicos), geracao)
+
+
+@analise_router.post("/atipicos/recalcular", dependencies=[Depends(exigir_chave_api)])
+def recalcular_atipicos(db: Session = Depends(get_db)):
+    """
+    Reavalia todas as medições do acervo e atualiza as marcações de valores atípicos.
+    """
+    resultado = atipicos.recalcular(db)
+    db.commit()
+    logger.info(f"Valores atípicos recalculados: {resultado}")
+    return resultado
+
+
+@analise_router.get("/iqa", dependencies=[Depends(Condicional("rios", "coletas", "coletas_parametros", "indices_qualidade"))])
+def get_iqa(
+    rio: str,
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna o Índice de Qualidade da Água (IQA) pré-calculado das coletas de um rio.
+
+    Args:
+        rio: Código ou nome do rio.
+        inicio: Data inicial (inclusive) das coletas.
+        fim: Data final (inclusive) das coletas.
+
+    Raises:
+        HTTPException: 404 - Rio não encontrado.
+    """
+    db_rio = obter_rio(db, rio)
+
+    indices = db.query(
+        IndiceQualidade, ModelColeta.codigo, ModelColeta.locali
+    ).join(
+        ModelColeta, ModelColeta.id == IndiceQualidade.coleta_id
+    ).filter(
+        IndiceQualidade.rio_id == db_rio.id
+    )
+    if inicio is not None:
+        indices = indices.filter(IndiceQualidade.datas >= inicio)
+    if fim is not None:
+        indices = indices.filter(IndiceQualidade.datas <= fim)
+    indices = indices.order_by(IndiceQualidade.datas, IndiceQualidade.coleta_id).all()
+
+    return {
+        "rio": db_rio.nome,
+        "indices": [
+            {
+                "coleta": codigo,
+                "local": local,
+                "data": indice.datas.isoformat() if indice.datas else None,
+                "iqa": indice.iqa,
+                "categoria": indice.categoria,
+                "cobertura": indice.cobertura,
+                "componentes": indice.componentes,
+            }
+            for indice, codigo, local in indices
+        ],
+    }
+
+
+@analise_router.post("/iqa/recalcular", dependencies=[Depends(exigir_chave_api)])
+def recalcular_iqa(db: Session = Depends(get_db)):
+    """
+    Recalcula o IQA de todas as coletas em um único lote.
+    """
+    calculados = iqa.recalcular(db)
+    db.commit()
+    logger.info(f"IQA recalculado para {calculados} coletas")
+    return {"coletas": calculados}
+
+
+@analise_router.get("/tendencias", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_tendencias(
+    response: Response,
+    rio: Optional[str] = None,
+    parametro: Optional[str] = None,
+    dessazonalizar: bool = False,
+    alfa: float = Query(0.05, gt=0, lt=1, description="Nível de significância do teste"),
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna a tendência de cada série (rio, parametro): teste de Mann-Kendall e
+    inclinação de Sen, em unidades do parametro por ano.
+
+    Os resultados ficam gravados e são recalculados em segundo plano após cada
+    ingestão, só para os rios com coletas alteradas; até isso terminar, a resposta
+    mostra o cálculo anterior e não é cacheável.
+
+    Args:
+        rio: Código ou nome do rio (todos, se omitido).
+        parametro: Nome do parametro (todos, se omitido).
+        dessazonalizar: Usa as anomalias em relação à média de cada mês do ano.
+        alfa: Séries com p-valor abaixo disso são classificadas como "aumento" ou "queda".
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado.
+    """
+    if rio is not None:
+        rio_ids = [obter_rio(db, rio).id]
+    else:
+        rio_ids = [r for r, in db.query(ModelRio.id)]
+
+    # Normalmente a ingestão já agendou o recálculo; isto cobre escritas feitas fora da API.
+    # Enquanto ele não termina, a resposta não leva ETag para não ser guardada pelo cliente
+    if derivados.atrasado(db, TendenciaRio):
+        tendencias.tarefa_atualizacao.agendar()
+        for cabecalho in ("ETag", "Last-Modified"):
+            del response.headers[cabecalho]
+        response.headers["Cache-Control"] = "no-store"
+
+    consulta = db.query(Tendencia, ModelRio.nome, ModelParametro.nome).join(
+        ModelRio, ModelRio.id == Tendencia.rio_id
+    ).join(
+        ModelParametro, ModelParametro.id == Tendencia.parametro_id
+    ).filter(
+        Tendencia.rio_id.in_(rio_ids),
+        Tendencia.dessazonalizado.is_(dessazonalizar),
+    )
+    if parametro is not None:
+        consulta = consulta.filter(ModelParametro.nome == parametro)
+    linhas = consulta.order_by(ModelRio.nome, ModelParametro.nome).all()
+    if parametro is not None and not linhas:
+        raise HTTPException(status_code=404, detail=f"Parametro '{parametro}' não encontrado.")
+
+    def classificar(t):
+        if t.p_valor is None:
+            return "dados insuficientes"
+        if t.p_valor >= alfa:
+            return "sem tendência"
+        return "aumento" if t.s > 0 else "queda"
+
+    return [
+        {
+            "rio": nome_rio,
+            "parametro": nome_parametro,
+            "n": t.n,
+            "inicio": t.inicio.isoformat() if t.inicio else None,
+            "fim": t.fim.isoformat() if t.fim else None,
+            "s": t.s,
+            "z": t.z,
+            "p_valor": t.p_valor,
+            "tau": t.tau,
+            "inclinacao_anual": t.inclinacao,
+            "intercepto": t.intercepto,
+            "tendencia": classificar(t),
+        }
+        for t, nome_rio, nome_parametro in linhas
+    ]
+
+
+@analise_router.post("/tendencias/recalcular", dependencies=[Depends(exigir_chave_api)])
+def recalcular_tendencias(db: Session = Depends(get_db)):
+    """
+    Recalcula as tendências de todas as séries de todos os rios.
+    """
+    series = tendencias.recalcular(db, [r for r, in db.query(ModelRio.id)])
+    db.commit()
+    logger.info(f"Tendências recalculadas para {series} séries")
+    return {"series": series}
+
+
+@analise_router.get("/distribuicao", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_distribuicao(
+    parametro: str,
+    rio: Optional[List[str]] = Query(None, description="Código ou nome; repita para mesclar rios (todos, se omitido)"),
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    quantis: List[float] = Query([0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]),
+    faixas: int = Query(20, ge=1, le=200, description="Intervalos do histograma"),
+    excluir_atipicos: bool = False,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna quantis e histograma de um parametro, mesclando os esboços mensais
+    mantidos pela ingestão (sem ler as medições).
+
+    Os quantis têm erro relativo de no máximo "erro_relativo"; n, média, mínimo e
+    máximo são exatos. O período é considerado em meses inteiros.
+
+    Args:
+        parametro: Nome do parametro.
+        rio: Rios a mesclar.
+        inicio: Data inicial (mês inclusive).
+        fim: Data final (mês inclusive).
+        quantis: Quantis desejados, entre 0 e 1.
+        faixas: Número de intervalos iguais do histograma, entre o mínimo e o máximo.
+        excluir_atipicos: Ignora os valores marcados como atípicos.
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado.
+        HTTPException: 422 - Quantil fora de [0, 1].
+    """
+    if any(not 0 <= q <= 1 for q in quantis):
+        raise HTTPException(status_code=422, detail="Quantis devem estar entre 0 e 1.")
+    db_parametro = db.query(ModelParametro).filter(ModelParametro.nome == parametro).first()
+    if db_parametro is None:
+        raise HTTPException(status_code=404, detail=f"Parametro '{parametro}' não encontrado.")
+    rios = [obter_rio(db, r) for r in rio] if rio else None
+
+    esboco = distribuicoes.consultar(
+        db, db_parametro.id, [r.id for r in rios] if rios else None, inicio, fim, excluir_atipicos
+    )
+    return {
+        "parametro": db_parametro.nome,
+        "rios": [r.codigo for r in rios] if rios else None,
+        "n": esboco.n,
+        "media": esboco.soma / esboco.n if esboco.n else None,
+        "minimo": esboco.minimo,
+        "maximo": esboco.maximo,
+        "erro_relativo": distribuicoes.PRECISAO,
+        "quantis": {str(q): v for q, v in esboco.quantis(quantis).items()},
+        "histograma": esboco.histograma(faixas),
+    }
+
+
+@analise_router.get("/anomalias", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_anomalias(
+    rio: str,
+    parametro: str,
+    limite: int = Query(50, ge=1, le=1000, description="Quantidade de medições mais recentes"),
+    desde: Optional[date] = None,
+    excluir_atipicos: bool = False,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna as medições mais recentes de um parametro em um rio, cada uma comparada
+    com a climatologia do seu mês do ano (todos os anos da série).
+
+    Para cada medição: anomalia (valor menos a mediana do mês), escore robusto
+    (anomalia dividida por IQR / 1,349, na escala de um escore z) e percentil do
+    valor entre as medições do mês. São null quando o mês tem histórico curto.
+
+    Args:
+        rio: Código ou nome do rio.
+        parametro: Nome do parametro.
+        limite: Quantas medições, das mais recentes para as mais antigas.
+        desde: Só medições a partir desta data.
+        excluir_atipicos: Calcula a climatologia sem os valores marcados como atípicos.
+
+    Raises:
+        HTTPException: 404 - Rio, parametro ou medições não encontrados.
+    """
+    db_rio = obter_rio(db, rio)
+    db_parametro = db.query(ModelParametro).filter(ModelParametro.nome == parametro).first()
+    if db_parametro is None:
+        raise HTTPException(status_code=404, detail=f"Parametro '{parametro}' não encontrado.")
+
+    chave = (db_parametro.id, excluir_atipicos)
+    climatologia = cache_climatologias.obter(db_rio.id, chave)
+    if climatologia is None:
+        geracao = cache_climatologias.geracao(db_rio.id)
+        climatologia = climatologias.calcular(db, db_rio.id, db_parametro.id, excluir_atipicos)
+        cache_climatologias.guardar(db_rio.id, climatologia, chave, geracao)
+
+    recentes = db.query(
+        ModelColetaParametro.datas, ModelColetaParametro.valor, ModelColetaParametro.atipico
+    ).filter(
+        ModelColetaParametro.rio_id == db_rio.id,
+        ModelColetaParametro.parametro_id == db_parametro.id,
+        ModelColetaParametro.datas.isnot(None),
+    )
+    if desde is not None:
+        recentes = recentes.filter(ModelColetaParametro.datas >= desde)
+    recentes = recentes.order_by(ModelColetaParametro.datas.desc()).limit(limite).all()
+    if not recentes:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nenhuma medição de '{db_parametro.nome}' encontrada no rio '{db_rio.nome}'.",
+        )
+
+    desvios = climatologias.desvios(climatologia, [m.datas.month for m in recentes], [m.valor for m in recentes])
+    return {
+        "rio": db_rio.nome,
+        "parametro": db_parametro.nome,
+        "climatologia": [climatologias.resumir(mes, esboco) for mes, esboco in climatologia.items()],
+        "medicoes": [
+            {"data": m.datas.isoformat(), "valor": m.valor, "atipico": m.atipico, **desvio}
+            for m, desvio in zip(recentes, desvios)
+        ],
+    }
@@ -1,23 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security
+from fastapi import APIRouter, Depends, HTTPException, status, Security, Query, Header, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from fastapi.security import APIKeyHeader
-from typing import List, Dict, Union
-from schemas import Coleta
+from typing import List, Dict, Union, Optional
+import asyncio
+from schemas import Coleta, ColetaResposta
 from models import Coleta as ModelColeta, Parametro as ModelParametro, Rio as ModelRio # Importe os modelos
 from database import get_db
+from replica import get_db_leitura
+import replica
+import agrupamento
+from versoes import Condicional
+from repositorio import obter_rio
+from seguranca import exigir_chave_api
+import transmissao
 import seguranca
-from configuracao import logger, configuracoes, API_KEY_HASH
+import repositorio
+import compactas
+from configuracao import logger, configuracoes, api_key_hash
 import traceback
 
 coletas_router = APIRouter()
 
-@coletas_router.post("/coletas", response_model=Coleta, status_code=status.HTTP_201_CREATED)
+@coletas_router.post("/coletas", response_model=ColetaResposta, status_code=status.HTTP_201_CREATED)
 def create_coleta(
     coleta: Coleta, 
     db: Session = Depends(get_db),
     api_key_header: str = Security(APIKeyHeader(name="X-API-Key"))):
     
-    if not seguranca.verificar_api_key(api_key_header, API_KEY_HASH):
+    if not seguranca.verificar_api_key(api_key_header, api_key_hash()):
         logger.warning(
             f"Falha na autenticação: API Key inválida ou ausente. Chave recebida: {api_key_header}"
         )
@@ -28,19 +40,35 @@ def create_coleta(
         )
 
     try:
-
-
-        db_parametro = db.query(ModelParametro).filter(ModelParametro.id == coleta.parametro_id).first()
-        db_rio = db.query(ModelRio).filter(ModelRio.id == coleta.rio_id).first()
-
-        if db_parametro is None or db_rio is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parametro ou Rio não encontrado")
-
-        db_coleta = ModelColeta(**coleta.dict())
-        db.add(db_coleta)
-        db.commit()
-        db.refresh(db_coleta)
-        return Coleta.from_orm(db_coleta)
+        if configuracoes.AGRUPAR_COLETAS:
+            # Espera o commit do lote em que a coleta entrou (ver agrupamento.py)
+            futuro = agrupamento.agrupador.enviar(coleta)
+            try:
+                db_coleta = futuro.result(timeout=configuracoes.AGRUPAMENTO_TIMEOUT_SEGUNDOS)
+            except TimeoutError:
+                # Se a gravadora já pegou o lote, a coleta ainda pode ser gravada; reenviar é seguro
+                futuro.cancel()
+                logger.error(f"Coleta {coleta.codigo} não confirmada em {configuracoes.AGRUPAMENTO_TIMEOUT_SEGUNDOS} s")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Gravação não confirmada a tempo. Tente novamente.",
+                    headers={"Retry-After": "1"},
+                )
+            replica.marcar_escrita()
+        else:
+            db_coleta = repositorio.criar_coleta(db, coleta)
+        atipicos = [cp.parametro_id for cp in db_coleta.coletas_parametros if cp.atipico]
+        if atipicos:
+            logger.warning(
+                f"Coleta {db_coleta.codigo} (ID: {db_coleta.id}) com valores atípicos nos parametros {atipicos}"
+            )
+        return ColetaResposta.from_orm(db_coleta)
+
+    except repositorio.ReferenciaInvalida as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         traceback.print_exc()
@@ -48,14 +76,41 @@ def create_coleta(
         logger.error(f"Erro ao criar produto: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+
+@coletas_router.post("/coletas/lote", dependencies=[Depends(exigir_chave_api)])
+def create_coletas_lote(coletas: List[Coleta], db: Session = Depends(get_db)):
+    """
+    Grava várias coletas de uma vez, de forma idempotente.
+
+    Cada coleta é identificada por codigo, rio_id, datas, locali e replica; as que
+    já existem são atualizadas e suas medições substituídas por parametro, então
+    reenviar uma campanha inteira não duplica dados.
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado.
+    """
+    try:
+        resultado = repositorio.ingerir_coletas(db, coletas)
+        db.commit()
+    except repositorio.ReferenciaInvalida as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    logger.info(
+        f"Lote de {len(coletas)} coletas gravado: {resultado['coletas']} / medições {resultado['medicoes']}"
+    )
+    return resultado
+
 # @coletas_router.get("/coletas", response_model=List[Coleta])
 # def read_all_coletas(db: Session = Depends(get_db)):
 #     coletas = db.query(ModelColeta).all()
 #     return [Coleta.from_orm(c) for c in coletas]
 
 
-@coletas_router.get("/coletas", response_model=List[Coleta])
-def read_all_coletas(db: Session = Depends(get_db)):
+@coletas_router.get("/coletas", response_model=List[Coleta], dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def read_all_coletas(db: Session = Depends(get_db_leitura)):
+    if compactas.em_uso(db):
+        return compactas.coletas(db)
+
     coletas = db.query(ModelColeta).all()
 
     # Garante que os dados relacionados sejam carregados
@@ -64,8 +119,109 @@ def read_all_coletas(db: Session = Depends(get_db)):
 
     return coletas
 
-@coletas_router.get("/coletas/parametro/{nome_parametro}", response_model=Dict[str, Union[str, List[str]]])
-def read_coletas_por_nome_parametro(nome_parametro: str, db: Session = Depends(get_db)):
+# Comentário SSE enviado quando não há eventos, para proxies não fecharem a conexão
+INTERVALO_PING_SEGUNDOS = 15
+
+
+async def _transmitir(request: Request, inscrito: transmissao.Inscrito, ultimo: Optional[int]):
+    publicador = transmissao.transmissao
+    inscrito.loop = asyncio.get_running_loop()
+    cursor = await run_in_threadpool(publicador.inscrever, inscrito)
+    try:
+        yield "retry: 3000\n\n"
+        # Do Last-Event-ID (ou "desde") até o cursor, os eventos vêm do banco
+        pendente = (ultimo, cursor) if ultimo is not None and ultimo < cursor else None
+        ultimo = cursor if ultimo is None else max(ultimo, cursor)
+        while True:
+            while pendente:
+                eventos, mais = await run_in_threadpool(transmissao.buscar, *pendente)
+                for evento in eventos:
+                    if inscrito.aceita(evento):
+                        yield transmissao.formatar(evento, inscrito.parametro_id)
+                pendente = (eventos[-1]["seq"], pendente[1]) if mais else None
+
+            try:
+                lote = await asyncio.wait_for(inscrito.fila.get(), INTERVALO_PING_SEGUNDOS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+
+            if inscrito.atrasado:
+                # A fila encheu e eventos foram descartados: relê do banco o que faltou
+                inscrito.atrasado = False
+                while not inscrito.fila.empty():
+                    inscrito.fila.get_nowait()
+                pendente = (ultimo, publicador.cursor)
+                ultimo = max(ultimo, publicador.cursor)
+                continue
+
+            for evento in lote:
+                if evento["seq"] > ultimo:
+                    ultimo = evento["seq"]
+                    yield transmissao.formatar(evento, inscrito.parametro_id)
+    finally:
+        publicador.cancelar(inscrito)
+
+
+@coletas_router.get("/coletas/stream")
+def stream_coletas(
+    request: Request,
+    rio: Optional[str] = None,
+    parametro: Optional[str] = None,
+    desde: Optional[int] = Query(None, ge=0, description="Cursor (seq) a partir do qual enviar; o padrão é só o que chegar depois da conexão"),
+    last_event_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Transmite (Server-Sent Events) as coletas e medições confirmadas a partir de agora.
+
+    Cada evento "coleta" traz a coleta e as medições novas ou alteradas dela; o id
+    do evento é o seq_alteracao (o mesmo cursor do GET /sync). Ao reconectar, o
+    EventSource manda Last-Event-ID e recebe o que perdeu.
+
+    Args:
+        rio: Código ou nome do rio; sem ele, todos os rios.
+        parametro: Nome do parametro; sem ele, todos os parametros.
+        desde: Cursor inicial, para a primeira conexão (Last-Event-ID tem precedência).
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado.
+        HTTPException: 503 - Limite de clientes conectados atingido.
+    """
+    rio_id = obter_rio(db, rio).id if rio is not None else None
+    parametro_id = None
+    if parametro is not None:
+        db_parametro = db.query(ModelParametro).filter(ModelParametro.nome == parametro).first()
+        if db_parametro is None:
+            raise HTTPException(status_code=404, detail="Parametro não encontrado")
+        parametro_id = db_parametro.id
+    db.close()  # a conexão não fica presa enquanto o cliente estiver ouvindo
+
+    if last_event_id is not None:
+        try:
+            desde = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID inválido")
+
+    if transmissao.transmissao.metricas()["inscritos"] >= configuracoes.TRANSMISSAO_MAXIMO_INSCRITOS:
+        raise HTTPException(
+            status_code=503,
+            detail="Limite de clientes conectados atingido, tente novamente em instantes.",
+            headers={"Retry-After": "10"},
+        )
+
+    inscrito = transmissao.Inscrito(rio_id, parametro_id)
+    return StreamingResponse(
+        _transmitir(request, inscrito, desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@coletas_router.get("/coletas/parametro/{nome_parametro}", response_model=Dict[str, Union[str, List[str]]], dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def read_coletas_por_nome_parametro(nome_parametro: str, db: Session = Depends(get_db_leitura)):
     db_parametro = db.query(ModelParametro).filter(ModelParametro.nome.ilike(f"%{nome_parametro}%")).first()
 
     if not db_parametro:
@@ -82,8 +238,8 @@ def read_coletas_por_nome_parametro(nome_parametro: str, db: Session = Depends(g
 
     return {"parametro": db_parametro.nome, "rios": rios_coletados}
 
-@coletas_router.get("/coletas/rio/{codigo_rio}", response_model=Dict[str, Union[str, List[str]]])
-def read_parametros_coletados_por_codigo_rio(codigo_rio: str, db: Session = Depends(get_db)):
+@coletas_router.get("/coletas/rio/{codigo_rio}", response_model=Dict[str, Union[str, List[str]]], dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def read_parametros_coletados_por_codigo_rio(codigo_rio: str, db: Session = Depends(get_db_leitura)):
     """Retorna o nome do rio e uma lista com os nomes dos parametros coletados."""
     db_rio = db.query(ModelRio).filter(ModelRio.codigo == codigo_rio).first()
 
@@ -98,10 +254,16 @@ def read_parametros_coletados_por_codigo_rio(codigo_rio: str, db: Session = Depe
 
     parametros_coletados = []
 
-    for coleta in db_rio.coletas:
-        for parametro in coleta.coletas_parametros:
-            if parametro:
-                parametros_coletados.append(parametro.parametro.nome)
+    if compactas.em_uso(db):
+        parametro_ids = compactas.parametros_do_rio(db, db_rio.id)
+        parametros_coletados = [
+            nome for (nome,) in db.query(ModelParametro.nome).filter(ModelParametro.id.in_(parametro_ids))
+        ]
+    else:
+        for coleta in db_rio.coletas:
+            for parametro in coleta.coletas_parametros:
+                if parametro:
+                    parametros_coletados.append(parametro.parametro.nome)
 
     parametros_coletados = list(set(parametros_coletados))
 
@@ -114,11 +276,12 @@ def read_parametros_coletados_por_codigo_rio(codigo_rio: str, db: Session = Depe
 ##ESSE CODIGO PRESTA ABAIXO ##########
 
 
-@coletas_router.get("/coletas/rio/{codigo_rio}/parametro/{nome_parametro}", response_model=Dict[str, Union[str, List[Dict[str, Union[str, float]]]]])
+@coletas_router.get("/coletas/rio/{codigo_rio}/parametro/{nome_parametro}", response_model=Dict[str, Union[str, List[Dict[str, Union[str, float]]]]], dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
 def read_valores_parametro_rio(
     codigo_rio: str,
     nome_parametro: str,
-    db: Session = Depends(get_db)
+    excluir_atipicos: bool = False,
+    db: Session = Depends(get_db_leitura)
 ):
     """Retorna os valores de um parâmetro coletado ao longo do tempo para um rio."""
     db_rio = db.query(ModelRio).filter(ModelRio.codigo == codigo_rio).first()
@@ -131,16 +294,19 @@ def read_valores_parametro_rio(
         raise HTTPException(status_code=404, detail="Parâmetro não encontrado.")
 
     valores = []
-    for coleta in db_rio.coletas:
-        for pc in coleta.coletas_parametros:  # relacionamento coleta.parametros_coleta
-            if pc.parametro_id == db_parametro.id:
-                valores.append({
-                    "data": coleta.datas.isoformat(),
-                    "local": coleta.locali,
-                    "valor": pc.valor,
-                    "latitude": coleta.latitude,     # NOVO
-                    "longitude": coleta.longitude 
-                })
+    if compactas.em_uso(db):
+        valores = compactas.serie(db, db_rio.id, db_parametro.id, excluir_atipicos)
+    else:
+        for coleta in db_rio.coletas:
+            for pc in coleta.coletas_parametros:  # relacionamento coleta.parametros_coleta
+                if pc.parametro_id == db_parametro.id and not (excluir_atipicos and pc.atipico):
+                    valores.append({
+                        "data": coleta.datas.isoformat(),
+                        "local": coleta.locali,
+                        "valor": pc.valor,
+                        "latitude": coleta.latitude,     # NOVO
+                        "longitude": coleta.longitude 
+                    })
 
     if not valores:
         raise HTTPException(status_code=404, detail="Nenhum valor encontrado para esse parâmetro no rio.")
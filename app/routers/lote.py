@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from starlette.responses import Response
+from configuracao import configuracoes
+import schemas
+import lote
+
+lote_router = APIRouter()
+
+
+@lote_router.post("/lote")
+async def executar_lote(pedido: schemas.Lote, request: Request):
+    """
+    Executa várias leituras GET numa requisição só e devolve todas as respostas,
+    cada uma com o próprio status. Exemplo de corpo:
+
+        {"requisicoes": [{"caminho": "/rios"},
+                         {"id": "resumo", "caminho": "/rio/Doce/coletas/pH/resumo",
+                          "cabecalhos": {"If-None-Match": "\\"abc\\""}}]}
+
+    Resposta: {"respostas": [{"id", "status", "cabecalhos", "corpo"}, ...]}, na ordem
+    do pedido. Os cabeçalhos de autenticação do lote valem para todas as leituras.
+    """
+    if not pedido.requisicoes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O lote está vazio.")
+    if len(pedido.requisicoes) > configuracoes.LOTE_MAXIMO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No máximo {configuracoes.LOTE_MAXIMO} requisições por lote.",
+        )
+    for posicao, item in enumerate(pedido.requisicoes):
+        erro = lote.validar(item.caminho)
+        if erro:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Requisição {item.id if item.id is not None else posicao}: {erro}",
+            )
+    corpo = await lote.executar(request.app, request.scope, pedido.requisicoes)
+    return Response(content=corpo, media_type="application/json")
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+from models import Parametro as ModelParametro, MapaRio
+from replica import get_db_leitura
+from versoes import Condicional
+from repositorio import obter_rio
+import mapa
+import derivados
+
+mapa_router = APIRouter(prefix="/mapa")
+
+
+def _ler_bbox(bbox: str):
+    try:
+        oeste, sul, leste, norte = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox deve ser 'oeste,sul,leste,norte' em graus")
+    if not (-90 <= sul <= norte <= 90 and -180 <= oeste <= 180 and -180 <= leste <= 180):
+        raise HTTPException(status_code=422, detail="bbox fora dos limites de latitude/longitude")
+    return oeste, sul, leste, norte
+
+
+@mapa_router.get("/clusters", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_clusters(
+    response: Response,
+    bbox: str = Query(..., description="oeste,sul,leste,norte em graus (WGS84)"),
+    zoom: int = Query(..., ge=0, le=22),
+    parametro: Optional[str] = Query(None, description="Nome do parametro para a média por cluster"),
+    rio: Optional[str] = None,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna os pontos de coleta agrupados em clusters para a área e o zoom do mapa.
+
+    Cada cluster traz o número de coletas, o centróide e, se pedido, a média do
+    parametro nas coletas do cluster. As pirâmides de clusters de todos os zooms
+    ficam pré-calculadas e são refeitas em segundo plano após cada ingestão; até
+    isso terminar, a resposta mostra o cálculo anterior e não é cacheável.
+
+    Args:
+        bbox: Área visível: oeste,sul,leste,norte. Oeste maior que leste indica uma
+            área que atravessa o antimeridiano.
+        zoom: Zoom do mapa (tiles Web Mercator).
+        parametro: Nome do parametro a ser resumido.
+        rio: Código ou nome do rio (todos, se omitido).
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado; 422 - bbox inválida.
+    """
+    oeste, sul, leste, norte = _ler_bbox(bbox)
+    rio_id = obter_rio(db, rio).id if rio is not None else None
+    parametro_id = None
+    if parametro is not None:
+        parametro_id = db.query(ModelParametro.id).filter(ModelParametro.nome == parametro).scalar()
+        if parametro_id is None:
+            raise HTTPException(status_code=404, detail=f"Parametro '{parametro}' não encontrado.")
+
+    # Normalmente a ingestão já agendou o recálculo; isto cobre escritas feitas fora da API.
+    # Enquanto ele não termina, a resposta não leva ETag para não ser guardada pelo cliente
+    if derivados.atrasado(db, MapaRio):
+        mapa.tarefa_atualizacao.agendar()
+        for cabecalho in ("ETag", "Last-Modified"):
+            del response.headers[cabecalho]
+        response.headers["Cache-Control"] = "no-store"
+
+    nivel = min(zoom, mapa.ZOOM_MAXIMO)
+    x_min, y_min = mapa.celula(norte, oeste, nivel)
+    x_max, y_max = mapa.celula(sul, leste, nivel)
+    linhas = db.execute(text(mapa.CONSULTA_SQL), {
+        "zoom": nivel, "rio_id": rio_id, "parametro_id": parametro_id,
+        "x_min": x_min, "x_max": x_max, "y_min": y_min, "y_max": y_max,
+    }).all()
+
+    clusters = []
+    for linha in linhas:
+        cluster = {
+            "coletas": linha.n,
+            "latitude": round(linha.latitude, 6),
+            "longitude": round(linha.longitude, 6),
+        }
+        if parametro_id is not None:
+            cluster["medicoes"] = linha.medicoes or 0
+            cluster["media"] = linha.media
+        clusters.append(cluster)
+    return {"zoom": zoom, "parametro": parametro, "clusters": clusters}
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import joblib
@@ -12,15 +13,18 @@ class RioFeatures(BaseModel):
     feature3: float
     # Adicione mais features conforme necessário
 
-# Carregue o modelo RandomForest treinado (arquivo .pkl salvo previamente)
-model = joblib.load("random_forest_model.pkl")
+# Carregue o modelo RandomForest treinado (arquivo .pkl salvo previamente).
+# Carregado na primeira predição, não ao importar o router.
+@lru_cache(maxsize=None)
+def modelo():
+    return joblib.load("random_forest_model.pkl")
 
 @router.post("/predict")
 def predict(features: RioFeatures):
     try:
         # Converta os dados recebidos para o formato esperado pelo modelo
         input_data = np.array([[features.feature1, features.feature2, features.feature3]])
-        prediction = model.predict(input_data)
+        prediction = modelo().predict(input_data)
         return {"prediction": float(prediction[0])}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -4,11 +4,13 @@ from typing import List, Union
 from schemas import Parametro
 from models import Parametro as ModelParametro
 from database import get_db
+from replica import get_db_leitura
+from versoes import Condicional
 
 parametros_router = APIRouter()
 
-@parametros_router.get("/parametros", response_model=List[Parametro])
-def read_parametros(db: Session = Depends(get_db)):
+@parametros_router.get("/parametros", response_model=List[Parametro], dependencies=[Depends(Condicional("parametros"))])
+def read_parametros(db: Session = Depends(get_db_leitura)):
     """
     Retorna uma lista de todos os parametros cadastrados.
 
@@ -16,8 +18,8 @@ def read_parametros(db: Session = Depends(get_db)):
     parametros = db.query(ModelParametro).all()
     return [Parametro.from_orm(parametro) for parametro in parametros]
 
-@parametros_router.get("/parametros/{parametro_id}", response_model=Parametro)
-def read_parametro(parametro_id: int, db: Session = Depends(get_db)):
+@parametros_router.get("/parametros/{parametro_id}", response_model=Parametro, dependencies=[Depends(Condicional("parametros"))])
+def read_parametro(parametro_id: int, db: Session = Depends(get_db_leitura)):
     """
     Retorna os detalhes de um parametro específico com base no ID fornecido.
 
@@ -99,8 +101,8 @@ def delete_parametro(parametro_id: int, db: Session = Depends(get_db)):
     db.commit()
     return parametro_deletado
 
-@parametros_router.get("/parametros/nome/{nome_parametro}", response_model=Union[Parametro, List[Parametro]]) 
-def read_parametro_por_nome(nome_parametro: str, db: Session = Depends(get_db)):
+@parametros_router.get("/parametros/nome/{nome_parametro}", response_model=Union[Parametro, List[Parametro]], dependencies=[Depends(Condicional("parametros"))])
+def read_parametro_por_nome(nome_parametro: str, db: Session = Depends(get_db_leitura)):
     """
     Busca parametros pelo nome (parcial ou completo).
     
@@ -124,8 +126,8 @@ def read_parametro_por_nome(nome_parametro: str, db: Session = Depends(get_db)):
 
     return [Parametro.from_orm(parametro) for parametro in db_parametros]
 
-@parametros_router.get("/parametros/email/{email_parametro}", response_model=Parametro)
-def read_parametro_por_email(email_parametro: str, db: Session = Depends(get_db)):
+@parametros_router.get("/parametros/email/{email_parametro}", response_model=Parametro, dependencies=[Depends(Condicional("parametros"))])
+def read_parametro_por_email(email_parametro: str, db: Session = Depends(get_db_leitura)):
     """
     Busca um parametro pelo email.
 
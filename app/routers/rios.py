@@ -1,23 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException,  status, Security
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Security
 from sqlalchemy.orm import Session
 from fastapi.security import APIKeyHeader
-from typing import List, Union
+from typing import List, Optional, Union
 from schemas import Rio, Parametro, Coleta
 from models import Rio as ModelRio
 from models import Parametro as ModelParametro
 from models import ColetaParametro as ModelColetaParametro
 from models import Coleta as ModelColeta
 from database import get_db
+from replica import get_db_leitura
+from versoes import Condicional
+from cache import CachePorRio
 from sqlalchemy import func
 import traceback
 import seguranca
-from configuracao import logger, configuracoes, API_KEY_HASH
+import painel
+import ultimas
+from configuracao import logger, configuracoes, api_key_hash
 
 
 rios_router = APIRouter()
 
-@rios_router.get("/rios", response_model=List[Rio])
-def read_rios(db: Session = Depends(get_db)):
+cache_paineis = CachePorRio("paineis")
+
+@rios_router.get("/rios", response_model=List[Rio], dependencies=[Depends(Condicional("rios"))])
+def read_rios(db: Session = Depends(get_db_leitura)):
     rios = db.query(ModelRio).all()
     return [Rio.from_orm(rio) for rio in rios]
 
@@ -28,7 +35,7 @@ def create_rio(
     api_key_header: str = Security(APIKeyHeader(name="X-API-Key")),
 ):
 
-    if not seguranca.verificar_api_key(api_key_header, API_KEY_HASH):
+    if not seguranca.verificar_api_key(api_key_header, api_key_hash()):
         logger.warning(
             f"Falha na autenticação: API Key inválida ou ausente. Chave recebida: {api_key_header}"
         )
@@ -65,15 +72,15 @@ def update_rio(codigo_rio: str, rio: Rio, db: Session = Depends(get_db)):
     db.refresh(db_rio)
     return Rio.from_orm(db_rio)
 
-@rios_router.get("/rios/{codigo_rio}", response_model=Rio)
-def read_rio_por_codigo(codigo_rio: str, db: Session = Depends(get_db)):
+@rios_router.get("/rios/{codigo_rio}", response_model=Rio, dependencies=[Depends(Condicional("rios"))])
+def read_rio_por_codigo(codigo_rio: str, db: Session = Depends(get_db_leitura)):
     db_rio = db.query(ModelRio).filter(ModelRio.codigo == codigo_rio).first()
     if db_rio is None:
         raise HTTPException(status_code=404, detail="Nenhum rio encontrado com esse código")
     return Rio.from_orm(db_rio)
 
-@rios_router.get("/rios/nome/{rio_nome}", response_model=Union[Rio, List[Rio]]) 
-def read_parametro_por_nome(rio_nome: str, db: Session = Depends(get_db)):
+@rios_router.get("/rios/nome/{rio_nome}", response_model=Union[Rio, List[Rio]], dependencies=[Depends(Condicional("rios"))])
+def read_parametro_por_nome(rio_nome: str, db: Session = Depends(get_db_leitura)):
     """
     Busca parametros pelo nome (parcial ou completo).
     
@@ -98,8 +105,83 @@ def read_parametro_por_nome(rio_nome: str, db: Session = Depends(get_db)):
     return [Rio.from_orm(parametro) for parametro in db_parametros]
 
 
-@rios_router.get("/rio/{rio_nome}/coletas/{parametro_nome}/resumo")
-def get_resumo_estatistico(rio_nome: str, parametro_nome: str, db: Session = Depends(get_db)):
+# Depois de /rios/nome/{rio_nome}: registrada antes, capturaria GET /rios/nome/atual
+@rios_router.get("/rios/{codigo_rio}/atual", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_valores_atuais(
+    codigo_rio: str,
+    parametro: Optional[str] = None,
+    por_local: bool = False,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna o valor mais recente de cada parametro medido no rio (ou só do
+    parametro indicado), lido da tabela ultimas_medicoes mantida pela ingestão.
+
+    Args:
+        codigo_rio: Código do rio.
+        parametro: Nome do parametro; sem ele, todos os parametros do rio.
+        por_local: Um valor por local de coleta em vez de um por parametro.
+
+    Raises:
+        HTTPException: 404 - Rio ou parametro não encontrado.
+    """
+    db_rio = db.query(ModelRio).filter(ModelRio.codigo == codigo_rio).first()
+    if db_rio is None:
+        raise HTTPException(status_code=404, detail="Nenhum rio encontrado com esse código")
+
+    parametro_id = None
+    if parametro is not None:
+        db_parametro = db.query(ModelParametro).filter(ModelParametro.nome == parametro).first()
+        if db_parametro is None:
+            raise HTTPException(status_code=404, detail="Parametro não encontrado")
+        parametro_id = db_parametro.id
+
+    return {
+        "rio": db_rio.nome,
+        "codigo": db_rio.codigo,
+        "medicoes": ultimas.consultar(db, db_rio.id, parametro_id, por_local),
+    }
+
+# Depois de /rios/nome/{rio_nome}: registrada antes, capturaria GET /rios/nome/painel
+@rios_router.get("/rios/{codigo_rio}/painel", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_painel(
+    codigo_rio: str,
+    pontos: int = Query(60, ge=2, le=500, description="Máximo de pontos da série de cada parametro"),
+    excluir_atipicos: bool = False,
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Retorna tudo o que a tela de um rio precisa em uma resposta: dados do rio e,
+    para cada parametro coletado, o último valor, o resumo estatístico e a série
+    reduzida para o gráfico.
+
+    O resultado fica em cache até que novas coletas do rio sejam registradas.
+
+    Args:
+        codigo_rio: Código do rio.
+        pontos: Máximo de pontos por série; séries maiores são agrupadas em faixas de tempo.
+        excluir_atipicos: Ignora os valores marcados como atípicos.
+
+    Raises:
+        HTTPException: 404 - Rio não encontrado.
+    """
+    db_rio = db.query(ModelRio).filter(ModelRio.codigo == codigo_rio).first()
+    if db_rio is None:
+        raise HTTPException(status_code=404, detail="Nenhum rio encontrado com esse código")
+
+    resultado = cache_paineis.obter(db_rio.id, (pontos, excluir_atipicos))
+    if resultado is not None:
+        return resultado
+    geracao = cache_paineis.geracao(db_rio.id)
+
+    resultado = painel.montar(db, db_rio, pontos, excluir_atipicos)
+    return cache_paineis.guardar(db_rio.id, resultado, (pontos, excluir_atipicos), geracao)
+
+
+@rios_router.get("/rio/{rio_nome}/coletas/{parametro_nome}/resumo", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_resumo_estatistico(
+    rio_nome: str, parametro_nome: str, excluir_atipicos: bool = False, db: Session = Depends(get_db_leitura)
+):
     # Buscando o rio
     rio = db.query(ModelRio).filter(ModelRio.nome == rio_nome).first()
     if not rio:
@@ -119,20 +201,19 @@ def get_resumo_estatistico(rio_nome: str, parametro_nome: str, db: Session = Dep
     #     ModelColetaParametro.parametro_id == parametro.id   #ModelColetaParametro.parametro_id == parametro.id
     # ).first()
 
+    # rio_id e datas estão na própria medição: uma partição, sem junção com coletas
     parametro_resumo = db.query(
         func.avg(ModelColetaParametro.valor).label("media"),
         func.max(ModelColetaParametro.valor).label("maximo"),
         func.min(ModelColetaParametro.valor).label("minimo")
-    ).select_from(ModelColetaParametro).join(
-        ModelColeta, ModelColeta.id == ModelColetaParametro.coleta_id
-    ).join(
-        ModelRio, ModelRio.id == ModelColeta.rio_id
-    ).join(
-        ModelParametro, ModelParametro.id == ModelColetaParametro.parametro_id
     ).filter(
-        ModelRio.id == rio.id, 
-        ModelParametro.id == parametro.id
-    ).first()
+        ModelColetaParametro.rio_id == rio.id,
+        ModelColetaParametro.parametro_id == parametro.id
+    )
+
+    if excluir_atipicos:
+        parametro_resumo = parametro_resumo.filter(ModelColetaParametro.atipico.is_(False))
+    parametro_resumo = parametro_resumo.first()
 
 
     if parametro_resumo is None:
@@ -147,8 +228,10 @@ def get_resumo_estatistico(rio_nome: str, parametro_nome: str, db: Session = Dep
         "mínimo": parametro_resumo.minimo
     }
 
-@rios_router.get("/rio/{rio_nome}/coletas/{parametro_nome}/grafico")
-def get_grafico(rio_nome: str, parametro_nome: str, db: Session = Depends(get_db)):
+@rios_router.get("/rio/{rio_nome}/coletas/{parametro_nome}/grafico", dependencies=[Depends(Condicional("rios", "parametros", "coletas", "coletas_parametros"))])
+def get_grafico(
+    rio_nome: str, parametro_nome: str, excluir_atipicos: bool = False, db: Session = Depends(get_db_leitura)
+):
     # Buscando o rio
     rio = db.query(ModelRio).filter(ModelRio.nome == rio_nome).first()
     if not rio:
@@ -168,20 +251,16 @@ def get_grafico(rio_nome: str, parametro_nome: str, db: Session = Depends(get_db
     # ).all()
 
     parametros = db.query(
-        ModelParametro.nome,
         ModelColetaParametro.valor,
-        ModelColeta.datas
-    ).select_from(ModelColetaParametro
-    ).join(
-        ModelColeta, ModelColeta.id == ModelColetaParametro.coleta_id
-    ).join(
-        ModelRio, ModelRio.id == ModelColeta.rio_id
-    ).join(
-        ModelParametro, ModelParametro.id == ModelColetaParametro.parametro_id
+        ModelColetaParametro.datas
     ).filter(
-        ModelRio.id == rio.id, 
-        ModelParametro.id == parametro.id
-    ).all()
+        ModelColetaParametro.rio_id == rio.id,
+        ModelColetaParametro.parametro_id == parametro.id
+    )
+
+    if excluir_atipicos:
+        parametros = parametros.filter(ModelColetaParametro.atipico.is_(False))
+    parametros = parametros.order_by(ModelColetaParametro.datas).all()
 
 
     if not parametros:
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 import autenticacao
 from configuracao import logger
+from senhas import SenhasSobrecarregadas
 
 router = APIRouter(prefix="/autenticacao", tags=["Autenticação"])
 
@@ -14,7 +15,7 @@ router = APIRouter(prefix="/autenticacao", tags=["Autenticação"])
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
@@ -23,7 +24,7 @@ def login(
     """
     try:
         # Verifica as credenciais fornecidas
-        usuario = repositorio.autenticar_usuario(
+        usuario = await repositorio.autenticar_usuario(
             db, form_data.username, form_data.password
         )
 
@@ -45,6 +46,15 @@ def login(
         # Retorna o token gerado
         return schemas.Token(access_token=token_acesso, token_type="bearer")
 
+    except HTTPException:
+        raise
+    except SenhasSobrecarregadas:
+        logger.warning("Login recusado: pool de senhas sobrecarregado")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serviço de autenticação sobrecarregado, tente novamente.",
+            headers={"Retry-After": "1"},
+        )
     except Exception as e:
         # Logando erro inesperado
         logger.error(f"Erro ao processar login: {str(e)}")
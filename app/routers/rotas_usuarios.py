@@ -8,6 +8,7 @@ import models
 from configuracao import logger
 from typing import List
 from configuracao import limiter
+from senhas import SenhasSobrecarregadas
 
 router = APIRouter(prefix="/usuarios", tags=["Usuários"])
 
@@ -17,15 +18,22 @@ router = APIRouter(prefix="/usuarios", tags=["Usuários"])
 @router.post(
     "/", response_model=schemas.UsuarioResposta, status_code=status.HTTP_201_CREATED
 )
-def criar_usuario(
+async def criar_usuario(
     usuario: schemas.UsuarioCriacao, db: Session = Depends(get_db)
 ):
     try:
-        novo_usuario = repositorio.criar_usuario(db, usuario)
+        novo_usuario = await repositorio.criar_usuario(db, usuario)
         logger.info(
             f"Usuário criado com sucesso: {novo_usuario.nome} (ID: {novo_usuario.id})"
         )
         return novo_usuario
+    except SenhasSobrecarregadas:
+        logger.warning("Criação de usuário recusada: pool de senhas sobrecarregado")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serviço de autenticação sobrecarregado, tente novamente.",
+            headers={"Retry-After": "1"},
+        )
     except Exception as e:
         traceback.print_exc()
         logger.error(f"Erro ao criar usuário: {str(e)}")
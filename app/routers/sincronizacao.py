@@ -0,0 +1,115 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from models import Rio as ModelRio
+from models import Parametro as ModelParametro
+from models import ColetaParametro as ModelColetaParametro
+from models import Coleta as ModelColeta
+from models import TABELAS_SINCRONIZADAS, CURSOR_ALTERACOES_SQL
+from database import engine
+from versoes import POSICAO_WAL_SQL
+import replica
+
+sincronizacao_router = APIRouter()
+
+MODELOS = {
+    "rios": ModelRio,
+    "parametros": ModelParametro,
+    "coletas": ModelColeta,
+    "coletas_parametros": ModelColetaParametro,
+}
+
+CAMPOS = {
+    "rios": ("id", "nome", "codigo", "descricao"),
+    "parametros": ("id", "nome", "categoria"),
+    "coletas": ("id", "codigo", "locali", "rio_id", "datas", "latitude", "longitude"),
+    "coletas_parametros": ("id", "coleta_id", "parametro_id", "valor", "atipico"),
+}
+
+# Cada ramo usa o índice de seq_alteracao e já para no limite, então o custo
+# depende do volume de alterações desde o cursor e não do tamanho das tabelas.
+ALTERACOES_SQL = " UNION ALL ".join(
+    [
+        f"(SELECT seq_alteracao AS seq, '{tabela}' AS tabela, id FROM {tabela} "
+        f"WHERE seq_alteracao > :desde AND seq_alteracao <= :ate ORDER BY seq_alteracao LIMIT :limite)"
+        for tabela in TABELAS_SINCRONIZADAS
+    ]
+    + [
+        "(SELECT seq, 'exclusoes' AS tabela, seq AS id FROM exclusoes "
+        "WHERE seq > :desde AND seq <= :ate ORDER BY seq LIMIT :limite)"
+    ]
+) + " ORDER BY seq LIMIT :limite"
+
+
+def get_db_sincronizacao(request: Request):
+    """
+    Lê o horizonte das alterações no primário, antes de qualquer leitura dos dados,
+    e só usa a réplica se ela já reproduziu o WAL até onde ele foi lido: tudo até o
+    horizonte está confirmado e visível na sessão devolvida.
+    """
+    with engine.connect() as conexao:
+        request.state.horizonte = conexao.execute(text(CURSOR_ALTERACOES_SQL)).scalar()
+        posicao = conexao.execute(text(POSICAO_WAL_SQL)).scalar()
+    db = replica.sessao_leitura(request, posicao)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _serializar(objeto, campos):
+    dados = {campo: getattr(objeto, campo) for campo in campos}
+    dados["seq"] = objeto.seq_alteracao
+    return dados
+
+
+@sincronizacao_router.get("/sync")
+def sincronizar(
+    request: Request,
+    desde: int = Query(0, ge=0, description="Cursor devolvido pela chamada anterior (0 na primeira)"),
+    limite: int = Query(1000, ge=1, le=5000),
+    db: Session = Depends(get_db_sincronizacao),
+):
+    """
+    Retorna as linhas de rios, parametros, coletas e coletas_parametros criadas ou
+    alteradas depois do cursor, e as exclusões feitas nesse intervalo.
+
+    O app deve aplicar as linhas por id (inserir ou substituir), remover as
+    exclusões e guardar o novo cursor. Enquanto "mais" for verdadeiro, há outra
+    página a pedir com o cursor devolvido.
+
+    Args:
+        desde: Maior número de alteração já recebido pelo app.
+        limite: Máximo de alterações por página.
+    """
+    # Todas as consultas da página veem o mesmo instante do banco
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+    # Uma linha a mais só para saber se existe próxima página
+    alteracoes = db.execute(
+        text(ALTERACOES_SQL), {"desde": desde, "ate": request.state.horizonte, "limite": limite + 1}
+    ).all()
+    mais = len(alteracoes) > limite
+    alteracoes = alteracoes[:limite]
+
+    ids = {tabela: [] for tabela in (*TABELAS_SINCRONIZADAS, "exclusoes")}
+    for seq, tabela, registro_id in alteracoes:
+        ids[tabela].append(registro_id)
+
+    resposta = {
+        "cursor": alteracoes[-1].seq if alteracoes else desde,
+        "mais": mais,
+    }
+    for tabela in TABELAS_SINCRONIZADAS:
+        modelo = MODELOS[tabela]
+        linhas = db.query(modelo).filter(modelo.id.in_(ids[tabela])).all() if ids[tabela] else []
+        resposta[tabela] = [_serializar(linha, CAMPOS[tabela]) for linha in linhas]
+
+    exclusoes = db.execute(
+        text("SELECT seq, tabela, registro_id FROM exclusoes WHERE seq = ANY(:seqs) ORDER BY seq"),
+        {"seqs": ids["exclusoes"]},
+    ).all() if ids["exclusoes"] else []
+    resposta["exclusoes"] = [
+        {"seq": seq, "tabela": tabela, "id": registro_id} for seq, tabela, registro_id in exclusoes
+    ]
+    return resposta
@@ -0,0 +1,49 @@
+import os
+from fastapi import APIRouter, Depends
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+from database import get_db
+from repositorio import obter_rio
+import snapshots
+
+snapshots_router = APIRouter()
+
+
+@snapshots_router.get("/snapshots/{rio}")
+def baixar_snapshot(rio: str, db: Session = Depends(get_db)):
+    """
+    Baixa o banco SQLite do rio para consulta offline no app.
+
+    O arquivo traz rios, parametros, coletas e coletas_parametros do rio, com
+    índices, e a tabela resumos com as estatísticas por parametro. A tabela meta
+    guarda o cursor de alterações: depois do download, o app pode continuar
+    atualizado pelo GET /sync a partir dele. Downloads interrompidos podem ser
+    retomados com o cabeçalho Range (If-Range com o ETag evita misturar versões).
+
+    Serve o último snapshot completo; a geração e as atualizações rodam em segundo
+    plano. Se o rio ainda não tem snapshot, responde 202 com Retry-After.
+
+    Args:
+        rio: Código ou nome do rio.
+    """
+    db_rio = obter_rio(db, rio)
+    rio_id, codigo = db_rio.id, db_rio.codigo
+    db.close()  # não segura a conexão durante o download
+
+    link = snapshots.abrir(rio_id)
+    if link is None:
+        snapshots.fila_atualizacao.agendar({rio_id})
+        return JSONResponse(
+            status_code=202,
+            content={"detail": "Snapshot do rio em preparação, tente novamente em instantes."},
+            headers={"Retry-After": "10"},
+        )
+    # Tamanho e corpo vêm do mesmo arquivo, mesmo que o snapshot seja trocado no meio
+    return FileResponse(
+        link,
+        media_type="application/vnd.sqlite3",
+        filename=f"{codigo}.sqlite",
+        stat_result=os.stat(link),
+        background=BackgroundTask(os.remove, link),
+    )
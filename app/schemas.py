@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List,Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List,Optional
 from datetime import date
 
 class ColetaParametro(BaseModel):
@@ -19,6 +19,7 @@ class Coleta(BaseModel):
     datas: date
     latitude: float  # NOVO
     longitude: float
+    replica: int = Field(1, ge=1)  # distingue coletas repetidas no mesmo ponto e data
     coletas_parametros: List[ColetaParametro]  # <-- Correção aqui
 
     #parametros: List[int] #ADICIONEI ISSO, SERÁ QUE É ISSO?
@@ -29,6 +30,10 @@ class Coleta(BaseModel):
 
 Coletas = List[Coleta]
 
+class ColetaResposta(Coleta):
+    id: int  # ID atribuído à coleta ao ser gravada
+
+
 class Parametro(BaseModel):
     nome: str
     #valor: float
@@ -51,6 +56,18 @@ class Rio(BaseModel):
 Rios = List[Rio]
 
 
+# ------------------ Lote de leituras ------------------
+
+class SubRequisicao(BaseModel):
+    id: Optional[str] = None        # devolvido na resposta; sem ele, a posição na lista
+    caminho: str                    # rota GET com a query string, ex.: /rio/Doce/coletas/pH/resumo
+    cabecalhos: Dict[str, str] = {} # só If-None-Match e If-Modified-Since são usados
+
+
+class Lote(BaseModel):
+    requisicoes: List[SubRequisicao]
+
+
 # ------------------ Usuário ------------------
 
 
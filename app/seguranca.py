@@ -1,13 +1,35 @@
+from functools import lru_cache
+from fastapi import HTTPException, Security, status
+from fastapi.security import APIKeyHeader
 from passlib.context import CryptContext
 
 contexto_senha = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def gerar_senha_hash(senha: str) -> str:
+@lru_cache(maxsize=None)
+def contexto_senha_usuario(rounds: int) -> CryptContext:
+    """
+    Contexto das senhas de usuário com o custo (rounds) configurado.
+
+    Hashes com custo diferente são considerados desatualizados e refeitos no
+    próximo login (ver verificar_e_atualizar_senha).
+    """
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def gerar_senha_hash(senha: str, rounds: int = None) -> str:
     """
     Gera o hash da senha de usuário.
     """
-    return contexto_senha.hash(senha)
+    if rounds is None:
+        return contexto_senha.hash(senha)
+    return contexto_senha_usuario(rounds).hash(senha)
 
 
 def verificar_senha(senha_digitada: str, senha_hash: str) -> bool:
@@ -17,6 +39,16 @@ def verificar_senha(senha_digitada: str, senha_hash: str) -> bool:
     return contexto_senha.verify(senha_digitada, senha_hash)
 
 
+def verificar_e_atualizar_senha(senha_digitada: str, senha_hash: str, rounds: int):
+    """
+    Verifica a senha e, se o hash estiver desatualizado, gera um novo.
+
+    Returns:
+        (senha confere, novo hash ou None)
+    """
+    return contexto_senha_usuario(rounds).verify_and_update(senha_digitada, senha_hash)
+
+
 def gerar_api_key_hash(api_key: str) -> str:
     """
     Gera o hash da chave API.
@@ -29,3 +61,22 @@ def verificar_api_key(api_key_digitada: str, api_key_hash: str) -> bool:
     Verifica se a chave API fornecida corresponde ao hash da chave armazenada.
     """
     return contexto_senha.verify(api_key_digitada, api_key_hash)
+
+
+def exigir_chave_api(api_key_header: str = Security(APIKeyHeader(name="X-API-Key"))):
+    """
+    Dependência das rotas que exigem a chave da API no cabeçalho X-API-Key.
+
+    Raises:
+        HTTPException: 401 - Chave inválida ou ausente.
+    """
+    from configuracao import api_key_hash, logger   # configuracao importa este módulo
+
+    if not verificar_api_key(api_key_header, api_key_hash()):
+        logger.warning(
+            f"Falha na autenticação: API Key inválida ou ausente. Chave recebida: {api_key_header}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key inválida ou não fornecida. Por favor, forneça uma chave válida.",
+        )
@@ -0,0 +1,78 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from configuracao import configuracoes, logger
+import seguranca
+
+# O bcrypt é lento de propósito. Rodando no threadpool do Starlette, uma rajada de
+# logins ocupa as threads que atendem as rotas síncronas (rios, coletas...). Aqui o
+# trabalho vai para processos próprios, em número limitado, e o excesso recebe 503
+# na hora em vez de esperar numa fila sem fim.
+
+_pool = None
+_trava = Lock()
+_em_andamento = 0
+
+
+class SenhasSobrecarregadas(Exception):
+    """Todos os processos de senha estão ocupados e a fila de espera está cheia."""
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _trava:
+        if _pool is None:
+            # "spawn" evita herdar do processo da API conexões e threads abertas
+            _pool = ProcessPoolExecutor(
+                max_workers=configuracoes.PROCESSOS_SENHAS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"Pool de senhas iniciado com {configuracoes.PROCESSOS_SENHAS} processos")
+        return _pool
+
+
+def encerrar():
+    global _pool
+    with _trava:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _executar(funcao, *args):
+    global _em_andamento
+    limite = configuracoes.PROCESSOS_SENHAS + configuracoes.FILA_SENHAS
+    if _em_andamento >= limite:
+        raise SenhasSobrecarregadas()
+    _em_andamento += 1
+    try:
+        return await asyncio.wrap_future(_obter_pool().submit(funcao, *args))
+    finally:
+        _em_andamento -= 1
+
+
+async def gerar_hash(senha: str) -> str:
+    """
+    Gera o hash de uma senha de usuário no pool de processos.
+
+    Raises:
+        SenhasSobrecarregadas: pool e fila cheios.
+    """
+    return await _executar(seguranca.gerar_senha_hash, senha, configuracoes.ROUNDS_SENHAS)
+
+
+async def verificar(senha: str, senha_hash: str):
+    """
+    Verifica a senha no pool de processos.
+
+    Returns:
+        (senha confere, novo hash ou None) - o novo hash vem quando o gravado usa
+        um custo diferente de ROUNDS_SENHAS e deve substituí-lo.
+
+    Raises:
+        SenhasSobrecarregadas: pool e fila cheios.
+    """
+    return await _executar(
+        seguranca.verificar_e_atualizar_senha, senha, senha_hash, configuracoes.ROUNDS_SENHAS
+    )
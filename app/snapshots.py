@@ -0,0 +1,257 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import text
+from database import SessionLocal
+from models import CURSOR_ALTERACOES_SQL
+from configuracao import configuracoes, logger
+from tarefas import FilaPorRio
+import eventos
+
+# Esquema do arquivo SQLite entregue ao app. Espelha as tabelas do servidor (só as
+# colunas usadas pelo app) e acrescenta o resumo estatístico já calculado.
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS rios (
+    id INTEGER PRIMARY KEY, nome TEXT NOT NULL, codigo TEXT NOT NULL, descricao TEXT
+);
+CREATE TABLE IF NOT EXISTS parametros (
+    id INTEGER PRIMARY KEY, nome TEXT NOT NULL, categoria TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coletas (
+    id INTEGER PRIMARY KEY, codigo TEXT, locali TEXT, rio_id INTEGER, datas TEXT,
+    latitude REAL, longitude REAL
+);
+CREATE TABLE IF NOT EXISTS coletas_parametros (
+    id INTEGER PRIMARY KEY, coleta_id INTEGER NOT NULL, parametro_id INTEGER NOT NULL,
+    valor REAL NOT NULL, atipico INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS resumos (
+    parametro_id INTEGER PRIMARY KEY, n INTEGER, media REAL, minimo REAL, maximo REAL,
+    primeira_data TEXT, ultima_data TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_coletas_datas ON coletas (datas);
+CREATE INDEX IF NOT EXISTS ix_coletas_parametros_parametro ON coletas_parametros (parametro_id, coleta_id);
+CREATE INDEX IF NOT EXISTS ix_coletas_parametros_coleta ON coletas_parametros (coleta_id);
+"""
+
+# Links de download (ver abrir): o nome leva o instante em que foi criado
+PREFIXO_DOWNLOAD = ".download_"
+VALIDADE_DOWNLOAD_SEGUNDOS = 24 * 3600
+
+_travas = {}
+_trava_travas = threading.Lock()
+
+
+def caminho(rio_id: int) -> str:
+    return os.path.join(configuracoes.DIRETORIO_SNAPSHOTS, f"rio_{rio_id}.sqlite")
+
+
+def abrir(rio_id: int):
+    """
+    Último snapshot completo do rio, num link próprio para um download. atualizar()
+    pode trocar o arquivo durante o envio sem mudar o que esse download lê: o link
+    continua no arquivo antigo. Quem pediu remove o link no fim. None se o rio
+    ainda não tem snapshot.
+    """
+    _remover_links_antigos()
+    link = os.path.join(
+        configuracoes.DIRETORIO_SNAPSHOTS, f"{PREFIXO_DOWNLOAD}{int(time.time())}_{uuid.uuid4().hex}.sqlite"
+    )
+    try:
+        os.link(caminho(rio_id), link)
+    except FileNotFoundError:
+        return None
+    return link
+
+
+def _remover_links_antigos():
+    """Links de downloads que não chegaram ao fim (conexão caída, processo encerrado)."""
+    if not os.path.isdir(configuracoes.DIRETORIO_SNAPSHOTS):
+        return
+    limite = time.time() - VALIDADE_DOWNLOAD_SEGUNDOS
+    for nome in os.listdir(configuracoes.DIRETORIO_SNAPSHOTS):
+        if not nome.startswith(PREFIXO_DOWNLOAD):
+            continue
+        try:
+            if int(nome[len(PREFIXO_DOWNLOAD):].split("_")[0]) < limite:
+                os.remove(os.path.join(configuracoes.DIRETORIO_SNAPSHOTS, nome))
+        except (ValueError, OSError):
+            continue
+
+
+def _trava(rio_id: int) -> threading.Lock:
+    with _trava_travas:
+        return _travas.setdefault(rio_id, threading.Lock())
+
+
+def _ler_cursor(arquivo: str):
+    if not os.path.exists(arquivo):
+        return None
+    conexao = sqlite3.connect(arquivo)
+    try:
+        linha = conexao.execute("SELECT valor FROM meta WHERE chave = 'cursor'").fetchone()
+        return int(linha[0]) if linha else None
+    except sqlite3.Error:
+        return None
+    finally:
+        conexao.close()
+
+
+def _data(valor):
+    return valor.isoformat() if valor is not None else None
+
+
+def _aplicar(conexao: sqlite3.Connection, db, rio_id: int, desde: int):
+    """Copia para o SQLite as linhas do rio alteradas depois de `desde`."""
+    filtro = {"rio_id": rio_id, "desde": desde}
+
+    conexao.executemany(
+        "INSERT OR REPLACE INTO rios VALUES (?, ?, ?, ?)",
+        db.execute(text(
+            "SELECT id, nome, codigo, descricao FROM rios WHERE id = :rio_id AND seq_alteracao > :desde"
+        ), filtro).all(),
+    )
+    conexao.executemany(
+        "INSERT OR REPLACE INTO parametros VALUES (?, ?, ?)",
+        db.execute(text(
+            "SELECT id, nome, categoria FROM parametros WHERE seq_alteracao > :desde"
+        ), filtro).all(),
+    )
+    conexao.executemany(
+        "INSERT OR REPLACE INTO coletas VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (i, codigo, locali, rio, _data(datas), lat, lon)
+            for i, codigo, locali, rio, datas, lat, lon in db.execute(text(
+                "SELECT id, codigo, locali, rio_id, datas, latitude, longitude FROM coletas "
+                "WHERE rio_id = :rio_id AND seq_alteracao > :desde"
+            ), filtro)
+        ],
+    )
+    # Coletas que saíram do rio (rio_id alterado) também deixam o arquivo
+    conexao.executemany(
+        "DELETE FROM coletas WHERE id = ?",
+        db.execute(text(
+            "SELECT id FROM coletas WHERE rio_id IS DISTINCT FROM :rio_id AND seq_alteracao > :desde"
+        ), filtro).all(),
+    )
+    conexao.executemany(
+        "INSERT OR REPLACE INTO coletas_parametros VALUES (?, ?, ?, ?, ?)",
+        db.execute(text(
+            "SELECT cp.id, cp.coleta_id, cp.parametro_id, cp.valor, cp.atipico::int "
+            "FROM coletas_parametros cp "
+            "WHERE cp.rio_id = :rio_id AND cp.seq_alteracao > :desde"
+        ), filtro).all(),
+    )
+
+    for tabela, registro_id in db.execute(text(
+        "SELECT tabela, registro_id FROM exclusoes WHERE seq > :desde"
+    ), filtro):
+        if tabela in ("rios", "parametros", "coletas", "coletas_parametros"):
+            conexao.execute(f"DELETE FROM {tabela} WHERE id = ?", (registro_id,))
+    conexao.execute(
+        "DELETE FROM coletas_parametros WHERE coleta_id NOT IN (SELECT id FROM coletas)"
+    )
+
+
+def _recalcular_resumos(conexao: sqlite3.Connection):
+    conexao.execute("DELETE FROM resumos")
+    conexao.execute("""
+        INSERT INTO resumos
+        SELECT cp.parametro_id, count(*), avg(cp.valor), min(cp.valor), max(cp.valor),
+               min(c.datas), max(c.datas)
+        FROM coletas_parametros cp JOIN coletas c ON c.id = cp.coleta_id
+        GROUP BY cp.parametro_id
+    """)
+
+
+def atualizar(rio_id: int) -> str:
+    """
+    Gera ou atualiza o snapshot SQLite de um rio e retorna o caminho do arquivo.
+
+    Se o arquivo já existe, só as alterações feitas depois do cursor gravado nele
+    são aplicadas (a mesma numeração usada por GET /sync). O arquivo novo é montado
+    numa cópia e troca de lugar com o antigo de uma vez, então downloads em
+    andamento continuam lendo a versão anterior.
+    """
+    arquivo = caminho(rio_id)
+    with _trava(rio_id):
+        desde = _ler_cursor(arquivo)
+
+        db = SessionLocal()
+        try:
+            # O horizonte é lido antes do instante fixo em que os dados são lidos
+            cursor = db.execute(text(CURSOR_ALTERACOES_SQL)).scalar()
+            db.rollback()
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            if desde is not None and cursor <= desde:
+                return arquivo
+
+            os.makedirs(configuracoes.DIRETORIO_SNAPSHOTS, exist_ok=True)
+            descritor, temporario = tempfile.mkstemp(
+                suffix=".sqlite", dir=configuracoes.DIRETORIO_SNAPSHOTS
+            )
+            os.close(descritor)
+            if desde is not None:
+                shutil.copyfile(arquivo, temporario)
+
+            conexao = sqlite3.connect(temporario)
+            try:
+                with conexao:
+                    conexao.executescript(ESQUEMA)
+                    _aplicar(conexao, db, rio_id, desde or 0)
+                    _recalcular_resumos(conexao)
+                    conexao.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                        ("cursor", str(cursor)),
+                        ("rio_id", str(rio_id)),
+                        ("gerado_em", datetime.now(timezone.utc).isoformat()),
+                    ])
+                if desde is None:
+                    conexao.execute("VACUUM")
+            finally:
+                conexao.close()
+        except Exception:
+            if "temporario" in locals() and os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        finally:
+            db.close()
+
+        os.replace(temporario, arquivo)
+        logger.info(f"Snapshot do rio {rio_id} atualizado até a alteração {cursor}")
+        return arquivo
+
+
+# ------------------ Atualização em segundo plano ------------------
+
+fila_atualizacao = FilaPorRio("snapshots", atualizar)
+
+
+def _snapshots_existentes():
+    if not os.path.isdir(configuracoes.DIRETORIO_SNAPSHOTS):
+        return set()
+    return {
+        int(nome[len("rio_"):-len(".sqlite")])
+        for nome in os.listdir(configuracoes.DIRETORIO_SNAPSHOTS)
+        if nome.startswith("rio_") and nome.endswith(".sqlite")
+    }
+
+
+@eventos.inscrever_local
+def _agendar_atualizacao(alteracoes):
+    """Depois de uma ingestão, atualiza os snapshots já gerados dos rios afetados."""
+    rios = set()
+    for tabela, rio_id in alteracoes:
+        if tabela not in ("rios", "parametros", "coletas", "coletas_parametros"):
+            continue
+        if rio_id is None or tabela == "parametros":
+            # Sem rio identificado: vale para todo snapshot existente
+            rios.update(_snapshots_existentes())
+        elif os.path.exists(caminho(rio_id)):
+            rios.add(rio_id)
+    fila_atualizacao.agendar(rios)
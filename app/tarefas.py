@@ -0,0 +1,73 @@
+import threading
+from configuracao import logger
+
+
+class FilaPorRio:
+    """
+    Executa uma função por rio em uma thread de fundo, fora das requisições.
+
+    Rios agendados de novo enquanto esperam são processados uma vez só.
+    """
+
+    def __init__(self, nome: str, funcao):
+        self.nome = nome
+        self.funcao = funcao
+        self._pendentes = set()
+        self._condicao = threading.Condition()
+        self._thread = None
+
+    def agendar(self, rio_ids):
+        rio_ids = set(rio_ids)
+        if not rio_ids:
+            return
+        with self._condicao:
+            self._pendentes.update(rio_ids)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._processar, name=self.nome, daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def _processar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes:
+                    self._condicao.wait()
+                rio_id = self._pendentes.pop()
+            try:
+                self.funcao(rio_id)
+            except Exception as e:
+                logger.error(f"Erro em {self.nome} para o rio {rio_id}: {str(e)}")
+
+
+class TarefaUnica:
+    """
+    Executa uma função sem argumentos em uma thread de fundo, fora das requisições.
+
+    Pedidos feitos enquanto ela espera ou executa geram uma única nova execução.
+    """
+
+    def __init__(self, nome: str, funcao):
+        self.nome = nome
+        self.funcao = funcao
+        self._pedida = False
+        self._condicao = threading.Condition()
+        self._thread = None
+
+    def agendar(self):
+        with self._condicao:
+            self._pedida = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._processar, name=self.nome, daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def _processar(self):
+        while True:
+            with self._condicao:
+                while not self._pedida:
+                    self._condicao.wait()
+                self._pedida = False
+            try:
+                self.funcao()
+            except Exception as e:
+                logger.error(f"Erro em {self.nome}: {str(e)}")
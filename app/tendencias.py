@@ -0,0 +1,334 @@
+import math
+import warnings
+import numpy as np
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from database import SessionLocal
+from models import Tendencia, TendenciaRio
+from tarefas import TarefaUnica
+from configuracao import logger
+import derivados
+import eventos
+
+# Séries com menos datas distintas que isso ficam sem estatística
+MINIMO_PONTOS = 4
+
+# Limite de elementos das matrizes (séries x pontos x pontos) montadas de uma vez
+ELEMENTOS_POR_LOTE = 4_000_000
+
+# Séries mais longas que isso não cabem num lote: são calculadas sozinhas, em blocos de linhas
+PONTOS_POR_LOTE = math.isqrt(ELEMENTOS_POR_LOTE)
+
+# Valores por (rio, parametro, data); medições repetidas na mesma data viram a média
+SERIES_SQL = """
+SELECT cp.rio_id, cp.parametro_id, cp.datas, avg(cp.valor) AS valor
+FROM coletas_parametros cp
+WHERE cp.datas IS NOT NULL AND cp.rio_id = ANY(:rios)
+GROUP BY cp.rio_id, cp.parametro_id, cp.datas
+ORDER BY cp.rio_id, cp.parametro_id, cp.datas
+"""
+
+def mann_kendall(valores, anos):
+    """
+    Teste de Mann-Kendall e inclinação de Sen para várias séries de uma vez.
+
+    Args:
+        valores: matriz (séries x pontos) com NaN completando as séries mais curtas.
+        anos: mesma forma, com o instante de cada ponto em anos, crescente em cada linha.
+
+    Returns:
+        dict de vetores (uma posição por série): n, s, variancia, z, p_valor,
+        tau, inclinacao (unidades por ano) e intercepto (valor da reta em anos = 0).
+    """
+    valido = ~np.isnan(valores)
+    n = valido.sum(axis=1).astype(float)
+    pontos = valores.shape[1]
+
+    # [serie, i, j] = x_j - x_i
+    diferencas = valores[:, None, :] - valores[:, :, None]
+    intervalos = anos[:, None, :] - anos[:, :, None]
+    ambos = valido[:, :, None] & valido[:, None, :]
+    pares = ambos & np.triu(np.ones((pontos, pontos), dtype=bool), 1)
+
+    s = np.where(pares, np.sign(diferencas), 0).sum(axis=(1, 2))
+
+    # Empates: cada valor repetido t vezes entra t vezes com (t - 1)(2t + 5), o
+    # que dá o termo t(t - 1)(2t + 5) por grupo da correção da variância
+    repeticoes = ((diferencas == 0) & ambos).sum(axis=2).astype(float)
+    correcao = np.where(valido, (repeticoes - 1) * (2 * repeticoes + 5), 0).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inclinacoes = np.where(pares & (intervalos > 0), diferencas / intervalos, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # séries sem pares válidos
+        inclinacao = np.nanmedian(inclinacoes.reshape(len(valores), -1), axis=1)
+        intercepto = np.nanmedian(valores - inclinacao[:, None] * anos, axis=1)
+
+    return _estatisticas(n, s.astype(float), correcao, inclinacao, intercepto)
+
+
+def _estatisticas(n, s, correcao, inclinacao, intercepto):
+    """Variância, z, p-valor e tau a partir de S e da correção de empates."""
+    variancia = (n * (n - 1) * (2 * n + 5) - correcao) / 18
+    with np.errstate(divide="ignore", invalid="ignore"):
+        desvio = np.sqrt(variancia)
+        z = np.where(s > 0, (s - 1) / desvio, np.where(s < 0, (s + 1) / desvio, 0.0))
+        z = np.where(variancia > 0, z, np.nan)
+        tau = s / (n * (n - 1) / 2)
+    p_valor = np.array([math.erfc(abs(v) / math.sqrt(2)) if not np.isnan(v) else np.nan for v in z])
+    return {
+        "n": n, "s": s, "variancia": variancia, "z": z, "p_valor": p_valor,
+        "tau": tau, "inclinacao": inclinacao, "intercepto": intercepto,
+    }
+
+
+def _pares_em_blocos(valores, anos):
+    """
+    Diferenças e intervalos dos pares (i < j) de uma série, em blocos de linhas i
+    com no máximo ELEMENTOS_POR_LOTE elementos cada.
+    """
+    pontos = len(valores)
+    linhas = max(1, ELEMENTOS_POR_LOTE // pontos)
+    for inicio in range(0, pontos - 1, linhas):
+        fim = min(pontos - 1, inicio + linhas)
+        diferencas = valores[None, inicio + 1:] - valores[inicio:fim, None]
+        intervalos = anos[None, inicio + 1:] - anos[inicio:fim, None]
+        # Coluna c é o ponto inicio + 1 + c; vale só se vem depois da linha
+        depois = np.arange(inicio + 1, pontos)[None, :] > np.arange(inicio, fim)[:, None]
+        yield diferencas, intervalos, depois
+
+
+def _k_esimo(blocos, k: int, total: int) -> float:
+    """
+    k-ésimo menor (a partir de 0) dos `total` valores gerados por blocos(), sem
+    guardá-los todos: a cada passada o intervalo aberto que contém o k-ésimo é
+    dividido pelos quantis de uma amostra, até sobrarem poucos para ordenar.
+    """
+    abaixo, acima = -np.inf, np.inf
+    while total > ELEMENTOS_POR_LOTE:
+        passo = max(1, total // 1000)
+        limites = np.unique(np.concatenate(
+            [v[(v > abaixo) & (v < acima)][::passo].copy() for v in blocos()]   # sem prender o bloco
+        ))
+        # Código 2i: entre limites[i - 1] e limites[i]; 2i + 1: igual a limites[i]
+        contagem = np.zeros(2 * len(limites) + 1, dtype=np.int64)
+        for v in blocos():
+            v = v[(v > abaixo) & (v < acima)]
+            i = np.searchsorted(limites, v)
+            igual = limites[np.minimum(i, len(limites) - 1)] == v
+            contagem += np.bincount(2 * i + igual, minlength=len(contagem))
+        acumulada = np.cumsum(contagem)
+        codigo = int(np.searchsorted(acumulada, k, side="right"))
+        k -= int(acumulada[codigo - 1]) if codigo else 0
+        i = codigo // 2
+        if codigo % 2:
+            return float(limites[i])
+        abaixo = limites[i - 1] if i else abaixo
+        acima = limites[i] if i < len(limites) else acima
+        total = int(contagem[codigo])
+    restantes = np.concatenate([v[(v > abaixo) & (v < acima)] for v in blocos()])
+    return float(np.partition(restantes, k)[k])
+
+
+def _mann_kendall_longa(valores, anos):
+    """
+    mann_kendall de uma série só, longa demais para a matriz pontos x pontos:
+    S, empates e inclinação de Sen acumulados em blocos de linhas.
+    """
+    n = float(len(valores))
+    s = 0.0
+    pares = 0
+    for diferencas, intervalos, depois in _pares_em_blocos(valores, anos):
+        s += float(np.sign(diferencas[depois]).sum())
+        pares += int((depois & (intervalos > 0)).sum())
+    _, repeticoes = np.unique(valores, return_counts=True)
+    correcao = float((repeticoes * (repeticoes - 1) * (2 * repeticoes + 5)).sum())
+
+    def inclinacoes():
+        for diferencas, intervalos, depois in _pares_em_blocos(valores, anos):
+            validos = depois & (intervalos > 0)
+            yield diferencas[validos] / intervalos[validos]
+
+    if pares:
+        meio = pares // 2
+        if pares % 2:
+            inclinacao = _k_esimo(inclinacoes, meio, pares)
+        else:
+            # Média do (meio - 1)-ésimo e do seguinte, que é ele mesmo ou o menor acima dele
+            inferior = _k_esimo(inclinacoes, meio - 1, pares)
+            ate, superior = 0, np.inf
+            for v in inclinacoes():
+                ate += int((v <= inferior).sum())
+                superior = min(superior, v[v > inferior].min(initial=np.inf))
+            inclinacao = (inferior + (inferior if ate > meio else superior)) / 2
+        intercepto = float(np.median(valores - inclinacao * anos))
+    else:
+        inclinacao = intercepto = np.nan
+    return _estatisticas(
+        np.array([n]), np.array([s]), np.array([correcao]), np.array([inclinacao]), np.array([intercepto])
+    )
+
+
+def _anomalias_mensais(serie, valores, meses):
+    """Subtrai de cada valor a média do mesmo mês do ano na sua série."""
+    grupo = serie * 12 + meses
+    soma = np.bincount(grupo, weights=valores, minlength=grupo.max() + 1)
+    contagem = np.bincount(grupo, minlength=grupo.max() + 1)
+    return valores - soma[grupo] / contagem[grupo]
+
+
+def _em_lotes(tamanhos):
+    """
+    Agrupa as séries, da mais curta à mais longa, em lotes que cabem em
+    ELEMENTOS_POR_LOTE. As com mais de PONTOS_POR_LOTE pontos ficam de fora.
+    """
+    lote = []
+    for indice in np.argsort(tamanhos, kind="stable"):
+        maior = tamanhos[indice]
+        if maior > PONTOS_POR_LOTE:
+            break
+        if lote and (len(lote) + 1) * maior * maior > ELEMENTOS_POR_LOTE:
+            yield lote
+            lote = []
+        lote.append(indice)
+    if lote:
+        yield lote
+
+
+def calcular(serie, datas, valores, dessazonalizar: bool = False):
+    """
+    Calcula as tendências de todas as séries de uma vez.
+
+    Args:
+        serie: índice da série de cada ponto (0..k-1), com os pontos de cada série
+            contíguos e em ordem de data.
+        datas: data de cada ponto.
+        valores: valor de cada ponto.
+        dessazonalizar: usa as anomalias em relação à média de cada mês.
+
+    Returns:
+        dict de vetores com uma posição por série (ver mann_kendall).
+    """
+    serie = np.asarray(serie)
+    valores = np.asarray(valores, dtype=float)
+    ordinais = np.array([d.toordinal() for d in datas], dtype=float)
+    if dessazonalizar:
+        valores = _anomalias_mensais(serie, valores, np.array([d.month - 1 for d in datas]))
+
+    inicios = np.searchsorted(serie, np.arange(serie.max() + 1))
+    tamanhos = np.diff(np.append(inicios, len(serie)))
+    # Anos contados a partir da primeira data da série: o intercepto é o valor inicial
+    anos = (ordinais - ordinais[inicios][serie]) / 365.25
+    posicao = np.arange(len(serie)) - inicios[serie]
+
+    resultado = {}
+    for indice in np.flatnonzero(tamanhos > PONTOS_POR_LOTE):
+        pontos = slice(inicios[indice], inicios[indice] + tamanhos[indice])
+        for nome, vetor in _mann_kendall_longa(valores[pontos], anos[pontos]).items():
+            resultado.setdefault(nome, np.full(len(tamanhos), np.nan))[indice] = vetor[0]
+    for lote in _em_lotes(tamanhos):
+        lote = np.array(lote)
+        linha = np.full(len(tamanhos), -1)
+        linha[lote] = np.arange(len(lote))
+        pontos = linha[serie] >= 0
+        matriz_valores = np.full((len(lote), tamanhos[lote].max()), np.nan)
+        matriz_anos = np.zeros_like(matriz_valores)
+        matriz_valores[linha[serie][pontos], posicao[pontos]] = valores[pontos]
+        matriz_anos[linha[serie][pontos], posicao[pontos]] = anos[pontos]
+
+        for nome, vetor in mann_kendall(matriz_valores, matriz_anos).items():
+            resultado.setdefault(nome, np.full(len(tamanhos), np.nan))[lote] = vetor
+    return resultado
+
+
+def _numero(valor):
+    return None if np.isnan(valor) else float(valor)
+
+
+def recalcular(db: Session, rio_ids) -> int:
+    """
+    Recalcula e grava as tendências (originais e dessazonalizadas) de todas as
+    séries dos rios indicados. Retorna o número de séries calculadas.
+    """
+    rio_ids = sorted(rio_ids)
+    if not rio_ids:
+        return 0
+    # Serializa recálculos simultâneos do mesmo rio (threads de fundo de workers diferentes)
+    for rio_id in rio_ids:
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('tendencias'), :rio_id)"), {"rio_id": rio_id})
+    cursor = derivados.cursor_atual(db)
+    linhas = db.execute(text(SERIES_SQL), {"rios": rio_ids}).all()
+
+    for modelo in (Tendencia, TendenciaRio):
+        db.query(modelo).filter(modelo.rio_id.in_(rio_ids)).delete(synchronize_session=False)
+    db.add_all([TendenciaRio(rio_id=rio_id, cursor=cursor) for rio_id in rio_ids])
+    db.flush()
+    if not linhas:
+        return 0
+
+    rios, parametros, datas, valores = zip(*linhas)
+    rios = np.array(rios)
+    parametros = np.array(parametros)
+    nova_serie = np.ones(len(linhas), dtype=bool)
+    nova_serie[1:] = (rios[1:] != rios[:-1]) | (parametros[1:] != parametros[:-1])
+    serie = np.cumsum(nova_serie) - 1
+    inicios = np.flatnonzero(nova_serie)
+    fins = np.append(inicios[1:], len(linhas)) - 1
+
+    registros = []
+    for dessazonalizado in (False, True):
+        resultado = calcular(serie, datas, valores, dessazonalizado)
+        for k, (inicio, fim) in enumerate(zip(inicios, fins)):
+            suficiente = resultado["n"][k] >= MINIMO_PONTOS
+            registro = {
+                "rio_id": int(rios[inicio]),
+                "parametro_id": int(parametros[inicio]),
+                "dessazonalizado": dessazonalizado,
+                "n": int(resultado["n"][k]),
+                "inicio": datas[inicio],
+                "fim": datas[fim],
+                "cursor": cursor,
+            }
+            for nome in ("s", "variancia", "z", "p_valor", "tau", "inclinacao", "intercepto"):
+                registro[nome] = _numero(resultado[nome][k]) if suficiente else None
+            registros.append(registro)
+
+    for inicio in range(0, len(registros), 1000):
+        comando = insert(Tendencia).values(registros[inicio:inicio + 1000])
+        db.execute(comando.on_conflict_do_update(
+            index_elements=[Tendencia.rio_id, Tendencia.parametro_id, Tendencia.dessazonalizado],
+            set_={
+                coluna: comando.excluded[coluna]
+                for coluna in registros[0] if coluna not in ("rio_id", "parametro_id", "dessazonalizado")
+            } | {"calculado_em": func.now()},
+        ))
+    return len(inicios)
+
+
+def atualizar():
+    """
+    Recalcula as tendências dos rios pendentes e avança o cursor dos demais, que
+    não tiveram alterações nas coletas até ele.
+    """
+    db = SessionLocal()
+    try:
+        cursor = derivados.cursor_atual(db)
+        desatualizados = derivados.pendentes(db, TendenciaRio)
+        series = recalcular(db, desatualizados)
+        derivados.avancar(db, TendenciaRio, cursor, desatualizados)
+        db.commit()
+        if desatualizados:
+            logger.info(f"Tendências recalculadas: {series} séries de {len(desatualizados)} rios")
+    finally:
+        db.close()
+
+
+tarefa_atualizacao = TarefaUnica("tendencias", atualizar)
+
+
+@eventos.inscrever_local
+def _agendar_atualizacao(alteracoes):
+    """Depois de uma ingestão, recalcula em segundo plano as tendências dos rios afetados."""
+    if any(tabela in ("coletas", "coletas_parametros") for tabela, _ in alteracoes):
+        tarefa_atualizacao.agendar()
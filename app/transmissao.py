@@ -0,0 +1,207 @@
+import asyncio
+import json
+from threading import Event, Lock, Thread, current_thread
+from sqlalchemy import text
+from database import SessionLocal
+from models import CURSOR_ALTERACOES_SQL
+from configuracao import configuracoes, logger
+import eventos
+
+# Transmissão das medições novas para GET /coletas/stream (Server-Sent Events).
+#
+# Uma única thread publicadora lê, a cada commit que mexe em coletas_parametros,
+# as linhas com seq_alteracao acima do último publicado e entrega os eventos a
+# todos os inscritos; N clientes custam uma consulta por commit, não N consultas
+# por intervalo de polling. O id de cada evento é o seq_alteracao (o mesmo cursor
+# do GET /sync), então um cliente que reconecta com Last-Event-ID recebe do banco
+# o que perdeu. Commits de outros workers também a acordam, pelo barramento; sem
+# ele (ou se uma notificação se perder), a thread confere o banco a cada
+# TRANSMISSAO_INTERVALO_SEGUNDOS.
+
+MEDICOES_SQL = """
+SELECT cp.seq_alteracao AS seq, c.id, c.codigo, c.locali, c.rio_id, c.datas,
+       c.latitude, c.longitude, c.replica, cp.parametro_id, cp.valor, cp.atipico
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id
+WHERE cp.seq_alteracao > :desde AND cp.seq_alteracao <= :ate
+ORDER BY cp.seq_alteracao
+LIMIT :limite
+"""
+
+
+TAMANHO_PAGINA = 1000
+FIM = 2 ** 62  # limite superior de seq_alteracao para buscas sem teto
+
+
+def _agrupar(linhas) -> list:
+    """
+    Um evento por coleta, com as medições dela na ordem de seq. As medições de uma
+    coleta grande podem vir divididas em mais de um evento (mesmo "id" de coleta).
+    """
+    resultado = []
+    for linha in linhas:
+        if not resultado or resultado[-1]["coleta"]["id"] != linha.id:
+            resultado.append({
+                "seq": linha.seq,
+                "coleta": {
+                    "id": linha.id, "codigo": linha.codigo, "locali": linha.locali,
+                    "rio_id": linha.rio_id, "datas": linha.datas.isoformat() if linha.datas else None,
+                    "latitude": linha.latitude, "longitude": linha.longitude, "replica": linha.replica,
+                    "coletas_parametros": [],
+                },
+            })
+        evento = resultado[-1]
+        evento["seq"] = linha.seq
+        evento["coleta"]["coletas_parametros"].append(
+            {"parametro_id": linha.parametro_id, "valor": linha.valor, "atipico": linha.atipico}
+        )
+    return resultado
+
+
+def buscar(desde: int, ate: int) -> tuple:
+    """
+    Uma página de eventos com seq em (desde, ate], sem passar do horizonte das
+    alterações. Devolve (eventos, mais); com mais verdadeiro, a próxima página
+    começa no seq do último evento.
+    """
+    db = SessionLocal()
+    try:
+        # Numa instrução própria, antes das medições: tudo até ele já está confirmado
+        ate = min(ate, db.execute(text(CURSOR_ALTERACOES_SQL)).scalar())
+        linhas = db.execute(
+            text(MEDICOES_SQL), {"desde": desde, "ate": ate, "limite": TAMANHO_PAGINA}
+        ).all()
+    finally:
+        db.close()
+    return _agrupar(linhas), len(linhas) == TAMANHO_PAGINA
+
+
+def formatar(evento: dict, parametro_id: int = None) -> str:
+    coleta = evento["coleta"]
+    if parametro_id is not None:
+        coleta = dict(coleta, coletas_parametros=[
+            cp for cp in coleta["coletas_parametros"] if cp["parametro_id"] == parametro_id
+        ])
+    return f"id: {evento['seq']}\nevent: coleta\ndata: {json.dumps(coleta)}\n\n"
+
+
+class Inscrito:
+    def __init__(self, rio_id: int = None, parametro_id: int = None):
+        self.loop = None        # loop da requisição, definido quando a transmissão começa
+        self.rio_id = rio_id
+        self.parametro_id = parametro_id
+        self.fila = asyncio.Queue(maxsize=configuracoes.TRANSMISSAO_FILA)
+        self.atrasado = False   # a fila encheu e houve descarte: precisa reler do banco
+
+    def aceita(self, evento: dict) -> bool:
+        coleta = evento["coleta"]
+        if self.rio_id is not None and coleta["rio_id"] != self.rio_id:
+            return False
+        if self.parametro_id is not None:
+            return any(cp["parametro_id"] == self.parametro_id for cp in coleta["coletas_parametros"])
+        return True
+
+    def _entregar(self, eventos_publicados):
+        try:
+            self.fila.put_nowait(eventos_publicados)
+        except asyncio.QueueFull:
+            self.atrasado = True
+
+
+class Transmissao:
+    def __init__(self):
+        self.cursor = None          # maior seq já entregue aos inscritos
+        self.publicacoes = 0
+        self.eventos = 0
+        self._inscritos = set()
+        self._trava = Lock()
+        self._sinal = Event()
+        self._thread = None
+
+    def inscrever(self, inscrito: Inscrito) -> int:
+        """
+        Registra o inscrito e devolve o cursor atual: todo evento com seq acima dele
+        chegará na fila do inscrito. Chamar fora do loop (faz consulta na primeira vez).
+        """
+        with self._trava:
+            if self.cursor is None:
+                db = SessionLocal()
+                try:
+                    self.cursor = db.execute(text(CURSOR_ALTERACOES_SQL)).scalar()
+                finally:
+                    db.close()
+            self._inscritos.add(inscrito)
+            if self._thread is None:
+                self._thread = Thread(target=self._executar, name="transmissao", daemon=True)
+                self._thread.start()
+            return self.cursor
+
+    def cancelar(self, inscrito: Inscrito):
+        with self._trava:
+            self._inscritos.discard(inscrito)
+
+    def avisar(self):
+        self._sinal.set()
+
+    def metricas(self) -> dict:
+        return {
+            "inscritos": len(self._inscritos),
+            "cursor": self.cursor,
+            "publicacoes": self.publicacoes,
+            "eventos": self.eventos,
+        }
+
+    def _executar(self):
+        try:
+            while True:
+                self._sinal.wait(timeout=configuracoes.TRANSMISSAO_INTERVALO_SEGUNDOS)
+                self._sinal.clear()
+                with self._trava:
+                    if not self._inscritos:
+                        # Sem ninguém ouvindo não há o que publicar; o próximo inscrito relê o cursor
+                        self.cursor = None
+                        self._thread = None
+                        return
+                    cursor = self.cursor
+                try:
+                    self._atualizar(cursor)
+                except Exception as e:
+                    # A thread segue: o que faltou é relido do banco no próximo aviso
+                    logger.error(f"Erro ao transmitir medições: {str(e)}")
+        finally:
+            # Saída inesperada: libera o lugar para o próximo inscrito iniciar outra thread
+            with self._trava:
+                if self._thread is current_thread():
+                    self._thread = None
+
+    def _atualizar(self, cursor):
+        mais = True
+        while mais:
+            novos, mais = buscar(cursor, FIM)
+            if not novos:
+                break
+            cursor = novos[-1]["seq"]
+            self._publicar(novos)
+
+    def _publicar(self, novos):
+        with self._trava:
+            self.cursor = novos[-1]["seq"]
+            self.publicacoes += 1
+            self.eventos += len(novos)
+            for inscrito in list(self._inscritos):
+                selecionados = [evento for evento in novos if inscrito.aceita(evento)]
+                if selecionados:
+                    try:
+                        inscrito.loop.call_soon_threadsafe(inscrito._entregar, selecionados)
+                    except RuntimeError:
+                        # Loop da requisição já fechado: o cliente se foi sem cancelar
+                        self._inscritos.discard(inscrito)
+
+
+transmissao = Transmissao()
+
+
+@eventos.inscrever
+def _avisar_transmissao(alteracoes):
+    if any(tabela == "coletas_parametros" for tabela, _ in alteracoes):
+        transmissao.avisar()
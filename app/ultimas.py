@@ -0,0 +1,114 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Tabela ultimas_medicoes: a medição mais recente de cada (rio, parametro, local).
+# "Mais recente" é a coleta de maior data (sem data conta como a mais antiga) e,
+# no empate, a de maior id. A ingestão mantém a tabela; RECALCULAR_SQL a refaz do zero.
+
+_COLUNAS = "rio_id, parametro_id, locali, coleta_id, datas, valor, atipico"
+
+_ORDEM = "c.rio_id, cp.parametro_id, coalesce(c.locali, ''), c.datas DESC NULLS LAST, c.id DESC"
+
+_SELECAO = f"""
+SELECT DISTINCT ON (c.rio_id, cp.parametro_id, coalesce(c.locali, ''))
+       c.rio_id, cp.parametro_id, coalesce(c.locali, ''), c.id, c.datas, cp.valor, cp.atipico
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id
+"""
+
+# Medições recém-gravadas: só substituem a linha guardada se forem tão ou mais recentes
+ATUALIZAR_SQL = f"""
+INSERT INTO ultimas_medicoes ({_COLUNAS})
+{_SELECAO}
+JOIN unnest(CAST(:coletas AS integer[]), CAST(:parametros AS integer[])) AS n(coleta_id, parametro_id)
+  ON n.coleta_id = cp.coleta_id AND n.parametro_id = cp.parametro_id
+WHERE c.rio_id IS NOT NULL
+ORDER BY {_ORDEM}
+ON CONFLICT (rio_id, parametro_id, locali) DO UPDATE SET
+    coleta_id = EXCLUDED.coleta_id, datas = EXCLUDED.datas, valor = EXCLUDED.valor,
+    atipico = EXCLUDED.atipico, atualizado_em = now()
+WHERE (coalesce(EXCLUDED.datas, '-infinity'), EXCLUDED.coleta_id)
+   >= (coalesce(ultimas_medicoes.datas, '-infinity'), ultimas_medicoes.coleta_id)
+"""
+
+RECALCULAR_SQL = f"""
+INSERT INTO ultimas_medicoes ({_COLUNAS})
+{_SELECAO}
+WHERE c.rio_id IS NOT NULL {{filtro}}
+ORDER BY {_ORDEM}
+"""
+
+ATIPICOS_SQL = """
+UPDATE ultimas_medicoes u SET atipico = cp.atipico, atualizado_em = now()
+FROM coletas_parametros cp
+WHERE cp.coleta_id = u.coleta_id AND cp.parametro_id = u.parametro_id
+  AND cp.atipico IS DISTINCT FROM u.atipico
+"""
+
+
+def atualizar(db: Session, medicoes) -> None:
+    """
+    Leva para ultimas_medicoes as medições recém-gravadas (objetos com coleta_id e
+    parametro_id) que sejam as mais recentes do seu rio, parametro e local.
+    """
+    medicoes = list(medicoes)
+    if not medicoes:
+        return
+    db.execute(text(ATUALIZAR_SQL), {
+        "coletas": [m.coleta_id for m in medicoes],
+        "parametros": [m.parametro_id for m in medicoes],
+    })
+
+
+def recalcular(db: Session, rio_ids=None) -> None:
+    """
+    Refaz ultimas_medicoes dos rios indicados (ou de todos) a partir das coletas.
+    """
+    if rio_ids is None:
+        db.execute(text("DELETE FROM ultimas_medicoes"))
+        db.execute(text(RECALCULAR_SQL.format(filtro="")))
+        return
+    rio_ids = list(rio_ids)
+    db.execute(text("DELETE FROM ultimas_medicoes WHERE rio_id = ANY(:rios)"), {"rios": rio_ids})
+    db.execute(text(RECALCULAR_SQL.format(filtro="AND c.rio_id = ANY(:rios)")), {"rios": rio_ids})
+
+
+def atualizar_atipicos(db: Session) -> None:
+    """Copia para ultimas_medicoes a marcação de atípico atual das medições."""
+    db.execute(text(ATIPICOS_SQL))
+
+
+CONSULTA_SQL = """
+SELECT {distinto} u.parametro_id, p.nome, p.categoria, u.locali, u.valor, u.datas, u.atipico, c.codigo
+FROM ultimas_medicoes u
+JOIN parametros p ON p.id = u.parametro_id
+JOIN coletas c ON c.id = u.coleta_id
+WHERE u.rio_id = :rio_id {filtro}
+ORDER BY u.parametro_id, u.datas DESC NULLS LAST, u.coleta_id DESC
+"""
+
+
+def consultar(db: Session, rio_id: int, parametro_id: int = None, por_local: bool = False) -> list:
+    """
+    Medições mais recentes de um rio: uma por parametro ou, com `por_local`, uma por
+    parametro e local. Lê só as linhas do rio na chave primária de ultimas_medicoes.
+    """
+    consulta = CONSULTA_SQL.format(
+        distinto="" if por_local else "DISTINCT ON (u.parametro_id)",
+        filtro="AND u.parametro_id = :parametro_id" if parametro_id is not None else "",
+    )
+    linhas = db.execute(text(consulta), {"rio_id": rio_id, "parametro_id": parametro_id}).all()
+    return [
+        {
+            "parametro": nome,
+            "categoria": categoria,
+            "local": locali or None,
+            "valor": valor,
+            "data": datas.isoformat() if datas is not None else None,
+            "coleta": coleta,
+            "atipico": atipico,
+        }
+        for _, nome, categoria, locali, valor, datas, atipico, coleta in sorted(
+            linhas, key=lambda l: (l.nome, l.locali)
+        )
+    ]
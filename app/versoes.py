@@ -0,0 +1,182 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from threading import Lock
+from fastapi import Request, Response
+from sqlalchemy import text
+from database import SessionLocal
+from models import CURSOR_ALTERACOES_SQL, TABELAS_VERSIONADAS
+from configuracao import configuracoes
+import eventos
+
+# Versão e instante da última alteração de cada tabela, como visto por este processo.
+# A versão vem da própria sequência seq_alteracoes (ver models.py), sem contador
+# gravado a cada commit: é o par (maior número da tabela até o horizonte, maior
+# número visível). O primeiro só cresce quando tudo abaixo dele já confirmou, então
+# uma transação que confirma fora de ordem ainda muda a versão; o segundo faz uma
+# escrita aparecer no ETag assim que confirma, mesmo antes do horizonte passar dela.
+_versoes = {}
+_carregado_em = None
+_posicao = None
+_commits = 0
+_trava = Lock()
+_trava_recarga = Lock()
+
+# Posição do WAL do primário; uma réplica que já a reproduziu tem tudo o que as versões refletem
+POSICAO_WAL_SQL = "SELECT (pg_current_wal_insert_lsn() - '0/0')::bigint"
+
+# Um índice de seq_alteracao em cada tabela e exclusoes (tabela, seq): cada max() é uma descida no índice
+VERSOES_SQL = "SELECT /* versoes */ tabela, confirmada, visivel FROM (" + " UNION ALL ".join(
+    f"""
+    SELECT '{tabela}' AS tabela,
+        greatest(
+            (SELECT max(seq_alteracao) FROM {tabela} WHERE seq_alteracao <= :horizonte),
+            (SELECT max(seq) FROM exclusoes WHERE tabela = '{tabela}' AND seq <= :horizonte), 0
+        ) AS confirmada,
+        greatest(
+            (SELECT max(seq_alteracao) FROM {tabela}),
+            (SELECT max(seq) FROM exclusoes WHERE tabela = '{tabela}'), 0
+        ) AS visivel"""
+    for tabela in TABELAS_VERSIONADAS
+) + "\n) versoes"
+
+_INICIO = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class NaoModificado(Exception):
+    """O cliente já tem a versão atual do recurso (resposta 304)."""
+
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+
+def _atualizar(linhas):
+    agora = datetime.now(timezone.utc)
+    with _trava:
+        for tabela, confirmada, visivel in linhas:
+            atual = _versoes.get(tabela)
+            if atual is None:
+                _versoes[tabela] = ((confirmada, visivel), agora)
+                continue
+            # Recargas simultâneas podem terminar fora de ordem: cada parte só cresce
+            versao = (max(confirmada, atual[0][0]), max(visivel, atual[0][1]))
+            if versao != atual[0]:
+                _versoes[tabela] = (versao, agora)
+
+
+def recarregar():
+    """
+    Lê todas as versões do banco. Cobre alterações feitas por outros processos.
+    """
+    global _carregado_em, _posicao
+    with _trava:
+        commits_antes = _commits
+    db = SessionLocal()
+    try:
+        # O horizonte numa instrução própria, antes das versões (ver horizonte_alteracoes)
+        horizonte = db.execute(text(CURSOR_ALTERACOES_SQL)).scalar()
+        linhas = db.execute(text(VERSOES_SQL), {"horizonte": horizonte}).all()
+        # Lida depois das versões: cobre todo commit que elas já mostram
+        posicao = db.execute(text(POSICAO_WAL_SQL)).scalar()
+    finally:
+        db.close()
+    _atualizar(linhas)
+    with _trava:
+        # Um commit durante a leitura pode não estar nas versões nem coberto pela posição lida
+        recente = _commits == commits_antes
+        _posicao = posicao if recente else None
+    _carregado_em = time.monotonic() if recente else None
+
+
+def _recarregar_se_vencido():
+    def vencido():
+        return _carregado_em is None or time.monotonic() - _carregado_em > configuracoes.VALIDADE_VERSOES_SEGUNDOS
+
+    if vencido():
+        with _trava_recarga:    # uma recarga por vez; quem esperou aproveita a dela
+            if vencido():
+                recarregar()
+
+
+def obter(tabelas):
+    """
+    Retorna {tabela: (versão, alterado_em)} das tabelas pedidas.
+
+    Usa a cópia em memória; o banco só é consultado depois de um commit (deste ou de
+    outro worker, pelo barramento) ou quando ela tem mais de VALIDADE_VERSOES_SEGUNDOS.
+    """
+    _recarregar_se_vencido()
+    with _trava:
+        return {tabela: _versoes.get(tabela, ((0, 0), _INICIO)) for tabela in tabelas}
+
+
+def posicao():
+    """
+    Posição do WAL que uma réplica precisa ter reproduzido para mostrar dados pelo
+    menos tão novos quanto as versões em memória (e os ETags gerados com elas).
+    None se um commit aconteceu durante a última recarga.
+    """
+    _recarregar_se_vencido()
+    with _trava:
+        return _posicao
+
+
+@eventos.inscrever
+def _invalidar(alteracoes):
+    """Commits locais e remotos: as versões são relidas na próxima consulta."""
+    global _posicao, _commits, _carregado_em
+    with _trava:
+        _commits += 1
+        _posicao = None
+    _carregado_em = None
+
+
+def _etag_confere(cabecalho: str, etag: str) -> bool:
+    candidatos = [c.strip() for c in cabecalho.split(",")]
+    return "*" in candidatos or etag in candidatos
+
+
+class Condicional:
+    """
+    Dependência que torna uma rota de leitura condicional (ETag / Last-Modified).
+
+    O ETag é derivado da URL e das versões das tabelas que a rota lê, então pode
+    ser comparado com If-None-Match antes de abrir conexão com o banco ou
+    serializar a resposta; se conferir, a rota termina com 304.
+
+    Uso:
+        @router.get("/rios", dependencies=[Depends(Condicional("rios"))])
+    """
+
+    def __init__(self, *tabelas: str):
+        self.tabelas = tabelas
+
+    def __call__(self, request: Request, response: Response):
+        versoes = obter(self.tabelas)
+        assinatura = "|".join(
+            [request.url.path, str(request.url.query)]
+            + [f"{tabela}:{versoes[tabela][0][0]}.{versoes[tabela][0][1]}" for tabela in self.tabelas]
+        )
+        etag = '"' + hashlib.sha1(assinatura.encode()).hexdigest()[:20] + '"'
+        ultima_alteracao = max(alterado_em for _, alterado_em in versoes.values())
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(ultima_alteracao.astimezone(timezone.utc), usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            if _etag_confere(if_none_match, etag):
+                raise NaoModificado(headers)
+        elif if_modified_since is not None:
+            try:
+                desde = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                desde = None
+            if desde is not None and ultima_alteracao.replace(microsecond=0) <= desde:
+                raise NaoModificado(headers)
+
+        response.headers.update(headers)
@@ -0,0 +1,87 @@
+"""
+Mede a latência das rotas baratas (GET /healthz e GET /rios) durante uma rajada de
+rotas analíticas.
+
+Sem controle de admissão, as rotas pesadas ocupam o threadpool e o pool de
+conexões e as baratas esperam atrás delas. Com o controle, as baratas devem ficar
+perto da latência sem carga; as pesadas excedentes recebem 503 com Retry-After.
+
+Uso (com a API rodando):
+    python benchmarks/admissao.py --url http://localhost:8000 --clientes 64 --duracao 10
+
+Para comparar sem o controle, suba a API com ADMISSAO_PESADAS_LIMITE=1000.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+import httpx
+
+PESADAS = ["/coletas", "/coletas/rio/DOC", "/analise/correlacao?rio=DOC&minimo={n}"]
+
+
+def percentis(amostras):
+    if not amostras:
+        return "sem amostras"
+    ordenadas = sorted(amostras)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return (
+        f"n={len(amostras)} p50={statistics.median(ordenadas) * 1000:.1f}ms "
+        f"p99={p99 * 1000:.1f}ms max={ordenadas[-1] * 1000:.1f}ms"
+    )
+
+
+async def baratas(cliente, rota, ate):
+    latencias = []
+    while time.monotonic() < ate:
+        inicio = time.monotonic()
+        resposta = await cliente.get(rota)
+        resposta.raise_for_status()
+        latencias.append(time.monotonic() - inicio)
+        await asyncio.sleep(0.05)
+    return latencias
+
+
+async def pesadas(cliente, indice, ate, status):
+    n = 0
+    while time.monotonic() < ate:
+        n += 1
+        # O "minimo" variável evita o cache de correlações
+        rota = PESADAS[(indice + n) % len(PESADAS)].format(n=2 + n % 50)
+        resposta = await cliente.get(rota)
+        status[resposta.status_code] += 1
+        if resposta.status_code == 503:
+            await asyncio.sleep(float(resposta.headers.get("Retry-After", 1)))
+
+
+async def principal(url, clientes, duracao):
+    limites = httpx.Limits(max_connections=clientes + 8)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limites) as cliente:
+        sem_carga = await asyncio.gather(
+            baratas(cliente, "/healthz", time.monotonic() + duracao / 2),
+            baratas(cliente, "/rios", time.monotonic() + duracao / 2),
+        )
+        print(f"/healthz sem carga:    {percentis(sem_carga[0])}")
+        print(f"/rios sem carga:       {percentis(sem_carga[1])}")
+
+        status = Counter()
+        ate = time.monotonic() + duracao
+        resultados = await asyncio.gather(
+            baratas(cliente, "/healthz", ate),
+            baratas(cliente, "/rios", ate),
+            *[pesadas(cliente, i, ate, status) for i in range(clientes)],
+        )
+        print(f"/healthz com rajada:   {percentis(resultados[0])}")
+        print(f"/rios com rajada:      {percentis(resultados[1])}")
+        print(f"Rotas pesadas:         {dict(status)}")
+        print(f"Métricas:              {(await cliente.get('/metricas/admissao')).json()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clientes", type=int, default=64, help="Clientes chamando rotas pesadas ao mesmo tempo")
+    parser.add_argument("--duracao", type=float, default=10, help="Segundos de rajada")
+    argumentos = parser.parse_args()
+    asyncio.run(principal(argumentos.url, argumentos.clientes, argumentos.duracao))
@@ -0,0 +1,127 @@
+"""
+Vazão da gravação de coletas enviadas uma a uma por muitas threads ao mesmo tempo,
+com e sem a gravação agrupada (agrupamento.py).
+
+Roda dentro do processo, contra o banco da API, chamando o mesmo código que
+POST /coletas chama (sem HTTP nem verificação da API key, que têm custo próprio):
+  - direto: repositorio.criar_coleta, um commit (um fsync) por coleta;
+  - agrupado: agrupamento.agrupador, um commit por lote de coletas simultâneas.
+
+As coletas vão para um rio e um parametro criados só para o benchmark (código e
+nome BENCH-AGR), apagados no fim junto com tudo o que a gravação deriva deles
+(estatísticas de atípicos, esboços de distribuição, últimas medições, IQA...).
+
+Uso:
+    python benchmarks/agrupamento.py --threads 32 --duracao 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREFIXO = "BENCH-AGR"
+
+CRIAR_SQL = f"""
+INSERT INTO rios (nome, codigo, descricao) VALUES ('{PREFIXO}', '{PREFIXO}', 'benchmarks/agrupamento.py');
+INSERT INTO parametros (nome, categoria) VALUES ('{PREFIXO}', 'benchmark');
+"""
+
+# Toda tabela com rio_id (coletas por último), depois o rio e o parametro
+APAGAR_SQL = f"""
+DO $$
+DECLARE
+    tabela text;
+BEGIN
+    FOR tabela IN
+        SELECT c.relname FROM pg_class c JOIN pg_attribute a ON a.attrelid = c.oid
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p')
+          AND NOT c.relispartition AND a.attname = 'rio_id' AND NOT a.attisdropped
+          AND c.relname <> 'coletas'
+    LOOP
+        EXECUTE format('DELETE FROM %I WHERE rio_id IN (SELECT id FROM rios WHERE codigo = %L)',
+                       tabela, '{PREFIXO}');
+    END LOOP;
+    DELETE FROM coletas WHERE rio_id IN (SELECT id FROM rios WHERE codigo = '{PREFIXO}');
+    DELETE FROM rios WHERE codigo = '{PREFIXO}';
+    DELETE FROM parametros WHERE nome = '{PREFIXO}';
+END $$;
+"""
+
+
+def medir(nome, gravar, argumentos):
+    from schemas import Coleta
+
+    latencias = []
+    ate = time.monotonic() + argumentos.duracao
+
+    def trabalhar(indice):
+        n = 0
+        while time.monotonic() < ate:
+            n += 1
+            coleta = Coleta(
+                codigo=f"{PREFIXO}-{indice}-{n}", locali="bench", rio_id=argumentos.rio,
+                datas="2020-01-01", latitude=-20.0, longitude=-43.0,
+                coletas_parametros=[{"parametro_id": argumentos.parametro, "valor": random.random() * 100}],
+            )
+            inicio = time.monotonic()
+            gravar(coleta)
+            latencias.append(time.monotonic() - inicio)
+
+    with ThreadPoolExecutor(argumentos.threads) as executor:
+        list(executor.map(trabalhar, range(argumentos.threads)))
+
+    ordenadas = sorted(latencias)
+    print(
+        f"{nome:9} {len(latencias) / argumentos.duracao:8.1f} coletas/s   "
+        f"p50={statistics.median(ordenadas) * 1000:.1f}ms p99={ordenadas[int(len(ordenadas) * 0.99)] * 1000:.1f}ms"
+    )
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32, help="Requisições simultâneas simuladas")
+    parser.add_argument("--duracao", type=float, default=5, help="Segundos de cada medição")
+    argumentos = parser.parse_args()
+
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    from database import SessionLocal, engine
+    import repositorio
+    from agrupamento import AgrupadorColetas
+    from sqlalchemy import text
+
+    with engine.begin() as conexao:
+        conexao.connection.cursor().execute(APAGAR_SQL)     # sobras de uma execução interrompida
+        conexao.connection.cursor().execute(CRIAR_SQL)
+        argumentos.rio = conexao.execute(text("SELECT id FROM rios WHERE codigo = :c"), {"c": PREFIXO}).scalar()
+        argumentos.parametro = conexao.execute(
+            text("SELECT id FROM parametros WHERE nome = :n"), {"n": PREFIXO}
+        ).scalar()
+
+    def direto(coleta):
+        db = SessionLocal()
+        try:
+            repositorio.criar_coleta(db, coleta)
+        finally:
+            db.close()
+
+    agrupador = AgrupadorColetas(maximo=64, espera_ms=5, commit_sincrono=True)
+    sem_fsync = AgrupadorColetas(maximo=64, espera_ms=5, commit_sincrono=False)
+    try:
+        medir("direto", direto, argumentos)
+        medir("agrupado", lambda coleta: agrupador.enviar(coleta).result(), argumentos)
+        medir("assíncrono", lambda coleta: sem_fsync.enviar(coleta).result(), argumentos)
+        print(f"\nLotes (agrupado): {agrupador.metricas()}")
+    finally:
+        agrupador.encerrar()
+        sem_fsync.encerrar()
+        with engine.begin() as conexao:
+            conexao.connection.cursor().execute(APAGAR_SQL)
+
+
+if __name__ == "__main__":
+    principal()
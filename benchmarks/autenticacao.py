@@ -0,0 +1,84 @@
+"""
+Mede a latência das leituras (GET /rios) enquanto a API recebe uma rajada de logins.
+
+Com o bcrypt no threadpool, as leituras síncronas esperam atrás dos logins; com o
+pool de senhas, as leituras devem ficar perto da latência sem carga, e os logins
+excedentes recebem 503 rapidamente.
+
+Uso (com a API rodando):
+    python benchmarks/autenticacao.py --url http://localhost:8000 --logins 64 --duracao 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+import httpx
+
+EMAIL = "benchmark@exemplo.com"
+SENHA = "benchmark"
+
+
+def percentis(amostras):
+    if not amostras:
+        return "sem amostras"
+    ordenadas = sorted(amostras)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return (
+        f"n={len(amostras)} p50={statistics.median(ordenadas) * 1000:.1f}ms "
+        f"p95={p95 * 1000:.1f}ms max={ordenadas[-1] * 1000:.1f}ms"
+    )
+
+
+async def leituras(cliente, ate):
+    latencias = []
+    while time.monotonic() < ate:
+        inicio = time.monotonic()
+        resposta = await cliente.get("/rios")
+        resposta.raise_for_status()
+        latencias.append(time.monotonic() - inicio)
+        await asyncio.sleep(0.05)
+    return latencias
+
+
+async def logins(cliente, ate, status):
+    latencias = []
+    while time.monotonic() < ate:
+        inicio = time.monotonic()
+        resposta = await cliente.post(
+            "/autenticacao/login", data={"username": EMAIL, "password": SENHA}
+        )
+        status[resposta.status_code] += 1
+        latencias.append(time.monotonic() - inicio)
+        if resposta.status_code == 503:
+            await asyncio.sleep(float(resposta.headers.get("Retry-After", 1)))
+    return latencias
+
+
+async def principal(url, concorrencia, duracao):
+    limites = httpx.Limits(max_connections=concorrencia + 8)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limites) as cliente:
+        await cliente.post("/usuarios/", json={"nome": "Benchmark", "email": EMAIL, "senha": SENHA})
+
+        sem_carga = await leituras(cliente, time.monotonic() + duracao / 2)
+        print(f"Leituras sem carga:      {percentis(sem_carga)}")
+
+        status = Counter()
+        ate = time.monotonic() + duracao
+        resultados = await asyncio.gather(
+            leituras(cliente, ate),
+            *[logins(cliente, ate, status) for _ in range(concorrencia)],
+        )
+        print(f"Leituras durante logins: {percentis(resultados[0])}")
+        print(f"Logins:                  {percentis([l for r in resultados[1:] for l in r])}")
+        print(f"Logins por segundo:      {status[200] / duracao:.1f}")
+        print(f"Respostas de login:      {dict(status)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=64, help="Clientes fazendo login ao mesmo tempo")
+    parser.add_argument("--duracao", type=float, default=10, help="Segundos de rajada")
+    argumentos = parser.parse_args()
+    asyncio.run(principal(argumentos.url, argumentos.logins, argumentos.duracao))
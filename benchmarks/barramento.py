@@ -0,0 +1,84 @@
+"""
+Latência do barramento de invalidação (barramento.py) entre processos.
+
+Este processo faz o papel de um worker ouvindo o canal; um processo filho faz o
+de outro worker, confirmando --commits transações que alteram "rios" (como um
+PUT /rios faria) em intervalos de --intervalo-ms. Mede o tempo entre o fim do
+commit no filho e a entrega das alterações aos ouvintes daqui.
+Valores negativos são possíveis: a notificação pode chegar antes de commit()
+retornar no filho, que ainda roda os próprios ouvintes.
+
+Atenção: cada commit incrementa a versão da tabela rios no banco da API; APIs
+rodando contra o mesmo banco descartam seus caches como numa alteração real.
+
+Uso:
+    python benchmarks/barramento.py
+    python benchmarks/barramento.py --commits 500 --intervalo-ms 2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ESCREVER = """
+import json, sys, time
+from database import SessionLocal
+import barramento, eventos  # noqa: F401 - registra a publicação no commit
+commits, intervalo = int(sys.argv[1]), float(sys.argv[2]) / 1000
+instantes = []
+for _ in range(commits):
+    db = SessionLocal()
+    eventos.registrar_alteracao(db, "rios")
+    db.commit()
+    instantes.append(time.time())
+    db.close()
+    time.sleep(intervalo)
+sys.__stdout__.write("\\n@@" + json.dumps(instantes))
+"""
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--intervalo-ms", type=float, default=5.0)
+    argumentos = parser.parse_args()
+
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    import barramento
+    import eventos
+
+    recebidas = []
+
+    @eventos.inscrever
+    def _registrar(alteracoes):
+        if ("rios", None) in alteracoes:
+            recebidas.append(time.time())
+
+    barramento.iniciar()
+    processo = subprocess.run(
+        [sys.executable, "-c", ESCREVER, str(argumentos.commits), str(argumentos.intervalo_ms)],
+        capture_output=True, text=True, check=True,
+    )
+    confirmadas = json.loads(processo.stdout.rpartition("\n@@")[2])
+
+    prazo = time.time() + 5
+    while len(recebidas) < len(confirmadas) and time.time() < prazo:
+        time.sleep(0.01)
+
+    latencias = sorted((r - c) * 1000 for c, r in zip(confirmadas, recebidas))
+    print(f"commits: {len(confirmadas)}  notificações recebidas: {len(recebidas)}")
+    if latencias:
+        p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+        print(f"latência commit -> ouvintes (ms): mediana {statistics.median(latencias):.2f}  "
+              f"p99 {p99:.2f}  máx {latencias[-1]:.2f}")
+    return 0 if len(recebidas) == len(confirmadas) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,38 @@
+"""
+Dispara N requisições idênticas ao mesmo tempo contra uma rota cara e mostra
+quantas executaram a rota de fato (GET /metricas/coalescencia).
+
+Com a coalescência, N espectadores simultâneos custam uma execução; com
+COALESCENCIA_TTL_SEGUNDOS > 0, as rajadas seguintes dentro do prazo não custam nenhuma.
+
+Uso (com a API rodando):
+    python benchmarks/coalescencia.py --url http://localhost:8000 --rota "/rios/DOC/painel" --clientes 50
+"""
+import argparse
+import asyncio
+import time
+import httpx
+
+
+async def principal(url, rota, clientes, rajadas):
+    limites = httpx.Limits(max_connections=clientes + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limites) as cliente:
+        antes = (await cliente.get("/metricas/coalescencia")).json()
+        for rajada in range(rajadas):
+            inicio = time.monotonic()
+            respostas = await asyncio.gather(*[cliente.get(rota) for _ in range(clientes)])
+            status = sorted({r.status_code for r in respostas})
+            corpos = len({r.content for r in respostas})
+            print(f"rajada {rajada + 1}: {time.monotonic() - inicio:.3f}s status={status} corpos distintos={corpos}")
+        depois = (await cliente.get("/metricas/coalescencia")).json()
+        print("Diferença nas métricas:", {k: depois[k] - antes.get(k, 0) for k in depois})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rota", default="/rios/DOC/painel")
+    parser.add_argument("--clientes", type=int, default=50, help="Requisições idênticas por rajada")
+    parser.add_argument("--rajadas", type=int, default=3)
+    argumentos = parser.parse_args()
+    asyncio.run(principal(argumentos.url, argumentos.rota, argumentos.clientes, argumentos.rajadas))
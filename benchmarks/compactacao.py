@@ -0,0 +1,243 @@
+"""
+coletas_parametros (uma linha por medição) contra coletas_compactas (uma linha por
+coleta, valores num bloco binário; ver app/compactas.py) em escala de acervo.
+
+Cria o schema "compactacao" no banco da API (o schema public não é tocado) com as
+tabelas dos modelos, gera as medições em coletas_parametros e preenche
+coletas_compactas com compactas.recalcular, como o gerenciar.py compactar faria.
+Os valores imitam laudos de laboratório (de 0 a 3 casas decimais, magnitudes de 10
+a 100 mil), com uma fração de valores calculados em precisão total, que obrigam a
+coleta inteira a ficar em float64.
+
+Mostra:
+  - tamanho de cada layout (tabela, índices, bytes por medição);
+  - varredura completa no servidor (EXPLAIN ANALYZE: tempo e blocos lidos);
+  - leitura de coletas inteiras de um rio e da série de um parametro, na forma das
+    rotas GET /coletas e /coletas/rio/{codigo}/parametro/{nome}, conferindo que os
+    dois layouts devolvem exatamente os mesmos valores.
+
+Uso:
+    python benchmarks/compactacao.py              # 500 mil coletas, 10 milhões de medições
+    python benchmarks/compactacao.py --escala 2   # 20 milhões de medições
+    python benchmarks/compactacao.py --manter     # não apaga o schema no fim
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA = "compactacao"
+
+DADOS_SQL = """
+SELECT setseed(0.42);
+INSERT INTO rios (nome, codigo, descricao)
+SELECT 'Rio ' || i, 'R' || i, 'Rio sintético ' || i FROM generate_series(1, {rios}) i;
+INSERT INTO parametros (nome, categoria)
+SELECT 'Parametro ' || i, 'Categoria ' || (i % 6) FROM generate_series(1, {parametros}) i;
+INSERT INTO coletas (codigo, locali, rio_id, datas, latitude, longitude, replica)
+SELECT 'C' || i, 'Ponto ' || (i % 40), 1 + i % {rios}, date '1980-01-01' + (i * 37) % 16000,
+       -30 + random() * 30, -70 + random() * 30, 1
+FROM generate_series(1, {coletas}) i;
+INSERT INTO coletas_parametros (coleta_id, rio_id, datas, parametro_id, valor, atipico)
+SELECT c.id, c.rio_id, c.datas, p,
+       CASE WHEN random() < {fracao_calculados} THEN random() * 100
+            ELSE round((random() * 10 ^ (1 + p % 5))::numeric, p % 4)::float8 END,
+       random() < 0.02
+FROM coletas c CROSS JOIN generate_series(0, {por_coleta} - 1) j
+CROSS JOIN LATERAL (SELECT 1 + (c.id * 7 + j) % {parametros} AS p) x;
+"""
+
+TAMANHO_SQL = """
+SELECT coalesce(sum(pg_relation_size(relid)), 0), coalesce(sum(pg_indexes_size(relid)), 0)
+FROM pg_partition_tree(:tabela)
+"""
+
+VARREDURAS = {
+    "coletas_parametros": "SELECT count(*), sum(valor) FROM coletas_parametros",
+    "coletas_compactas": "SELECT count(*), sum(length(valores)) FROM coletas_compactas",
+}
+
+# Leituras equivalentes às dos adaptadores de compactas.py, no layout de uma linha por medição
+COLETAS_SQL = """
+SELECT c.id, c.codigo, c.locali, c.rio_id, c.datas, c.latitude, c.longitude, c.replica,
+       cp.parametro_id, cp.valor
+FROM coletas c
+LEFT JOIN coletas_parametros cp ON cp.rio_id = c.rio_id AND cp.coleta_id = c.id
+WHERE c.rio_id = :rio_id
+ORDER BY c.id, cp.parametro_id
+"""
+
+SERIE_SQL = """
+SELECT c.datas, c.locali, c.latitude, c.longitude, cp.valor, cp.atipico
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id
+WHERE cp.rio_id = :rio_id AND cp.parametro_id = :parametro_id
+"""
+
+
+def preparar_banco(escala: float, fracao_calculados: float):
+    """Recria o schema de teste, aponta as conexões da API para ele e gera os dados."""
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    from sqlalchemy import event, text
+    from database import engine, Base
+    import models
+
+    with engine.begin() as conexao:
+        conexao.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conexao.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    engine.dispose()
+
+    @event.listens_for(engine, "connect")
+    def _usar_schema(conexao_dbapi, registro):
+        with conexao_dbapi.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conexao:
+        # Sem os gatilhos de sincronização: a carga não precisa de seq_alteracao
+        for tabela in models.TABELAS_SINCRONIZADAS:
+            conexao.execute(text(f"DROP TRIGGER tg_{tabela}_alteracao ON {tabela}"))
+        conexao.connection.cursor().execute(DADOS_SQL.format(
+            rios=50, parametros=72, coletas=int(500_000 * escala), por_coleta=20,
+            fracao_calculados=fracao_calculados,
+        ))
+    return engine
+
+
+def vacuum(engine, tabela: str):
+    conexao = engine.raw_connection()
+    conexao.set_session(autocommit=True)
+    conexao.cursor().execute(f"VACUUM ANALYZE {tabela}")
+    conexao.close()
+
+
+def tamanho(db, tabela: str) -> tuple:
+    from sqlalchemy import text
+    return tuple(db.execute(text(TAMANHO_SQL), {"tabela": tabela}).one())
+
+
+def varrer(db, sql: str, repeticoes: int) -> dict:
+    from sqlalchemy import text
+    tempos = []
+    for _ in range(repeticoes):
+        plano = db.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)).scalar()[0]
+        tempos.append(plano["Execution Time"])
+    no = plano["Plan"]
+    return {"ms": statistics.median(tempos), "buffers": no.get("Shared Hit Blocks", 0) + no.get("Shared Read Blocks", 0)}
+
+
+def coletas_por_linhas(db, rio_id: int) -> list:
+    from sqlalchemy import text
+    coletas = {}
+    for linha in db.execute(text(COLETAS_SQL), {"rio_id": rio_id}):
+        coleta = coletas.get(linha.id)
+        if coleta is None:
+            coleta = coletas[linha.id] = {
+                "codigo": linha.codigo, "locali": linha.locali, "rio_id": linha.rio_id, "datas": linha.datas,
+                "latitude": linha.latitude, "longitude": linha.longitude, "replica": linha.replica,
+                "coletas_parametros": [],
+            }
+        if linha.parametro_id is not None:
+            coleta["coletas_parametros"].append({"parametro_id": linha.parametro_id, "valor": linha.valor})
+    return list(coletas.values())
+
+
+def serie_por_linhas(db, rio_id: int, parametro_id: int) -> list:
+    from sqlalchemy import text
+    return [
+        {"data": l.datas.isoformat(), "local": l.locali, "valor": l.valor, "latitude": l.latitude, "longitude": l.longitude}
+        for l in db.execute(text(SERIE_SQL), {"rio_id": rio_id, "parametro_id": parametro_id})
+    ]
+
+
+def medir(funcao, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), resultado
+
+
+def _ordenada(serie: list) -> list:
+    return sorted(serie, key=lambda v: (v["data"], v["local"], v["valor"], v["latitude"]))
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escala", type=float, default=1, help="Multiplica o número de coletas (500 mil)")
+    parser.add_argument("--fracao-calculados", type=float, default=0.01,
+                        help="Fração das medições com valor em precisão total")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--manter", action="store_true", help="Mantém o schema de teste no fim")
+    argumentos = parser.parse_args()
+
+    print("Gerando medições...")
+    inicio = time.perf_counter()
+    engine = preparar_banco(argumentos.escala, argumentos.fracao_calculados)
+    print(f"  {time.perf_counter() - inicio:.0f} s")
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+    import compactas
+
+    try:
+        vacuum(engine, "coletas_parametros")
+        print("Compactando (compactas.recalcular)...")
+        with Session(engine) as db:
+            inicio = time.perf_counter()
+            compactas.recalcular(db)
+            db.commit()
+            print(f"  {time.perf_counter() - inicio:.0f} s")
+        vacuum(engine, "coletas_compactas")
+
+        with Session(engine) as db:
+            medicoes = db.execute(text("SELECT count(*) FROM coletas_parametros")).scalar()
+            formatos = dict(db.execute(text(
+                "SELECT get_byte(valores, 0) >> 4, count(*) FROM coletas_compactas GROUP BY 1"
+            )).all())
+            print(f"\n{medicoes:,} medições; coletas por formato: " + ", ".join(
+                f"{nome} {formatos.get(tipo, 0):,}"
+                for nome, tipo in (("int16", compactas.INT16), ("int32", compactas.INT32),
+                                   ("float32", compactas.FLOAT32), ("float64", compactas.FLOAT64))
+            ))
+
+            print(f"\n{'layout':<22}{'tabela':>12}{'índices':>12}{'total':>12}{'bytes/medição':>16}")
+            totais = {}
+            for tabela in VARREDURAS:
+                heap, indices = tamanho(db, tabela)
+                if tabela == "coletas_compactas":
+                    heap += sum(tamanho(db, "ordens_parametros"))
+                totais[tabela] = heap + indices
+                print(f"{tabela:<22}{heap / 2**20:>9.0f} MB{indices / 2**20:>9.0f} MB"
+                      f"{totais[tabela] / 2**20:>9.0f} MB{totais[tabela] / medicoes:>16.1f}")
+            print(f"compactas ocupam {totais['coletas_compactas'] / totais['coletas_parametros']:.1%} do layout atual")
+
+            print(f"\n{'varredura completa':<22}{'ms':>12}{'buffers':>12}")
+            for tabela, sql in VARREDURAS.items():
+                m = varrer(db, sql, argumentos.repeticoes)
+                print(f"{tabela:<22}{m['ms']:>12.0f}{m['buffers']:>12,}")
+
+            print(f"\n{'leitura (ms)':<28}{'por medição':>14}{'compacta':>12}")
+            for rio_id in (3, 17):
+                ms_linhas, linhas = medir(lambda: coletas_por_linhas(db, rio_id), argumentos.repeticoes)
+                ms_compacta, compacta = medir(lambda: compactas.coletas(db, rio_id), argumentos.repeticoes)
+                assert linhas == compacta, f"coletas do rio {rio_id} diferem entre os layouts"
+                print(f"{f'coletas do rio {rio_id} ({len(linhas):,})':<28}{ms_linhas:>14.1f}{ms_compacta:>12.1f}")
+
+                ms_linhas, linhas = medir(lambda: serie_por_linhas(db, rio_id, 5), argumentos.repeticoes)
+                ms_compacta, compacta = medir(lambda: compactas.serie(db, rio_id, 5), argumentos.repeticoes)
+                assert _ordenada(linhas) == _ordenada(compacta), f"série do rio {rio_id} difere entre os layouts"
+                print(f"{f'série do rio {rio_id} ({len(linhas):,})':<28}{ms_linhas:>14.1f}{ms_compacta:>12.1f}")
+            print("\nValores idênticos nos dois layouts.")
+    finally:
+        if not argumentos.manter:
+            with engine.begin() as conexao:
+                conexao.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
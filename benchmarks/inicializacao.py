@@ -0,0 +1,91 @@
+"""
+Orçamento de importação da API.
+
+Importa main.py em processos novos (como um worker do uvicorn ao subir) e confere:
+
+  - a mediana do tempo de importação fica dentro de --orcamento-ms;
+  - a importação não abre conexões com o banco, não inicia threads, não gera o
+    hash da chave da API e não escreve nada na saída padrão.
+
+O que é caro fica para o aquecimento (inicializacao.py), depois que o servidor
+já aceita conexões; as tabelas são criadas por gerenciar.py.
+
+Uso:
+    python benchmarks/inicializacao.py
+    python benchmarks/inicializacao.py --orcamento-ms 800 --execucoes 9
+
+Termina com código 1 se o orçamento ou alguma das condições for violada; roda em
+todo push (.github/workflows/orcamento-importacao.yml).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDIR = """
+import json, sys, threading, time
+inicio = time.perf_counter()
+import main
+duracao = (time.perf_counter() - inicio) * 1000
+import database, configuracao
+pools = [database.engine.pool] + ([database.engine_replica.pool] if database.engine_replica is not None else [])
+sys.__stdout__.write("\\n@@" + json.dumps({
+    "ms": duracao,
+    "conexoes": sum(p.checkedin() + p.checkedout() for p in pools),
+    "threads": [t.name for t in threading.enumerate() if t is not threading.main_thread()],
+    "hash_chave_api": configuracao.api_key_hash.cache_info().currsize,
+}))
+"""
+
+
+def medir_uma_vez() -> dict:
+    processo = subprocess.run(
+        [sys.executable, "-c", MEDIR], cwd=os.path.join(RAIZ, "app"),
+        capture_output=True, text=True, check=True,
+    )
+    saida, _, resultado = processo.stdout.rpartition("\n@@")
+    medicao = json.loads(resultado)
+    medicao["saida"] = saida.strip()
+    return medicao
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orcamento-ms", type=float, default=1500.0)
+    parser.add_argument("--execucoes", type=int, default=5)
+    argumentos = parser.parse_args()
+
+    medicoes = [medir_uma_vez() for _ in range(argumentos.execucoes)]
+    mediana = statistics.median(m["ms"] for m in medicoes)
+    print(f"importação de main: mediana {mediana:.0f} ms "
+          f"(min {min(m['ms'] for m in medicoes):.0f}, max {max(m['ms'] for m in medicoes):.0f}) "
+          f"em {argumentos.execucoes} processos")
+
+    problemas = []
+    if mediana > argumentos.orcamento_ms:
+        problemas.append(f"mediana {mediana:.0f} ms acima do orçamento de {argumentos.orcamento_ms:.0f} ms")
+    exemplo = medicoes[0]
+    if exemplo["conexoes"]:
+        problemas.append(f"{exemplo['conexoes']} conexão(ões) com o banco abertas na importação")
+    if exemplo["threads"]:
+        problemas.append(f"threads iniciadas na importação: {exemplo['threads']}")
+    if exemplo["hash_chave_api"]:
+        problemas.append("hash da chave da API gerado na importação")
+    if exemplo["saida"]:
+        problemas.append(f"importação escreveu na saída padrão: {exemplo['saida'][:200]!r}")
+
+    if not problemas:
+        print("Dentro do orçamento.")
+        return 0
+    print("Problemas:")
+    for problema in problemas:
+        print(f"  - {problema}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,73 @@
+"""
+GETs sequenciais de uma tela do app contra um POST /lote com as mesmas leituras.
+
+Precisa da API rodando (--url). Mede o tempo de cada forma no servidor local e
+projeta o tempo numa rede móvel somando --rtt-ms por ida e volta: a tela faz
+uma ida e volta por GET, o lote faz uma só.
+
+Uso:
+    python benchmarks/lote.py --url http://localhost:8000 --rio PAR --nome-rio Perequeaçu --parametro pH
+"""
+import argparse
+import statistics
+import sys
+import time
+import httpx
+
+
+def caminhos_da_tela(rio: str, nome_rio: str, parametro: str, parametros_extra) -> list:
+    """As leituras que o app faz para montar a tela de um rio."""
+    caminhos = ["/rios", "/parametros", f"/coletas/rio/{rio}", f"/rios/{rio}/painel"]
+    for nome in [parametro] + parametros_extra:
+        caminhos += [
+            f"/rio/{nome_rio}/coletas/{nome}/resumo",
+            f"/rio/{nome_rio}/coletas/{nome}/grafico",
+            f"/coletas/rio/{rio}/parametro/{nome}",
+        ]
+    return caminhos
+
+
+def medir(funcao, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rio", default="PAR", help="Código do rio")
+    parser.add_argument("--nome-rio", default="Perequeaçu")
+    parser.add_argument("--parametro", default="pH")
+    parser.add_argument("--parametros-extra", nargs="*", default=["Turbidez", "Fe", "Zn"])
+    parser.add_argument("--rtt-ms", type=float, default=150.0, help="Ida e volta numa rede móvel")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    argumentos = parser.parse_args()
+
+    caminhos = caminhos_da_tela(argumentos.rio, argumentos.nome_rio, argumentos.parametro, argumentos.parametros_extra)
+    with httpx.Client(base_url=argumentos.url, timeout=60) as cliente:
+        def sequencial():
+            for caminho in caminhos:
+                cliente.get(caminho)
+
+        def em_lote():
+            resposta = cliente.post("/lote", json={"requisicoes": [{"caminho": c} for c in caminhos]})
+            resposta.raise_for_status()
+            return resposta.json()["respostas"]
+
+        estados = [r["status"] for r in em_lote()]
+        print(f"{len(caminhos)} leituras; status no lote: {sorted(set(estados))}")
+        tempo_sequencial = medir(sequencial, argumentos.repeticoes)
+        tempo_lote = medir(em_lote, argumentos.repeticoes)
+
+    print(f"{'':<12}{'servidor local':>16}{f'com rtt {argumentos.rtt_ms:.0f} ms':>20}")
+    print(f"{'sequencial':<12}{tempo_sequencial:>13.1f} ms{tempo_sequencial + len(caminhos) * argumentos.rtt_ms:>17.1f} ms")
+    print(f"{'lote':<12}{tempo_lote:>13.1f} ms{tempo_lote + argumentos.rtt_ms:>17.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,172 @@
+"""
+Layout de coletas_parametros em escala de acervo: tabela única + junção com coletas
+(layout anterior à migração 011) contra a tabela particionada por HASH(rio_id) com
+rio_id e datas na própria medição.
+
+Cria o schema "particoes" no banco da API (o schema public não é tocado) com os dois
+layouts lado a lado e os mesmos dados, e roda as consultas de GET
+/rio/{rio}/coletas/{parametro}/resumo e /grafico em cada um com EXPLAIN (ANALYZE,
+BUFFERS). Mostra tempo (mediana), blocos lidos e quantas partições foram visitadas.
+
+Uso:
+    python benchmarks/particoes.py              # 48 rios, 200 mil coletas, 4 milhões de medições
+    python benchmarks/particoes.py --escala 4   # acervo 4x maior
+    python benchmarks/particoes.py --manter     # não apaga o schema no fim
+"""
+import argparse
+import os
+import statistics
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA = "particoes"
+PARTICOES = 16
+
+ESTRUTURA_SQL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+SET search_path TO {SCHEMA};
+
+CREATE TABLE coletas (id serial PRIMARY KEY, rio_id integer, datas date, locali text);
+CREATE INDEX ix_coletas_rio_id_datas ON coletas (rio_id, datas);
+
+-- Layout anterior: medições sem rio nem data, leitura por rio passa por coletas
+CREATE TABLE medicoes_antigas (
+    id serial PRIMARY KEY, coleta_id integer, parametro_id integer,
+    valor double precision NOT NULL, atipico boolean NOT NULL DEFAULT false
+);
+
+-- Layout novo (models.ColetaParametro)
+CREATE TABLE medicoes_particionadas (
+    id integer NOT NULL, rio_id integer NOT NULL, coleta_id integer, parametro_id integer,
+    datas date, valor double precision NOT NULL, atipico boolean NOT NULL DEFAULT false,
+    PRIMARY KEY (rio_id, id)
+) PARTITION BY HASH (rio_id);
+"""
+
+PARTICOES_SQL = "CREATE TABLE medicoes_particionadas_p{resto} PARTITION OF medicoes_particionadas " \
+                "FOR VALUES WITH (MODULUS {total}, REMAINDER {resto});"
+
+DADOS_SQL = """
+SELECT setseed(0.42);
+INSERT INTO coletas (rio_id, datas, locali)
+SELECT 1 + i % {rios}, date '1980-01-01' + (i * 37) % 16000, 'Ponto ' || (i % 40)
+FROM generate_series(1, {coletas}) i;
+INSERT INTO medicoes_antigas (coleta_id, parametro_id, valor)
+SELECT c.id, 1 + (c.id * 7 + j) % {parametros}, random() * 100
+FROM coletas c CROSS JOIN generate_series(0, {por_coleta} - 1) j;
+INSERT INTO medicoes_particionadas (id, rio_id, coleta_id, parametro_id, datas, valor, atipico)
+SELECT m.id, c.rio_id, m.coleta_id, m.parametro_id, c.datas, m.valor, m.atipico
+FROM medicoes_antigas m JOIN coletas c ON c.id = m.coleta_id;
+
+CREATE INDEX ON medicoes_antigas (coleta_id) INCLUDE (parametro_id, valor, atipico);
+CREATE INDEX ON medicoes_antigas (parametro_id, coleta_id) INCLUDE (valor, atipico);
+CREATE INDEX ON medicoes_particionadas (coleta_id) INCLUDE (parametro_id, valor, atipico);
+CREATE INDEX ON medicoes_particionadas (parametro_id, coleta_id) INCLUDE (valor, atipico);
+CREATE INDEX ON medicoes_particionadas (rio_id, parametro_id, datas) INCLUDE (valor, atipico);
+"""
+
+# As consultas das rotas, como o ORM as emite em cada layout
+CONSULTAS = {
+    "resumo": {
+        "antigo": """
+            SELECT avg(m.valor), max(m.valor), min(m.valor)
+            FROM medicoes_antigas m JOIN coletas c ON c.id = m.coleta_id
+            WHERE c.rio_id = %(rio)s AND m.parametro_id = %(parametro)s""",
+        "particionado": """
+            SELECT avg(valor), max(valor), min(valor)
+            FROM medicoes_particionadas
+            WHERE rio_id = %(rio)s AND parametro_id = %(parametro)s""",
+    },
+    "grafico": {
+        "antigo": """
+            SELECT m.valor, c.datas
+            FROM medicoes_antigas m JOIN coletas c ON c.id = m.coleta_id
+            WHERE c.rio_id = %(rio)s AND m.parametro_id = %(parametro)s
+            ORDER BY c.datas""",
+        "particionado": """
+            SELECT valor, datas
+            FROM medicoes_particionadas
+            WHERE rio_id = %(rio)s AND parametro_id = %(parametro)s
+            ORDER BY datas""",
+    },
+}
+
+
+def conectar():
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    from database import engine
+    return engine.raw_connection()
+
+
+def preparar(conexao, escala: int):
+    cursor = conexao.cursor()
+    cursor.execute(ESTRUTURA_SQL)
+    for resto in range(PARTICOES):
+        cursor.execute(PARTICOES_SQL.format(resto=resto, total=PARTICOES))
+    cursor.execute(DADOS_SQL.format(rios=48, parametros=72, coletas=200_000 * escala, por_coleta=20))
+    conexao.commit()
+    # Estatísticas e mapa de visibilidade em dia, como o autovacuum deixaria
+    conexao.set_session(autocommit=True)
+    cursor.execute(f"VACUUM ANALYZE {SCHEMA}.coletas, {SCHEMA}.medicoes_antigas, {SCHEMA}.medicoes_particionadas")
+    conexao.set_session(autocommit=False)
+
+
+def _relacoes(no) -> set:
+    nomes = {no["Relation Name"]} if "Relation Name" in no else set()
+    for filho in no.get("Plans", []):
+        nomes |= _relacoes(filho)
+    return nomes
+
+
+def medir(conexao, sql: str, argumentos: dict, repeticoes: int) -> dict:
+    cursor = conexao.cursor()
+    tempos = []
+    for _ in range(repeticoes):
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, argumentos)
+        resultado = cursor.fetchone()[0][0]
+        tempos.append(resultado["Execution Time"])
+    plano = resultado["Plan"]
+    particoes = {nome for nome in _relacoes(plano) if nome.startswith("medicoes_particionadas_p")}
+    return {
+        "ms": statistics.median(tempos),
+        "buffers": plano.get("Shared Hit Blocks", 0) + plano.get("Shared Read Blocks", 0),
+        "linhas": plano.get("Actual Rows", 0),
+        "particoes": len(particoes),
+    }
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escala", type=int, default=1, help="Multiplica o número de coletas (200 mil)")
+    parser.add_argument("--repeticoes", type=int, default=7)
+    parser.add_argument("--manter", action="store_true", help="Mantém o schema de teste no fim")
+    argumentos = parser.parse_args()
+
+    conexao = conectar()
+    try:
+        print("Gerando dados...")
+        preparar(conexao, argumentos.escala)
+        cursor = conexao.cursor()
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+
+        print(f"\n{'rota':<10}{'layout':<15}{'ms':>10}{'buffers':>10}{'linhas':>9}{'partições':>12}")
+        for rota, layouts in CONSULTAS.items():
+            for rio in (3, 17):
+                for layout, sql in layouts.items():
+                    m = medir(conexao, sql, {"rio": rio, "parametro": 5}, argumentos.repeticoes)
+                    particoes = f"{m['particoes']}/{PARTICOES}" if layout == "particionado" else "-"
+                    print(f"{rota:<10}{layout:<15}{m['ms']:>10.2f}{m['buffers']:>10}{m['linhas']:>9}{particoes:>12}")
+        conexao.rollback()
+    finally:
+        if not argumentos.manter:
+            conexao.rollback()
+            conexao.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conexao.commit()
+        conexao.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
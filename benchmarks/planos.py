@@ -0,0 +1,272 @@
+"""
+Regressão de planos de consulta das rotas analíticas.
+
+Cria o schema "planos" no banco da API (o schema public não é tocado), gera um
+acervo sintético em escala, chama cada rota de ROTAS e roda EXPLAIN (ANALYZE,
+BUFFERS) em cada SELECT que ela emitiu. Depois compara com a base gravada:
+
+  - nenhuma rota pode fazer Seq Scan em TABELAS_SEM_SEQ_SCAN;
+  - número de consultas, blocos lidos (buffers) e linhas processadas têm teto;
+  - o formato do plano (nós, tabelas e índices) deve ser o mesmo da base; se
+    mudar, o diff é mostrado.
+
+Uso:
+    python benchmarks/planos.py              # compara com benchmarks/planos_base.json
+    python benchmarks/planos.py --gravar     # grava uma base nova
+    python benchmarks/planos.py --escala 4   # acervo maior (só para investigar)
+
+Termina com código 1 se alguma rota regredir.
+"""
+import argparse
+import difflib
+import json
+import math
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE = os.path.join(RAIZ, "benchmarks", "planos_base.json")
+SCHEMA = "planos"
+
+ROTAS = [
+    "/rio/Rio 3/coletas/Parametro 5/resumo",
+    "/rio/Rio 3/coletas/Parametro 5/grafico",
+    "/rios/R3/painel",
+    "/rios/nome/Rio 1",
+    "/parametros/nome/Parametro 1",
+    "/coletas/rio/R3/parametro/Parametro 5",
+    "/analise/correlacao?rio=R3",
+    "/analise/iqa?rio=R3",
+    "/analise/tendencias?rio=R3&parametro=Parametro 5",
+    "/analise/distribuicao?parametro=Parametro 5&rio=R3&rio=R4",
+    "/analise/anomalias?rio=R3&parametro=Parametro 5",
+    "/mapa/clusters?bbox=-75,-35,-30,6&zoom=6&parametro=Parametro 5",
+    "/sync?desde=0&limite=500",
+]
+
+TABELAS_SEM_SEQ_SCAN = {"coletas_parametros"}
+
+# Consultas de infraestrutura, iguais em toda rota e dependentes de tempo
+IGNORAR = ("/* versoes */", "horizonte_alteracoes", "pg_advisory", "pg_current_wal")
+
+# Folga dos tetos em relação ao valor medido ao gravar a base
+FOLGA = 1.5
+
+DADOS_SQL = """
+SELECT setseed(0.42);
+INSERT INTO rios (nome, codigo, descricao)
+SELECT 'Rio ' || i, 'R' || i, 'Rio sintético ' || i FROM generate_series(1, {rios}) i;
+INSERT INTO parametros (nome, categoria)
+SELECT 'Parametro ' || i, 'Categoria ' || (i % 6) FROM generate_series(1, {parametros}) i;
+INSERT INTO coletas (codigo, locali, rio_id, datas, latitude, longitude, replica)
+SELECT 'C' || i, 'Ponto ' || (i % 40), 1 + i % {rios}, date '2000-01-01' + (i * 37) % 9000,
+       -30 + random() * 30, -70 + random() * 30, 1
+FROM generate_series(1, {coletas}) i;
+INSERT INTO coletas_parametros (coleta_id, rio_id, datas, parametro_id, valor, atipico)
+SELECT c.id, c.rio_id, c.datas, 1 + (c.id * 7 + j) % {parametros}, random() * 100, false
+FROM coletas c CROSS JOIN generate_series(0, {por_coleta} - 1) j;
+"""
+
+
+def preparar_banco(escala: int):
+    """Recria o schema de teste, aponta as conexões da API para ele e gera os dados."""
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    from sqlalchemy import event, text
+    from database import engine, Base
+    import models  # noqa: F401 - registra as tabelas
+
+    with engine.begin() as conexao:
+        conexao.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conexao.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    engine.dispose()
+
+    @event.listens_for(engine, "connect")
+    def _usar_schema(conexao_dbapi, registro):
+        with conexao_dbapi.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conexao:
+        conexao.connection.cursor().execute(DADOS_SQL.format(
+            rios=48, parametros=72, coletas=6000 * escala, por_coleta=20,
+        ))
+    # Tabelas que a ingestão mantém e que o INSERT direto acima não preenche
+    from sqlalchemy.orm import Session
+    import distribuicoes
+    with Session(engine) as db:
+        distribuicoes.recalcular(db)
+        db.commit()
+    return engine
+
+
+class Capturador:
+    """Guarda os SELECTs emitidos pela engine enquanto está ativo."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.ativo = False
+        self.consultas = []
+        event.listen(engine, "before_cursor_execute", self._registrar)
+
+    def _registrar(self, conexao, cursor, sql, parametros, contexto, executemany):
+        if not self.ativo or executemany:
+            return
+        inicio = sql.lstrip().upper()
+        if not (inicio.startswith("SELECT") or inicio.startswith("WITH") or inicio.startswith("(SELECT")):
+            return
+        if any(trecho in sql for trecho in IGNORAR):
+            return
+        self.consultas.append((sql, parametros))
+
+
+def _resumir_plano(no, nivel=0):
+    partes = [no["Node Type"]]
+    if "Relation Name" in no:
+        partes.append(f"em {no['Relation Name']}")
+    if "Index Name" in no:
+        partes.append(f"usando {no['Index Name']}")
+    linhas = ["  " * nivel + " ".join(partes)]
+    for filho in no.get("Plans", []):
+        linhas += _resumir_plano(filho, nivel + 1)
+    return linhas
+
+
+def _linhas_processadas(no):
+    total = no.get("Actual Rows", 0) * no.get("Actual Loops", 1)
+    return total + sum(_linhas_processadas(filho) for filho in no.get("Plans", []))
+
+
+def explicar(engine, consultas):
+    """
+    Roda EXPLAIN (ANALYZE, BUFFERS) em cada consulta distinta e soma os custos,
+    multiplicando pelas repetições (consultas N+1 aparecem como várias iguais).
+    """
+    distintas = {}
+    for sql, parametros in consultas:
+        distintas.setdefault(sql, [parametros, 0])[1] += 1
+
+    planos, buffers, linhas = [], 0, 0
+    conexao = engine.raw_connection()
+    try:
+        cursor = conexao.cursor()
+        for sql, (parametros, repeticoes) in distintas.items():
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, parametros)
+            plano = cursor.fetchone()[0][0]["Plan"]
+            buffers += repeticoes * (plano.get("Shared Hit Blocks", 0) + plano.get("Shared Read Blocks", 0))
+            linhas += repeticoes * _linhas_processadas(plano)
+            sufixo = f" (x{repeticoes})" if repeticoes > 1 else ""
+            planos.append(_resumir_plano(plano)[0] + sufixo)
+            planos += ["  " + linha for linha in _resumir_plano(plano)[1:]]
+        conexao.rollback()
+    finally:
+        conexao.close()
+    return {"consultas": len(consultas), "buffers": buffers, "linhas": linhas, "plano": planos}
+
+
+def medir(escala: int) -> dict:
+    engine = preparar_banco(escala)
+    from fastapi.testclient import TestClient
+    import main
+    import cache
+
+    cliente = TestClient(main.app)
+    # Primeira passada: resultados derivados (tendências, mapa) calculados sob demanda
+    for rota in ROTAS:
+        cliente.get(rota).raise_for_status()
+    # Como o autovacuum faria em produção: estatísticas e mapa de visibilidade em dia.
+    # A amostra maior que a padrão evita que o plano mude de uma execução para outra
+    # só porque o ANALYZE sorteou linhas diferentes.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conexao:
+        conexao.exec_driver_sql("SET default_statistics_target = 2000")
+        conexao.exec_driver_sql("VACUUM ANALYZE")
+
+    capturador = Capturador(engine)
+    medicoes = {}
+    for rota in ROTAS:
+        cache.invalidar_rio(None)
+        capturador.consultas = []
+        capturador.ativo = True
+        cliente.get(rota).raise_for_status()
+        capturador.ativo = False
+        medicoes[rota] = explicar(engine, capturador.consultas)
+    return medicoes
+
+
+def _teto(valor: int) -> int:
+    return int(math.ceil(valor * FOLGA)) + 10
+
+
+def comparar(medicoes: dict, base: dict) -> list:
+    falhas = []
+    for rota, atual in medicoes.items():
+        problemas = []
+        for linha in atual["plano"]:
+            for tabela in TABELAS_SEM_SEQ_SCAN:
+                if linha.strip().startswith(f"Seq Scan em {tabela}"):
+                    problemas.append(f"Seq Scan em {tabela}")
+
+        referencia = base.get(rota)
+        if referencia is None:
+            problemas.append("rota sem base gravada (rode com --gravar)")
+        else:
+            for medida in ("consultas", "buffers", "linhas"):
+                teto = referencia["tetos"][medida]
+                if atual[medida] > teto:
+                    problemas.append(f"{medida}: {atual[medida]} acima do teto {teto}")
+            if atual["plano"] != referencia["plano"]:
+                diff = difflib.unified_diff(
+                    referencia["plano"], atual["plano"], "base", "atual", lineterm=""
+                )
+                problemas.append("plano mudou:\n" + "\n".join("      " + l for l in diff))
+
+        if problemas:
+            falhas.append((rota, problemas))
+    return falhas
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gravar", action="store_true", help="Grava as medições como nova base")
+    parser.add_argument("--escala", type=int, default=1, help="Multiplica o número de coletas (6000)")
+    argumentos = parser.parse_args()
+
+    medicoes = medir(argumentos.escala)
+
+    for rota, atual in medicoes.items():
+        print(f"{rota}\n    consultas={atual['consultas']} buffers={atual['buffers']} linhas={atual['linhas']}")
+
+    if argumentos.gravar:
+        base = {
+            rota: {
+                "plano": atual["plano"],
+                "tetos": {
+                    "consultas": atual["consultas"],
+                    "buffers": _teto(atual["buffers"]),
+                    "linhas": _teto(atual["linhas"]),
+                },
+            }
+            for rota, atual in medicoes.items()
+        }
+        with open(BASE, "w", encoding="utf-8") as arquivo:
+            json.dump(base, arquivo, ensure_ascii=False, indent=2)
+            arquivo.write("\n")
+        print(f"\nBase gravada em {BASE}")
+        return 0
+
+    with open(BASE, encoding="utf-8") as arquivo:
+        base = json.load(arquivo)
+    falhas = comparar(medicoes, base)
+    if not falhas:
+        print("\nNenhuma regressão de plano.")
+        return 0
+    print("\nRegressões:")
+    for rota, problemas in falhas:
+        print(f"  {rota}")
+        for problema in problemas:
+            print(f"    - {problema}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,176 @@
+"""
+Roteamento das leituras entre primário e réplica (app/replica.py) contra dois
+Postgres locais: um primário e uma réplica de streaming dele.
+
+Cria o schema "replica" no primário (o schema public não é tocado), espera a réplica
+recebê-lo e, com a API em processo, confere:
+  - réplica em dia: as leituras vão a ela;
+  - reprodução pausada (pg_wal_replay_pause) e um cliente com a posição da sua
+    última escrita (X-Posicao-Escrita) à frente da réplica: a leitura vai ao primário,
+    e a de quem não mandou a posição continua na réplica;
+  - réplica atrasada além de ATRASO_MAXIMO_REPLICA_SEGUNDOS: toda leitura vai ao primário;
+  - escrita pela API: quem escreveu lê o que escreveu, e volta à réplica quando ela
+    reproduz a escrita.
+Sai com código 1 se alguma conferência falhar.
+
+O usuário da réplica precisa poder chamar pg_wal_replay_pause/resume (superusuário ou
+GRANT EXECUTE). As demais variáveis da API (CHAVE_API, ...) vêm do ambiente, como na API.
+
+Uso:
+    python benchmarks/replica.py --primario postgresql://u@localhost:5432/db \\
+                                 --replica postgresql://u@localhost:5433/db
+"""
+import argparse
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA = "replica"
+
+POSICAO_PRIMARIO_SQL = "SELECT (pg_current_wal_insert_lsn() - '0/0')::bigint"
+POSICAO_REPLICA_SQL = "SELECT (pg_last_wal_replay_lsn() - '0/0')::bigint"
+RIO_DIRETO_SQL = f"INSERT INTO {SCHEMA}.rios (nome, codigo, descricao) VALUES (:codigo, :codigo, 'direto')"
+
+
+def preparar(primario: str, replica: str, atraso_maximo: float):
+    """Aponta a API para as duas instâncias e recria o schema de teste no primário."""
+    os.environ.update({
+        "CONEXAO": primario,
+        "CONEXAO_REPLICA": replica,
+        "ATRASO_MAXIMO_REPLICA_SEGUNDOS": str(atraso_maximo),
+        "VALIDADE_ESTADO_REPLICA_SEGUNDOS": "0.1",
+        # Versões só relidas depois de commits pela API: as escritas diretas abaixo
+        # avançam o WAL sem mudar a posição exigida por elas
+        "VALIDADE_VERSOES_SEGUNDOS": "3600",
+        "BARRAMENTO_ATIVO": "false",
+    })
+    os.chdir(os.path.join(RAIZ, "app"))
+    sys.path.insert(0, os.getcwd())
+    from sqlalchemy import event, text
+    from database import engine, engine_replica, Base
+    import models  # noqa: F401 - registra as tabelas
+
+    with engine.begin() as conexao:
+        conexao.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conexao.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    engine.dispose()
+
+    for alvo in (engine, engine_replica):
+        @event.listens_for(alvo, "connect")
+        def _usar_schema(conexao_dbapi, registro):
+            with conexao_dbapi.cursor() as cursor:
+                cursor.execute(f"SET search_path TO {SCHEMA}")
+            conexao_dbapi.commit()  # senão o rollback da devolução ao pool desfaz o SET
+
+    Base.metadata.create_all(bind=engine)
+    return engine, engine_replica
+
+
+def esperar_replica(engine, engine_replica, limite: float = 30.0):
+    """Espera a réplica reproduzir tudo o que o primário já gravou."""
+    from sqlalchemy import text
+    with engine.connect() as conexao:
+        alvo = conexao.execute(text(POSICAO_PRIMARIO_SQL)).scalar()
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        with engine_replica.connect() as conexao:
+            if conexao.execute(text(POSICAO_REPLICA_SQL)).scalar() >= alvo:
+                return
+        time.sleep(0.05)
+    raise RuntimeError("a réplica não alcançou o primário")
+
+
+def reproducao(engine_replica, funcao: str):
+    from sqlalchemy import text
+    with engine_replica.connect().execution_options(isolation_level="AUTOCOMMIT") as conexao:
+        conexao.execute(text(f"SELECT {funcao}()"))
+
+
+def principal():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--primario", required=True, help="URL do Postgres primário")
+    parser.add_argument("--replica", required=True, help="URL da réplica de streaming do primário")
+    parser.add_argument("--atraso-maximo", type=float, default=1.0, help="ATRASO_MAXIMO_REPLICA_SEGUNDOS")
+    parser.add_argument("--manter", action="store_true", help="Mantém o schema de teste no fim")
+    argumentos = parser.parse_args()
+
+    engine, engine_replica = preparar(argumentos.primario, argumentos.replica, argumentos.atraso_maximo)
+    from sqlalchemy import event, text
+    from fastapi.testclient import TestClient
+    from configuracao import configuracoes
+    from database import SessionReplica
+    import replica
+    import main
+
+    leituras_na_replica = [0]
+    event.listen(SessionReplica, "after_begin", lambda *_: leituras_na_replica.__setitem__(0, leituras_na_replica[0] + 1))
+    cabecalhos = {"X-API-Key": configuracoes.CHAVE_API}
+    conferencias = []
+
+    def ler(cliente, caminho, **kwargs):
+        """GET; devolve a resposta e se a leitura foi feita na réplica."""
+        antes = leituras_na_replica[0]
+        resposta = cliente.get(caminho, headers={**cabecalhos, **kwargs.pop("headers", {})}, **kwargs)
+        return resposta, leituras_na_replica[0] > antes
+
+    def conferir(descricao: str, ok: bool):
+        conferencias.append(ok)
+        print(f"  [{'ok' if ok else 'FALHOU'}] {descricao}")
+
+    pausada = False
+    try:
+        with TestClient(main.app) as cliente:
+            while cliente.get("/prontidao").status_code != 200:    # aquecimento em segundo plano
+                time.sleep(0.05)
+            esperar_replica(engine, engine_replica)
+            resposta, na_replica = ler(cliente, "/rios")
+            conferir("réplica em dia: GET /rios lido na réplica", resposta.status_code == 200 and na_replica)
+
+            reproducao(engine_replica, "pg_wal_replay_pause")
+            pausada = True
+            configuracoes.ATRASO_MAXIMO_REPLICA_SEGUNDOS = 3600
+            with engine.begin() as conexao:
+                conexao.execute(text(RIO_DIRETO_SQL), {"codigo": "RPL-D1"})
+                posicao_escrita = conexao.execute(text(POSICAO_PRIMARIO_SQL)).scalar()
+            resposta, na_replica = ler(cliente, "/rios")
+            conferir("réplica pausada, sem posição do cliente: lido na réplica", resposta.status_code == 200 and na_replica)
+            resposta, na_replica = ler(TestClient(main.app), "/rios/RPL-D1",
+                                       headers={replica.CABECALHO_POSICAO: str(posicao_escrita)})
+            conferir("posição do cliente à frente da réplica: lido no primário",
+                     resposta.status_code == 200 and not na_replica)
+
+            configuracoes.ATRASO_MAXIMO_REPLICA_SEGUNDOS = argumentos.atraso_maximo
+            time.sleep(argumentos.atraso_maximo + 0.5)
+            _, atraso = replica.estado_replica(atualizar=True)
+            resposta, na_replica = ler(cliente, "/rios")
+            conferir(f"réplica {atraso or 0:.1f} s atrasada: lido no primário",
+                     resposta.status_code == 200 and not na_replica)
+
+            configuracoes.ATRASO_MAXIMO_REPLICA_SEGUNDOS = 3600
+            escritor = TestClient(main.app)
+            resposta = escritor.post("/rios", headers=cabecalhos,
+                                     json={"nome": "RPL-A1", "codigo": "RPL-A1", "descricao": "pela API"})
+            conferir("escrita devolve a posição do WAL",
+                     resposta.status_code == 200 and replica.CABECALHO_POSICAO in resposta.headers)
+            resposta, na_replica = ler(escritor, "/rios/RPL-A1")
+            conferir("quem escreveu lê o que escreveu (no primário)", resposta.status_code == 200 and not na_replica)
+
+            reproducao(engine_replica, "pg_wal_replay_resume")
+            pausada = False
+            esperar_replica(engine, engine_replica)
+            resposta, na_replica = ler(escritor, "/rios/RPL-A1")
+            conferir("réplica reproduziu a escrita: lido na réplica", resposta.status_code == 200 and na_replica)
+    finally:
+        if pausada:
+            reproducao(engine_replica, "pg_wal_replay_resume")
+        if not argumentos.manter:
+            with engine.begin() as conexao:
+                conexao.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    print(f"{sum(conferencias)}/{len(conferencias)} conferências")
+    return 0 if all(conferencias) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(principal())
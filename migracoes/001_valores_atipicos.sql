@@ -0,0 +1,15 @@
+-- Marcação de valores atípicos nas medições e estatísticas robustas por série (rio, parametro)
+
+ALTER TABLE coletas_parametros ADD COLUMN IF NOT EXISTS atipico BOOLEAN NOT NULL DEFAULT false;
+
+CREATE TABLE IF NOT EXISTS estatisticas_parametros (
+    rio_id          INT REFERENCES rios(id),
+    parametro_id    INT REFERENCES parametros(id),
+    n               INT NOT NULL DEFAULT 0,
+    media           FLOAT NOT NULL DEFAULT 0,
+    m2              FLOAT NOT NULL DEFAULT 0,
+    janela          FLOAT[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (rio_id, parametro_id)
+);
+
+-- Depois de aplicar, preencha as marcações do acervo com POST /analise/atipicos/recalcular
@@ -0,0 +1,16 @@
+-- IQA pré-calculado por coleta
+
+CREATE TABLE IF NOT EXISTS indices_qualidade (
+    coleta_id       INT PRIMARY KEY REFERENCES coletas(id) ON DELETE CASCADE,
+    rio_id          INT REFERENCES rios(id),
+    datas           DATE,
+    iqa             FLOAT,
+    categoria       VARCHAR,
+    cobertura       FLOAT NOT NULL,
+    componentes     JSON,
+    calculado_em    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_indices_qualidade_rio_datas ON indices_qualidade (rio_id, datas);
+
+-- Depois de aplicar, calcule o índice do acervo com POST /analise/iqa/recalcular
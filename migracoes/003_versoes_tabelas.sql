@@ -0,0 +1,11 @@
+-- Contadores de versão por tabela, usados nos ETags das rotas de leitura
+
+CREATE TABLE IF NOT EXISTS versoes_tabelas (
+    tabela          VARCHAR PRIMARY KEY,
+    versao          BIGINT NOT NULL DEFAULT 0,
+    alterado_em     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO versoes_tabelas (tabela, versao)
+VALUES ('rios', 1), ('parametros', 1), ('coletas', 1), ('coletas_parametros', 1), ('indices_qualidade', 1)
+ON CONFLICT (tabela) DO NOTHING;
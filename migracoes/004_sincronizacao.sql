@@ -0,0 +1,70 @@
+-- Rastreamento de alterações para a sincronização incremental do app (GET /sync)
+
+CREATE SEQUENCE IF NOT EXISTS seq_alteracoes;
+
+CREATE TABLE IF NOT EXISTS exclusoes (
+    seq             BIGINT PRIMARY KEY,
+    tabela          VARCHAR NOT NULL,
+    registro_id     INT NOT NULL,
+    excluido_em     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE rios ADD COLUMN IF NOT EXISTS seq_alteracao BIGINT;
+ALTER TABLE parametros ADD COLUMN IF NOT EXISTS seq_alteracao BIGINT;
+ALTER TABLE coletas ADD COLUMN IF NOT EXISTS seq_alteracao BIGINT;
+ALTER TABLE coletas_parametros ADD COLUMN IF NOT EXISTS seq_alteracao BIGINT;
+
+-- Ver FUNCOES_SINCRONIZACAO em app/models.py
+CREATE OR REPLACE FUNCTION marcar_alteracao() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('seq_alteracoes'));
+    NEW.seq_alteracao := nextval('seq_alteracoes');
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION registrar_exclusao() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('seq_alteracoes'));
+    INSERT INTO exclusoes (seq, tabela, registro_id)
+    VALUES (nextval('seq_alteracoes'), TG_TABLE_NAME, OLD.id);
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tg_rios_alteracao ON rios;
+DROP TRIGGER IF EXISTS tg_rios_exclusao ON rios;
+CREATE TRIGGER tg_rios_alteracao BEFORE INSERT OR UPDATE ON rios
+    FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+CREATE TRIGGER tg_rios_exclusao AFTER DELETE ON rios
+    FOR EACH ROW EXECUTE FUNCTION registrar_exclusao();
+
+DROP TRIGGER IF EXISTS tg_parametros_alteracao ON parametros;
+DROP TRIGGER IF EXISTS tg_parametros_exclusao ON parametros;
+CREATE TRIGGER tg_parametros_alteracao BEFORE INSERT OR UPDATE ON parametros
+    FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+CREATE TRIGGER tg_parametros_exclusao AFTER DELETE ON parametros
+    FOR EACH ROW EXECUTE FUNCTION registrar_exclusao();
+
+DROP TRIGGER IF EXISTS tg_coletas_alteracao ON coletas;
+DROP TRIGGER IF EXISTS tg_coletas_exclusao ON coletas;
+CREATE TRIGGER tg_coletas_alteracao BEFORE INSERT OR UPDATE ON coletas
+    FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+CREATE TRIGGER tg_coletas_exclusao AFTER DELETE ON coletas
+    FOR EACH ROW EXECUTE FUNCTION registrar_exclusao();
+
+DROP TRIGGER IF EXISTS tg_coletas_parametros_alteracao ON coletas_parametros;
+DROP TRIGGER IF EXISTS tg_coletas_parametros_exclusao ON coletas_parametros;
+CREATE TRIGGER tg_coletas_parametros_alteracao BEFORE INSERT OR UPDATE ON coletas_parametros
+    FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+CREATE TRIGGER tg_coletas_parametros_exclusao AFTER DELETE ON coletas_parametros
+    FOR EACH ROW EXECUTE FUNCTION registrar_exclusao();
+
+-- Numera as linhas existentes (o gatilho atribui o número em cada UPDATE)
+UPDATE rios SET seq_alteracao = NULL WHERE seq_alteracao IS NULL;
+UPDATE parametros SET seq_alteracao = NULL WHERE seq_alteracao IS NULL;
+UPDATE coletas SET seq_alteracao = NULL WHERE seq_alteracao IS NULL;
+UPDATE coletas_parametros SET seq_alteracao = NULL WHERE seq_alteracao IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_rios_seq_alteracao ON rios (seq_alteracao);
+CREATE INDEX IF NOT EXISTS ix_parametros_seq_alteracao ON parametros (seq_alteracao);
+CREATE INDEX IF NOT EXISTS ix_coletas_seq_alteracao ON coletas (seq_alteracao);
+CREATE INDEX IF NOT EXISTS ix_coletas_parametros_seq_alteracao ON coletas_parametros (seq_alteracao);
@@ -0,0 +1,22 @@
+-- Tendências (Mann-Kendall e inclinação de Sen) por rio e parametro
+
+CREATE TABLE IF NOT EXISTS tendencias (
+    rio_id          INT REFERENCES rios(id) ON DELETE CASCADE,
+    parametro_id    INT REFERENCES parametros(id) ON DELETE CASCADE,
+    dessazonalizado BOOLEAN,
+    n               INT NOT NULL,
+    inicio          DATE,
+    fim             DATE,
+    s               FLOAT,
+    variancia       FLOAT,
+    z               FLOAT,
+    p_valor         FLOAT,
+    tau             FLOAT,
+    inclinacao      FLOAT,
+    intercepto      FLOAT,
+    cursor          BIGINT NOT NULL,
+    calculado_em    TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (rio_id, parametro_id, dessazonalizado)
+);
+
+-- A tabela é preenchida em segundo plano (tendencias.atualizar, ver 013_tendencias_rios.sql)
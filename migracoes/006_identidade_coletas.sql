@@ -0,0 +1,55 @@
+-- Identidade natural das coletas e medições, para ingestão idempotente (upsert)
+-- Requer PostgreSQL 15+ (UNIQUE NULLS NOT DISTINCT)
+
+ALTER TABLE coletas ADD COLUMN IF NOT EXISTS replica SMALLINT NOT NULL DEFAULT 1;
+
+-- Coletas repetidas (mesmo código, rio, data e local) viram as réplicas 1, 2, 3...
+UPDATE coletas c SET replica = r.numero
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY codigo, rio_id, datas, locali ORDER BY id) AS numero
+    FROM coletas
+) r
+WHERE r.id = c.id AND r.numero > 1 AND c.replica = 1;
+
+-- Um parametro medido mais de uma vez na mesma coleta: cada medição extra vai para
+-- uma réplica nova da coleta, para nenhum valor ser descartado
+DO $$
+DECLARE
+    extra RECORD;
+    nova_coleta INT;
+BEGIN
+    FOR extra IN
+        SELECT coleta_id, ordem, array_agg(id) AS ids
+        FROM (
+            SELECT id, coleta_id,
+                   row_number() OVER (PARTITION BY coleta_id, parametro_id ORDER BY id) AS ordem
+            FROM coletas_parametros
+        ) d
+        WHERE ordem > 1
+        GROUP BY coleta_id, ordem
+        ORDER BY coleta_id, ordem
+    LOOP
+        INSERT INTO coletas (codigo, locali, rio_id, datas, latitude, longitude, replica)
+        SELECT c.codigo, c.locali, c.rio_id, c.datas, c.latitude, c.longitude,
+               (SELECT max(o.replica) + 1 FROM coletas o
+                WHERE o.codigo IS NOT DISTINCT FROM c.codigo AND o.rio_id IS NOT DISTINCT FROM c.rio_id
+                  AND o.datas IS NOT DISTINCT FROM c.datas AND o.locali IS NOT DISTINCT FROM c.locali)
+        FROM coletas c WHERE c.id = extra.coleta_id
+        RETURNING id INTO nova_coleta;
+
+        UPDATE coletas_parametros SET coleta_id = nova_coleta WHERE id = ANY(extra.ids);
+    END LOOP;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_coletas_identidade') THEN
+        ALTER TABLE coletas ADD CONSTRAINT uq_coletas_identidade
+            UNIQUE NULLS NOT DISTINCT (codigo, rio_id, datas, locali, replica);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_coletas_parametros_coleta_parametro') THEN
+        ALTER TABLE coletas_parametros ADD CONSTRAINT uq_coletas_parametros_coleta_parametro
+            UNIQUE (coleta_id, parametro_id);
+    END IF;
+END $$;
+
+-- Depois de aplicar, recalcule o IQA das coletas (POST /analise/iqa/recalcular)
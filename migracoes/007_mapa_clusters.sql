@@ -0,0 +1,35 @@
+-- Pirâmide de clusters dos pontos de coleta para o mapa (GET /mapa/clusters)
+
+CREATE TABLE IF NOT EXISTS mapa_rios (
+    rio_id          INT PRIMARY KEY REFERENCES rios(id) ON DELETE CASCADE,
+    cursor          BIGINT NOT NULL,
+    calculado_em    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS mapa_clusters (
+    zoom            SMALLINT,
+    x               INT,
+    y               INT,
+    rio_id          INT REFERENCES rios(id) ON DELETE CASCADE,
+    n               INT NOT NULL,
+    soma_latitude   FLOAT NOT NULL,
+    soma_longitude  FLOAT NOT NULL,
+    PRIMARY KEY (zoom, x, y, rio_id)
+);
+
+CREATE TABLE IF NOT EXISTS mapa_clusters_parametros (
+    parametro_id    INT REFERENCES parametros(id) ON DELETE CASCADE,
+    zoom            SMALLINT,
+    x               INT,
+    y               INT,
+    rio_id          INT REFERENCES rios(id) ON DELETE CASCADE,
+    n               INT NOT NULL,
+    soma            FLOAT NOT NULL,
+    PRIMARY KEY (parametro_id, zoom, x, y, rio_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_mapa_clusters_rio_id ON mapa_clusters (rio_id);
+CREATE INDEX IF NOT EXISTS ix_mapa_clusters_parametros_rio_id ON mapa_clusters_parametros (rio_id);
+
+-- As tabelas são preenchidas em segundo plano (mapa.atualizar), agendado pela ingestão
+-- ou pela primeira chamada a GET /mapa/clusters
@@ -0,0 +1,12 @@
+-- Índices usados pelas rotas analíticas (ver benchmarks/planos.py)
+
+CREATE INDEX IF NOT EXISTS ix_coletas_rio_id_datas
+    ON coletas (rio_id, datas);
+
+-- Cobertura: leituras por rio e por parâmetro saem só do índice (index-only scan)
+CREATE INDEX IF NOT EXISTS ix_coletas_parametros_coleta_valores
+    ON coletas_parametros (coleta_id) INCLUDE (parametro_id, valor, atipico);
+
+DROP INDEX IF EXISTS ix_coletas_parametros_parametro_coleta;
+CREATE INDEX ix_coletas_parametros_parametro_coleta
+    ON coletas_parametros (parametro_id, coleta_id) INCLUDE (valor, atipico);
@@ -0,0 +1,23 @@
+-- Medição mais recente de cada (rio, parametro, local), mantida pela ingestão (GET /rios/{codigo}/atual)
+
+CREATE TABLE IF NOT EXISTS ultimas_medicoes (
+    rio_id          INT REFERENCES rios(id) ON DELETE CASCADE,
+    parametro_id    INT REFERENCES parametros(id) ON DELETE CASCADE,
+    locali          VARCHAR DEFAULT '',
+    coleta_id       INT NOT NULL REFERENCES coletas(id) ON DELETE CASCADE,
+    datas           DATE,
+    valor           FLOAT NOT NULL,
+    atipico         BOOLEAN NOT NULL DEFAULT false,
+    atualizado_em   TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (rio_id, parametro_id, locali)
+);
+
+-- Carga inicial (mesma regra de ultimas.RECALCULAR_SQL)
+DELETE FROM ultimas_medicoes;
+INSERT INTO ultimas_medicoes (rio_id, parametro_id, locali, coleta_id, datas, valor, atipico)
+SELECT DISTINCT ON (c.rio_id, cp.parametro_id, coalesce(c.locali, ''))
+       c.rio_id, cp.parametro_id, coalesce(c.locali, ''), c.id, c.datas, cp.valor, cp.atipico
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id
+WHERE c.rio_id IS NOT NULL
+ORDER BY c.rio_id, cp.parametro_id, coalesce(c.locali, ''), c.datas DESC NULLS LAST, c.id DESC;
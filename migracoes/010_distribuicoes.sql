@@ -0,0 +1,34 @@
+-- Esboços de quantis por (rio, parametro, mês), mantidos pela ingestão (GET /analise/distribuicao).
+-- As chaves dos baldes seguem distribuicoes.py (PRECISAO = 0.01, DESLOCAMENTO = 4000).
+
+CREATE TABLE IF NOT EXISTS distribuicoes (
+    parametro_id    INT REFERENCES parametros(id) ON DELETE CASCADE,
+    rio_id          INT REFERENCES rios(id) ON DELETE CASCADE,
+    mes             DATE,
+    atipico         BOOLEAN,
+    n               INT NOT NULL,
+    soma            FLOAT NOT NULL,
+    minimo          FLOAT NOT NULL,
+    maximo          FLOAT NOT NULL,
+    baldes          INT[] NOT NULL,
+    contagens       INT[] NOT NULL,
+    PRIMARY KEY (parametro_id, rio_id, mes, atipico)
+);
+
+-- Carga inicial (mesma regra de distribuicoes.recalcular)
+DELETE FROM distribuicoes;
+INSERT INTO distribuicoes (rio_id, parametro_id, mes, atipico, n, soma, minimo, maximo, baldes, contagens)
+SELECT rio_id, parametro_id, mes, atipico, sum(n)::int, sum(soma), min(minimo), max(maximo),
+       array_agg(balde ORDER BY balde), array_agg(n ORDER BY balde)
+FROM (
+    SELECT c.rio_id, cp.parametro_id, date_trunc('month', c.datas)::date AS mes,
+           coalesce(cp.atipico, false) AS atipico,
+           CASE WHEN abs(cp.valor) < 1e-09 THEN 0
+                ELSE sign(cp.valor)::int * (ceil(ln(abs(cp.valor)) / ln(1.01 / 0.99))::int + 4000) END AS balde,
+           count(*)::int AS n, sum(cp.valor) AS soma, min(cp.valor) AS minimo, max(cp.valor) AS maximo
+    FROM coletas_parametros cp
+    JOIN coletas c ON c.id = cp.coleta_id
+    WHERE c.rio_id IS NOT NULL AND c.datas IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+) por_balde
+GROUP BY rio_id, parametro_id, mes, atipico;
@@ -0,0 +1,109 @@
+-- coletas_parametros passa a ser particionada por HASH(rio_id) em 16 partições, com
+-- rio_id e datas copiados da coleta em cada medição (ver models.ColetaParametro).
+-- As consultas de um rio filtram por coletas_parametros.rio_id e leem só a partição
+-- dele; vacuum e manutenção de índices passam a ser feitos por partição.
+--
+-- Roda em uma transação só e bloqueia a tabela durante a cópia. Os ids, os números de
+-- alteração (seq_alteracao) e a sequência dos ids são preservados, então clientes do
+-- GET /sync e snapshots já baixados continuam válidos.
+
+BEGIN;
+
+LOCK TABLE coletas_parametros IN ACCESS EXCLUSIVE MODE;
+
+CREATE TABLE coletas_parametros_particionada (
+    id              INTEGER NOT NULL DEFAULT nextval('coletas_parametros_id_seq'),
+    rio_id          INTEGER NOT NULL,
+    parametro_id    INTEGER,
+    coleta_id       INTEGER,
+    datas           DATE,
+    valor           DOUBLE PRECISION NOT NULL,
+    atipico         BOOLEAN NOT NULL DEFAULT false,
+    seq_alteracao   BIGINT
+) PARTITION BY HASH (rio_id);
+
+DO $$ BEGIN
+    FOR resto IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE coletas_parametros_p%s PARTITION OF coletas_parametros_particionada '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %s)', resto, resto
+        );
+    END LOOP;
+END $$;
+
+-- Toda medição precisa de um rio (chave de partição): medições sem coleta, de coletas
+-- que não existem ou de coletas sem rio não teriam onde ficar. Em vez de perdê-las na
+-- cópia, a migração para e diz quantas são; corrija ou exclua essas linhas e rode de novo.
+DO $$
+DECLARE
+    sem_coleta INT;
+    coleta_inexistente INT;
+    coleta_sem_rio INT;
+BEGIN
+    SELECT count(*) FILTER (WHERE cp.coleta_id IS NULL),
+           count(*) FILTER (WHERE cp.coleta_id IS NOT NULL AND c.id IS NULL),
+           count(*) FILTER (WHERE c.id IS NOT NULL AND c.rio_id IS NULL)
+    INTO sem_coleta, coleta_inexistente, coleta_sem_rio
+    FROM coletas_parametros cp
+    LEFT JOIN coletas c ON c.id = cp.coleta_id;
+
+    IF sem_coleta + coleta_inexistente + coleta_sem_rio > 0 THEN
+        RAISE EXCEPTION 'Medições sem rio não podem ser particionadas: % sem coleta_id, '
+                        '% com coleta_id inexistente, % de coletas sem rio_id. Nada foi alterado.',
+                        sem_coleta, coleta_inexistente, coleta_sem_rio
+            USING HINT = 'Liste-as com: SELECT cp.* FROM coletas_parametros cp '
+                         'LEFT JOIN coletas c ON c.id = cp.coleta_id WHERE c.rio_id IS NULL';
+    END IF;
+END $$;
+
+-- Sem gatilhos na tabela nova: a cópia mantém os seq_alteracao originais
+INSERT INTO coletas_parametros_particionada
+    (id, rio_id, parametro_id, coleta_id, datas, valor, atipico, seq_alteracao)
+SELECT cp.id, c.rio_id, cp.parametro_id, cp.coleta_id, c.datas, cp.valor, cp.atipico, cp.seq_alteracao
+FROM coletas_parametros cp
+JOIN coletas c ON c.id = cp.coleta_id;
+
+-- A sequência dos ids pertence à tabela antiga e seria excluída junto com ela
+ALTER SEQUENCE coletas_parametros_id_seq OWNED BY NONE;
+DROP TABLE coletas_parametros;
+ALTER TABLE coletas_parametros_particionada RENAME TO coletas_parametros;
+ALTER SEQUENCE coletas_parametros_id_seq OWNED BY coletas_parametros.id;
+
+-- Restrições e índices criados depois da carga (mais rápido que mantê-los durante a cópia)
+ALTER TABLE coletas_parametros ADD CONSTRAINT coletas_parametros_pkey PRIMARY KEY (rio_id, id);
+ALTER TABLE coletas_parametros ADD CONSTRAINT uq_coletas_parametros_coleta_parametro
+    UNIQUE (rio_id, coleta_id, parametro_id);
+ALTER TABLE coletas_parametros ADD CONSTRAINT coletas_parametros_rio_id_fkey
+    FOREIGN KEY (rio_id) REFERENCES rios(id);
+ALTER TABLE coletas_parametros ADD CONSTRAINT coletas_parametros_coleta_id_fkey
+    FOREIGN KEY (coleta_id) REFERENCES coletas(id);
+ALTER TABLE coletas_parametros ADD CONSTRAINT coletas_parametros_parametro_id_fkey
+    FOREIGN KEY (parametro_id) REFERENCES parametros(id);
+
+CREATE INDEX ix_coletas_parametros_id ON coletas_parametros (id);
+CREATE INDEX ix_coletas_parametros_seq_alteracao ON coletas_parametros (seq_alteracao);
+CREATE INDEX ix_coletas_parametros_coleta_valores
+    ON coletas_parametros (coleta_id) INCLUDE (parametro_id, valor, atipico);
+CREATE INDEX ix_coletas_parametros_parametro_coleta
+    ON coletas_parametros (parametro_id, coleta_id) INCLUDE (valor, atipico);
+CREATE INDEX ix_coletas_parametros_rio_parametro_datas
+    ON coletas_parametros (rio_id, parametro_id, datas) INCLUDE (valor, atipico);
+
+-- Gatilhos de sincronização (models.GATILHOS_SINCRONIZACAO); valem para todas as partições.
+-- Na partição, TG_TABLE_NAME seria coletas_parametros_pN: o nome lógico vai no argumento.
+CREATE OR REPLACE FUNCTION registrar_exclusao() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('seq_alteracoes'));
+    INSERT INTO exclusoes (seq, tabela, registro_id)
+    VALUES (nextval('seq_alteracoes'), coalesce(TG_ARGV[0], TG_TABLE_NAME), OLD.id);
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tg_coletas_parametros_alteracao BEFORE INSERT OR UPDATE ON coletas_parametros
+    FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+CREATE TRIGGER tg_coletas_parametros_exclusao AFTER DELETE ON coletas_parametros
+    FOR EACH ROW EXECUTE FUNCTION registrar_exclusao('coletas_parametros');
+
+COMMIT;
+
+ANALYZE coletas_parametros;
@@ -0,0 +1,37 @@
+-- Armazenamento compacto das medições (compactas.py, ARMAZENAMENTO_COMPACTO): uma linha
+-- por coleta, com os valores num bloco binário na ordem de ordens_parametros.
+-- As tabelas são criadas vazias; a carga é feita em Python, com os formatos de
+-- compactas.codificar:
+--     cd app && python gerenciar.py compactar
+
+CREATE TABLE IF NOT EXISTS ordens_parametros (
+    id              SERIAL PRIMARY KEY,
+    parametros      INT[] NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS coletas_compactas (
+    rio_id          INT NOT NULL REFERENCES rios(id),
+    coleta_id       INT NOT NULL REFERENCES coletas(id) ON DELETE CASCADE,
+    datas           DATE,
+    ordem_id        INT NOT NULL REFERENCES ordens_parametros(id),
+    valores         BYTEA NOT NULL,
+    atipicos        BYTEA,
+    PRIMARY KEY (rio_id, coleta_id)
+) PARTITION BY HASH (rio_id);
+
+DO $$ BEGIN
+    FOR resto IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS coletas_compactas_p%s PARTITION OF coletas_compactas '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %s)', resto, resto
+        );
+    END LOOP;
+END $$;
+
+-- Linha única: completa só depois do gerenciar.py compactar, e desmarcada por gravações
+-- feitas com ARMAZENAMENTO_COMPACTO desligado (ver compactas.em_uso)
+CREATE TABLE IF NOT EXISTS estado_compactas (
+    id              INT PRIMARY KEY,
+    completa        BOOLEAN NOT NULL DEFAULT false,
+    compactada_em   TIMESTAMPTZ
+);
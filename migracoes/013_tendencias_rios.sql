@@ -0,0 +1,13 @@
+-- Cursor por rio das tendências (como mapa_rios): GET /analise/tendencias só compara
+-- cursores, e o recálculo roda em segundo plano depois da ingestão (tendencias.atualizar)
+
+CREATE TABLE IF NOT EXISTS tendencias_rios (
+    rio_id          INT PRIMARY KEY REFERENCES rios(id) ON DELETE CASCADE,
+    cursor          BIGINT NOT NULL,
+    calculado_em    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Rios que já têm tendências partem do menor cursor das suas séries
+INSERT INTO tendencias_rios (rio_id, cursor)
+SELECT rio_id, min(cursor) FROM tendencias GROUP BY rio_id
+ON CONFLICT (rio_id) DO NOTHING;
@@ -0,0 +1,47 @@
+-- Números de alteração sem a trava consultiva global (ver FUNCOES_SINCRONIZACAO em
+-- app/models.py). Antes, pg_advisory_xact_lock(hashtext('seq_alteracoes')) era
+-- mantida da primeira linha gravada até o commit e serializava todas as escritas
+-- nas tabelas sincronizadas. Agora cada transação só registra uma trava
+-- compartilhada, e os leitores incrementais param no horizonte_alteracoes().
+-- Os gatilhos continuam os mesmos; só as funções mudam.
+
+CREATE OR REPLACE FUNCTION registrar_transacao_alteracao() RETURNS void AS $$
+BEGIN
+    IF current_setting('alteracoes.registrada', true) IS DISTINCT FROM 'sim' THEN
+        PERFORM pg_advisory_xact_lock_shared(4611686018427387904 + (
+            SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM seq_alteracoes
+        ));
+        PERFORM set_config('alteracoes.registrada', 'sim', true);
+    END IF;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_alteracao() RETURNS trigger AS $$
+BEGIN
+    PERFORM registrar_transacao_alteracao();
+    NEW.seq_alteracao := nextval('seq_alteracoes');
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+-- Em tabelas particionadas o gatilho roda na partição: o nome lógico vem no argumento
+CREATE OR REPLACE FUNCTION registrar_exclusao() RETURNS trigger AS $$
+BEGIN
+    PERFORM registrar_transacao_alteracao();
+    INSERT INTO exclusoes (seq, tabela, registro_id)
+    VALUES (nextval('seq_alteracoes'), coalesce(TG_ARGV[0], TG_TABLE_NAME), OLD.id);
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+-- A sequência é lida antes das travas: um número que ela já tinha dado pertence a
+-- uma transação confirmada ou a uma que já registrou a trava
+CREATE OR REPLACE FUNCTION horizonte_alteracoes() RETURNS bigint AS $$
+DECLARE
+    ultimo bigint;
+    aberta bigint;
+BEGIN
+    SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END INTO ultimo FROM seq_alteracoes;
+    SELECT min(((classid::bigint << 32) | objid::bigint) - 4611686018427387904) INTO aberta
+    FROM pg_locks
+    WHERE locktype = 'advisory' AND objsubid = 1 AND classid::bigint >= 1073741824
+      AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+    RETURN least(ultimo, aberta);
+END $$ LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1,22 @@
+-- Versões das tabelas (ETags) lidas da sequência seq_alteracoes (ver app/versoes.py).
+-- Antes, todo commit fazia upsert nas mesmas linhas de versoes_tabelas, e as
+-- transações que gravavam a mesma tabela esperavam umas pelas outras até o commit.
+
+-- indices_qualidade passa a ser numerada, só para ter versão; não vai para o /sync
+ALTER TABLE indices_qualidade ADD COLUMN IF NOT EXISTS seq_alteracao BIGINT;
+CREATE INDEX IF NOT EXISTS ix_indices_qualidade_seq_alteracao ON indices_qualidade (seq_alteracao);
+
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'tg_indices_qualidade_alteracao' AND tgrelid = 'indices_qualidade'::regclass
+    ) THEN
+        CREATE TRIGGER tg_indices_qualidade_alteracao BEFORE INSERT OR UPDATE ON indices_qualidade
+            FOR EACH ROW EXECUTE FUNCTION marcar_alteracao();
+    END IF;
+END $$;
+
+-- Maior exclusão de cada tabela sem varrer as lápides
+CREATE INDEX IF NOT EXISTS ix_exclusoes_tabela_seq ON exclusoes (tabela, seq);
+
+DROP TABLE IF EXISTS versoes_tabelas;